@@ -1,14 +1,30 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
+import asyncio
 import json
 import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, nullcontext
+from datetime import datetime, timezone
 import dotenv
 from pathlib import Path
 import psycopg
+from psycopg_pool import AsyncConnectionPool
 import numpy as np
-from product_embedding import product
+import orjson
+from http_cache import DataVersion, add_compression, is_not_modified, not_modified, version_at, with_cache_headers
+from json_response import RawJSON, json_response, keyed_json_response
+from product_embedding import (
+    product, get_embeddings_async, embeddings_changed_payload, format_vector,
+    EMBEDDING_DIMENSIONS, EMBEDDING_MODEL, EMBEDDINGS_CHANGED_CHANNEL,
+)
+from product_summary import SUMMARY_FIELDS, DERIVED_FIELDS, product_name, product_summary
+from text_index import TrigramIndex, normalize
+from vector_index import VectorIndex
 
 # Load .env from project root (parent directory)
 env_path = Path(__file__).parent.parent / ".env"
@@ -24,10 +40,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
+add_compression(app)
 
-# Database connection
-db_conn = None  # Global connection variable
+# Database connection pool
+db_pool = None  # Global async connection pool, created on first use
+db_pool_lock = asyncio.Lock()
+db_pool_check_task = None
+embeddings_listener_task = None
+db_retry_after = 0.0  # time.monotonic() before which no new connection attempt is made
 db_name = os.getenv("DB_NAME")
 db_password = os.getenv("DB_PASSWORD")
 
@@ -37,25 +59,16 @@ if db_name:
 if db_password:
     db_password = db_password.strip('"\'')
 
-def get_db_connection():
-    """Get or recreate database connection"""
-    global db_conn
-    
-    if not db_name:
-        return None
-    
-    # Check if connection exists and is still open
-    if db_conn is not None:
-        try:
-            # Try a simple query to check if connection is alive
-            with db_conn.cursor() as cur:
-                cur.execute("SELECT 1")
-            return db_conn
-        except Exception:
-            # Connection is closed, set to None to reconnect
-            db_conn = None
-    
-    # Try to establish new connection
+# Pool configuration
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))  # Max seconds to wait for a free connection
+DB_POOL_CHECK = os.getenv("DB_POOL_CHECK", "background")  # "checkout" or "background"
+DB_POOL_CHECK_INTERVAL = float(os.getenv("DB_POOL_CHECK_INTERVAL", "30"))  # Seconds between background checks
+DB_RETRY_INTERVAL = float(os.getenv("DB_RETRY_INTERVAL", "10"))  # Seconds on the JSON fallback after a failed connection attempt
+
+async def get_connection_string() -> Optional[str]:
+    """Find a connection string that works with the local PostgreSQL setup"""
     connection_methods = []
     
     # Method 1: Password authentication
@@ -70,9 +83,10 @@ def get_db_connection():
     
     for method_name, conn_string in connection_methods:
         try:
-            db_conn = psycopg.connect(conn_string, autocommit=True)
+            conn = await psycopg.AsyncConnection.connect(conn_string, connect_timeout=5)
+            await conn.close()
             print(f"Database connection successful ({method_name}): {db_name}")
-            return db_conn
+            return conn_string
         except Exception as e:
             print(f"Connection method '{method_name}' failed: {e}")
             continue
@@ -80,65 +94,700 @@ def get_db_connection():
     print("WARNING: All database connection methods failed.")
     return None
 
-# Initial connection attempt
-if not db_name:
-    print("WARNING: DB_NAME not set. Database features will not work.")
-    db_conn = None
-else:
-    db_conn = get_db_connection()
-    if not db_conn:
+async def check_db_pool_periodically():
+    """Background health check: drop broken idle connections from the pool"""
+    while db_pool is not None and not db_pool.closed:
+        await asyncio.sleep(DB_POOL_CHECK_INTERVAL)
+        try:
+            await db_pool.check()
+        except Exception as e:
+            print(f"Connection pool check failed: {e}")
+
+async def get_db_pool() -> Optional[AsyncConnectionPool]:
+    """
+    Get or create the database connection pool. After a failed attempt
+    (each connection method can take connect_timeout), requests go straight
+    to the JSON fallback for DB_RETRY_INTERVAL instead of queueing behind
+    another attempt.
+    """
+    global db_pool, db_pool_check_task, embeddings_listener_task, db_retry_after
+    
+    if not db_name:
+        return None
+    
+    if db_pool is not None:
+        return db_pool
+    if time.monotonic() < db_retry_after:
+        return None
+    
+    async with db_pool_lock:
+        if db_pool is not None:
+            return db_pool
+        if time.monotonic() < db_retry_after:
+            return None
+        
+        conn_string = await get_connection_string()
+        if not conn_string:
+            db_retry_after = time.monotonic() + DB_RETRY_INTERVAL
+            return None
+        
+        pool = AsyncConnectionPool(
+            conn_string,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=max(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE),
+            timeout=DB_POOL_TIMEOUT,
+            kwargs={"autocommit": True},
+            # Either validate every connection as it is handed out, or rely on
+            # the periodic background check below (no extra round trip per query)
+            check=AsyncConnectionPool.check_connection if DB_POOL_CHECK == "checkout" else None,
+            name="product-api",
+            open=False,
+        )
+        await pool.open()
+        db_pool = pool
+        print(f"Connection pool opened (min={db_pool.min_size}, max={db_pool.max_size}, check={DB_POOL_CHECK})")
+        
+        if DB_POOL_CHECK == "background":
+            db_pool_check_task = asyncio.create_task(check_db_pool_periodically())
+        embeddings_listener_task = asyncio.create_task(listen_for_embedding_changes(pool.conninfo))
+    
+    return db_pool
+
+@asynccontextmanager
+async def db_connection():
+    """Borrow a connection from the pool; yields None if the database is unavailable"""
+    pool = await get_db_pool()
+    if pool is None:
+        yield None
+        return
+    async with pool.connection() as conn:
+        yield conn
+
+async def query_db(query: str, params: tuple = (), settings: Optional[dict] = None) -> Optional[list]:
+    """
+    Run a query on a pooled connection and return all rows, or None if the
+    database is unavailable. settings (name -> value) apply to this query
+    only: they are set locally in a transaction around it.
+    """
+    async with db_connection() as conn:
+        if not conn:
+            return None
+        async with conn.transaction() if settings else nullcontext():
+            async with conn.cursor() as cur:
+                for name, value in (settings or {}).items():
+                    await cur.execute("SELECT set_config(%s, %s, true)", (name, str(value)))
+                await cur.execute(query, params)
+                return await cur.fetchall() if cur.description else []
+
+@app.on_event("startup")
+async def open_db_pool():
+    """Initial connection attempt"""
+    if not db_name:
+        print("WARNING: DB_NAME not set. Database features will not work.")
+    elif not await get_db_pool():
         print("API will use JSON fallback for product data.")
 
+@app.on_event("shutdown")
+async def close_db_pool():
+    """Return all pooled connections to the server on shutdown"""
+    if db_pool_check_task is not None:
+        db_pool_check_task.cancel()
+    if embeddings_listener_task is not None:
+        embeddings_listener_task.cancel()
+    if db_pool is not None:
+        await db_pool.close()
+
 # Fallback: Load product data from JSON only when needed (for product_data field)
 product_data_path = Path(__file__).parent / "valio_aimo_product_data_junction_2025.json"
 product_data_cache = None
+product_gtin_index = {}  # GTIN (salesUnitGtin, synkkaData.gtin or gtin) -> product
+product_list_index = []  # (gtin, name, product) for every product with a GTIN, in GTIN order like the table
+product_gtin_keys = np.empty(0, dtype=np.int64)  # Numeric GTIN of each product_list_index entry (-1 if not numeric)
+product_filter_index = {}  # Filter (PRODUCT_FILTER_COLUMNS) -> value -> product_list_index positions, ascending
+product_name_index = None  # Trigram index over every name of product_list_index entries
+product_json_cache = {}  # GTIN -> encoded product, for JSON catalog responses
+product_data_lock = threading.Lock()
+
+def get_product_gtin(prod: dict) -> Optional[str]:
+    """Primary GTIN of a catalog product: salesUnitGtin, then Synkka GTIN, then gtin"""
+    synkka = prod.get("synkkaData", {})
+    gtin = (
+        prod.get("salesUnitGtin") or 
+        synkka.get("gtin") or 
+        prod.get("gtin")
+    )
+    return str(gtin) if gtin else None
+
+def gtin_key(gtin: str) -> int:
+    """Numeric GTIN, the order of the products table (-1 sorts non-numeric GTINs first)"""
+    return int(gtin) if gtin.isdigit() else -1
+
+def build_product_indexes(products: list):
+    """Build the GTIN lookup and list indexes for the JSON catalog"""
+    gtin_index = {}
+    list_index = []
+    for prod in products:
+        synkka = prod.get("synkkaData", {})
+        # Index every GTIN field; the first product in file order wins, which
+        # matches what a linear scan would return
+        for gtin in (prod.get("salesUnitGtin"), synkka.get("gtin"), prod.get("gtin")):
+            if gtin:
+                gtin_index.setdefault(str(gtin), prod)
+        
+        gtin = get_product_gtin(prod)
+        if gtin:
+            list_index.append((gtin, product_name(prod), prod))
+    list_index.sort(key=lambda entry: gtin_key(entry[0]))
+    return gtin_index, list_index
+
+def build_filter_index(list_index: list) -> dict:
+    """Positions of the products with each value of each /products filter"""
+    filter_positions = {name: {} for name in PRODUCT_FILTER_COLUMNS}
+    for position, (_, _, prod) in enumerate(list_index):
+        summary = product_summary(prod)
+        for name, column in PRODUCT_FILTER_COLUMNS.items():
+            if summary[column] is not None:
+                filter_positions[name].setdefault(summary[column], []).append(position)
+    return {
+        name: {value: np.array(positions, dtype=np.int64) for value, positions in values.items()}
+        for name, values in filter_positions.items()
+    }
 
 def load_product_data():
     """Lazy load product data only when needed for full product_data"""
-    global product_data_cache
+    global product_data_cache, product_gtin_index, product_list_index, product_name_index
+    global product_gtin_keys, product_filter_index
     if product_data_cache is None:
-        print("Loading product data from JSON (fallback)...")
-        try:
-            with product_data_path.open("r", encoding="utf-8") as f:
-                product_data_cache = json.load(f)
-            print(f"Loaded {len(product_data_cache)} products")
-        except Exception as e:
-            print(f"Warning: Could not load product data from JSON: {e}")
-            product_data_cache = []
+        with product_data_lock:
+            if product_data_cache is not None:
+                return product_data_cache
+            print("Loading product data from JSON (fallback)...")
+            try:
+                with product_data_path.open("r", encoding="utf-8") as f:
+                    products = json.load(f)
+                print(f"Loaded {len(products)} products")
+            except Exception as e:
+                print(f"Warning: Could not load product data from JSON: {e}")
+                products = []
+            product_gtin_index, product_list_index = build_product_indexes(products)
+            product_gtin_keys = np.array([gtin_key(gtin) for gtin, _, _ in product_list_index], dtype=np.int64)
+            product_filter_index = build_filter_index(product_list_index)
+            product_name_index = TrigramIndex([
+                [name_obj.get("value", "") for name_obj in prod.get("synkkaData", {}).get("names", [])]
+                for _, _, prod in product_list_index
+            ])
+            product_data_cache = products
     return product_data_cache
 
-def get_product_by_gtin_from_json(gtin: str) -> Optional[dict]:
+def product_json(gtin: str, prod: dict) -> RawJSON:
+    """A JSON catalog product, encoded the first time it is returned"""
+    encoded = product_json_cache.get(gtin)
+    if encoded is None:
+        encoded = product_json_cache[gtin] = RawJSON(orjson.dumps(prod))
+    return encoded
+
+async def ensure_product_data():
+    """Load the JSON catalog off the event loop the first time it is needed"""
+    if product_data_cache is None:
+        await asyncio.to_thread(load_product_data)
+
+# Catalog version for conditional GETs (http_cache.py): the load time that
+# populate_products_table.py records in products_version, or the JSON
+# catalog file's modification time when the database is unavailable.
+# Re-read at most every CATALOG_VERSION_TTL seconds.
+CATALOG_VERSION_TTL = float(os.getenv("CATALOG_VERSION_TTL", "5"))
+catalog_version = (None, None)  # (DataVersion or None, time.monotonic() it was read)
+
+async def get_catalog_version() -> Optional[DataVersion]:
+    """Version of the catalog the product endpoints serve, or None if it is unknown"""
+    global catalog_version
+    version, checked_at = catalog_version
+    if checked_at is not None and time.monotonic() - checked_at < CATALOG_VERSION_TTL:
+        return version
+    
+    version = None
+    try:
+        results = await query_db("SELECT loaded_at FROM products_version")
+        if results:
+            version = version_at("db", results[0][0])
+        elif results is None:
+            stat = product_data_path.stat()
+            version = version_at("json", datetime.fromtimestamp(stat.st_mtime, timezone.utc))
+    except Exception as e:
+        # No products_version yet (create_products_table.sql not re-run): no conditional GETs
+        print(f"Could not read the catalog version: {e}")
+    catalog_version = (version, time.monotonic())
+    return version
+
+async def get_product_by_gtin_from_json(gtin: str) -> Optional[dict]:
     """Find product by GTIN in JSON data (fallback)"""
-    products = load_product_data()
-    for prod in products:
-        synkka = prod.get("synkkaData", {})
-        if (prod.get("salesUnitGtin") == gtin or 
-            synkka.get("gtin") == gtin or 
-            prod.get("gtin") == gtin):
-            return prod
-    return None
+    await ensure_product_data()
+    return product_gtin_index.get(str(gtin))
 
-def get_product_by_gtin_from_db(gtin: str) -> Optional[dict]:
+async def get_product_by_gtin_from_db(gtin: str) -> Optional[dict]:
     """Get product from database"""
-    conn = get_db_connection()
-    if not conn:
-        return None
     try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT product_data FROM products WHERE gtin = %s", (gtin,))
-            result = cur.fetchone()
-            if result:
-                return json.loads(result[0])
+        results = await query_db("SELECT product_data FROM products WHERE gtin = %s", (gtin,))
+        if results:
+            product_data_json = results[0][0]
+            return json.loads(product_data_json) if isinstance(product_data_json, str) else product_data_json
     except Exception:
         return None
     return None
 
-def get_product_by_gtin(gtin: str) -> Optional[dict]:
+async def get_product_by_gtin(gtin: str) -> Optional[dict]:
     """Get product by GTIN, try database first, then JSON fallback"""
-    prod = get_product_by_gtin_from_db(gtin)
+    prod = await get_product_by_gtin_from_db(gtin)
     if prod:
         return prod
-    return get_product_by_gtin_from_json(gtin)
+    return await get_product_by_gtin_from_json(gtin)
+
+# Embeddings for products, keyed by GTIN. Holds both rows read from the
+# embeddings table and embeddings computed on demand, most recently used last.
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2000"))
+embedding_cache = OrderedDict()
+embedding_inflight = {}  # GTIN -> asyncio.Future for embeddings currently being computed
+embedding_own_writes = set()  # Numeric GTINs this worker wrote, until their change notification arrives
+embedding_cache_lock = threading.Lock()
+
+def get_cached_embedding(gtin: str):
+    """Look up an embedding in the LRU cache"""
+    with embedding_cache_lock:
+        embedding = embedding_cache.get(gtin)
+        if embedding is not None:
+            embedding_cache.move_to_end(gtin)
+        return embedding
+
+def cache_embedding(gtin: str, embedding) -> None:
+    """Add an embedding to the LRU cache, evicting the least recently used"""
+    with embedding_cache_lock:
+        embedding_cache[gtin] = embedding
+        embedding_cache.move_to_end(gtin)
+        while len(embedding_cache) > EMBEDDING_CACHE_SIZE:
+            embedding_cache.popitem(last=False)
+
+async def compute_embedding(gtin: str, prod: dict) -> Optional[list]:
+    """
+    Compute a missing embedding with the remote model and persist it.
+    Concurrent requests for the same GTIN share one in-flight computation.
+    """
+    future = embedding_inflight.get(gtin)
+    if future is not None:
+        return await asyncio.shield(future)
+    
+    future = asyncio.get_running_loop().create_future()
+    embedding_inflight[gtin] = future
+    
+    embedding_list = None
+    try:
+        embedding = await product(prod).get_embedding_async()
+        embedding_list = embedding.tolist()
+        cache_embedding(gtin, embedding_list)
+        # Write back so later requests (and restarts) find it in the table
+        try:
+            await query_db("""
+                INSERT INTO embeddings (gtin, embedding)
+                VALUES (%s, %s::vector)
+                ON CONFLICT (gtin) DO UPDATE
+                    SET embedding = EXCLUDED.embedding
+            """, (gtin, embedding_list))
+            # The cached embedding is the one just written; the notification must not drop it
+            embedding_own_writes.add(int(gtin))
+            await query_db("SELECT pg_notify(%s, %s)", (EMBEDDINGS_CHANGED_CHANNEL, embeddings_changed_payload([gtin])))
+        except Exception as e:
+            print(f"Warning: Could not store embedding for {gtin}: {e}")
+    except Exception as e:
+        print(f"Warning: Could not create embedding for {gtin}: {e}")
+    finally:
+        embedding_inflight.pop(gtin, None)
+        future.set_result(embedding_list)
+    
+    return embedding_list
+
+async def stored_embeddings(gtins: list) -> dict:
+    """
+    Input GTIN -> embedding for the GTINs the embeddings table has, with one
+    query. The in-process index can lag behind the table (its reload is
+    debounced, and a snapshot can be old), so it is checked before an
+    embedding is computed, and paid for, again.
+    """
+    keys = gtin_keys(gtins)
+    if not keys:
+        return {}
+    try:
+        results = await query_db("SELECT gtin, embedding FROM embeddings WHERE gtin = ANY(%s)", (list(keys),))
+    except Exception as e:
+        print(f"Error querying embeddings: {e}")
+        return {}
+    stored = {}
+    for gtin, embedding in results or []:
+        for input_gtin in keys[gtin]:
+            cache_embedding(input_gtin, embedding)
+            stored[input_gtin] = embedding
+    return stored
+
+# Embeddings of /search query texts, keyed by normalized query. The in-memory
+# LRU sits in front of the query_embeddings table, which keeps them across
+# restarts and workers. Every QUERY_EMBEDDING_PRUNE_EVERY new rows, the table
+# is pruned back to the same size, dropping the least recently used queries.
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "10000"))
+QUERY_EMBEDDING_PRUNE_EVERY = 100  # New rows between prunes of the table
+QUERY_EMBEDDING_MODEL = f"{EMBEDDING_MODEL}/{EMBEDDING_DIMENSIONS}"
+query_embedding_cache = OrderedDict()  # Normalized query -> embedding
+query_embedding_stats = {"hits": 0, "table_hits": 0, "misses": 0}
+query_embedding_inserts = 0
+query_embedding_table_ok = True  # Cleared (and warned about once) if the table is unusable
+
+def remember_query_embedding(query: str, embedding: list) -> None:
+    query_embedding_cache[query] = embedding
+    query_embedding_cache.move_to_end(query)
+    while len(query_embedding_cache) > QUERY_EMBEDDING_CACHE_SIZE:
+        query_embedding_cache.popitem(last=False)
+
+def query_embedding_table_failed(e: Exception) -> None:
+    global query_embedding_table_ok
+    if query_embedding_table_ok:
+        print(f"Warning: query_embeddings table unavailable, caching query embeddings in memory only: {e}")
+        query_embedding_table_ok = False
+
+async def get_query_embedding(query: str) -> Optional[list]:
+    """Embedding of a normalized search query: memory, then the table, then the remote model"""
+    global query_embedding_inserts
+    embedding = query_embedding_cache.get(query)
+    if embedding is not None:
+        query_embedding_cache.move_to_end(query)
+        query_embedding_stats["hits"] += 1
+        return embedding
+    
+    rows = None
+    if query_embedding_table_ok:
+        try:
+            rows = await query_db("""
+                UPDATE query_embeddings SET used_at = now()
+                WHERE model = %s AND query = %s
+                RETURNING embedding::text
+            """, (QUERY_EMBEDDING_MODEL, query))
+        except Exception as e:
+            query_embedding_table_failed(e)
+    if rows:
+        embedding = json.loads(rows[0][0])
+        query_embedding_stats["table_hits"] += 1
+        remember_query_embedding(query, embedding)
+        return embedding
+    
+    query_embedding_stats["misses"] += 1
+    try:
+        embedding = (await get_embeddings_async([query]))[0].tolist()
+    except Exception as e:
+        print(f"Warning: Could not embed search query: {e}")
+        return None
+    remember_query_embedding(query, embedding)
+    
+    if query_embedding_table_ok:
+        try:
+            await query_db("""
+                INSERT INTO query_embeddings (model, query, embedding)
+                VALUES (%s, %s, %s::vector)
+                ON CONFLICT (model, query) DO UPDATE
+                    SET embedding = EXCLUDED.embedding, used_at = now()
+            """, (QUERY_EMBEDDING_MODEL, query, embedding))
+            query_embedding_inserts += 1
+            if query_embedding_inserts % QUERY_EMBEDDING_PRUNE_EVERY == 0:
+                await query_db("""
+                    DELETE FROM query_embeddings
+                    WHERE (model, query) IN (
+                        SELECT model, query FROM query_embeddings
+                        ORDER BY used_at DESC
+                        OFFSET %s
+                    )
+                """, (QUERY_EMBEDDING_CACHE_SIZE,))
+        except Exception as e:
+            query_embedding_table_failed(e)
+    return embedding
+
+# Similar-product results, keyed by GTIN. Each entry holds the result for the
+# largest limit requested so far, and smaller limits are served by slicing it.
+# Any change to the embedding set bumps embeddings_version; a change to known
+# GTINs evicts only the results it can affect, any other change drops the cache.
+SIMILAR_CACHE_SIZE = int(os.getenv("SIMILAR_CACHE_SIZE", "1000"))
+similar_cache = OrderedDict()  # (GTIN, response fields) -> (limit, results)
+similar_cache_stats = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+embeddings_version = 0
+
+def get_cached_similar(key: tuple, limit: int):
+    """Cached similar products for a (GTIN, fields) key if a result for at least this limit is cached"""
+    entry = similar_cache.get(key)
+    if entry is None or entry[0] < limit:
+        similar_cache_stats["misses"] += 1
+        return None
+    similar_cache.move_to_end(key)
+    similar_cache_stats["hits"] += 1
+    return entry[1][:limit]
+
+def cache_similar(key: tuple, limit: int, results: list, version: int) -> None:
+    """Store a result unless the embeddings changed while it was being computed"""
+    if version != embeddings_version:
+        return
+    entry = similar_cache.get(key)
+    if entry is not None and entry[0] > limit:
+        return
+    similar_cache[key] = (limit, results)
+    similar_cache.move_to_end(key)
+    while len(similar_cache) > SIMILAR_CACHE_SIZE:
+        similar_cache.popitem(last=False)
+
+def bump_embeddings_version() -> None:
+    """The embedding set changed: drop everything derived from it"""
+    global embeddings_version, vector_index_changes
+    embeddings_version += 1
+    vector_index_changes = None
+    similar_cache.clear()
+    similar_cache_stats["invalidations"] += 1
+    with embedding_cache_lock:
+        embedding_cache.clear()
+
+def numeric_gtin(gtin) -> Optional[int]:
+    """The numeric GTIN (embeddings key) of an input or result GTIN, if it has one"""
+    gtin = str(gtin)
+    return int(gtin) if gtin.isdigit() and len(gtin) <= GTIN_MAX_DIGITS else None
+
+def embedding_array(embedding) -> np.ndarray:
+    """An embedding as a float32 array (from the table's text form, a list or an array)"""
+    return np.asarray(json.loads(embedding) if isinstance(embedding, str) else embedding, dtype=np.float32)
+
+def known_embedding(gtin: str):
+    """The embedding of a GTIN if this worker has it at hand (cache or in-process index), without a query"""
+    with embedding_cache_lock:
+        embedding = embedding_cache.get(gtin)
+    if embedding is None and vector_index is not None:
+        embedding = vector_index.get(numeric_gtin(gtin))
+    return embedding
+
+def stale_similar_keys(entries: list, changed: dict) -> list:
+    """
+    Keys of the (key, limit, results) cache entries that changed embeddings
+    ({numeric GTIN: new vector, or None if deleted}) can affect: results for
+    or listing a changed GTIN, results a new vector would enter (more similar
+    than the last one, or fewer results than the limit), and results whose
+    query embedding is not at hand to tell
+    """
+    vectors = [embedding_array(vector) for vector in changed.values() if vector is not None]
+    if vectors:
+        vectors = np.stack(vectors)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    stale = []
+    for key, limit, results in entries:
+        gtin = numeric_gtin(key[0])
+        if gtin is None or gtin in changed or any(numeric_gtin(result["gtin"]) in changed for result in results):
+            stale.append(key)
+        elif len(vectors):
+            query = known_embedding(key[0])
+            if query is None or len(results) < limit:
+                stale.append(key)
+                continue
+            query = embedding_array(query)
+            similarity = float(np.max(vectors @ query)) / max(float(np.linalg.norm(query)), 1e-12)
+            if similarity >= results[-1]["similarity"]:
+                stale.append(key)
+    return stale
+
+async def evict_similar(changed: dict) -> None:
+    """Drop the cached similar products that changed embeddings can affect (see stale_similar_keys)"""
+    entries = [(key, limit, results) for key, (limit, results) in similar_cache.items()]
+    for key in await asyncio.to_thread(stale_similar_keys, entries, changed):
+        if similar_cache.pop(key, None) is not None:
+            similar_cache_stats["evictions"] += 1
+
+async def embeddings_changed(payload: str) -> None:
+    """
+    Handle a change notification: for listed GTINs, evict only what they
+    affect, with their new vectors read back in one query; for an empty
+    payload (or if that query fails), drop everything
+    """
+    global embeddings_version
+    gtins = {int(gtin) for gtin in payload.split(",") if gtin.isdigit()}
+    if not gtins:
+        bump_embeddings_version()
+        return
+    # Results being computed right now are not cached (see cache_similar)
+    embeddings_version += 1
+    if vector_index_changes is not None:
+        vector_index_changes.update(gtins)
+    with embedding_cache_lock:
+        for key in [key for key in embedding_cache if numeric_gtin(key) in gtins - embedding_own_writes]:
+            del embedding_cache[key]
+    embedding_own_writes.difference_update(gtins)
+    
+    try:
+        rows = await query_db("SELECT gtin, embedding FROM embeddings WHERE gtin = ANY(%s)", (list(gtins),))
+    except Exception as e:
+        print(f"Could not read changed embeddings: {e}")
+        rows = None
+    if rows is None:
+        bump_embeddings_version()
+        return
+    await evict_similar({**dict.fromkeys(gtins), **{gtin: embedding for gtin, embedding in rows}})
+
+async def listen_for_embedding_changes(conninfo: str):
+    """Invalidate the caches whenever a writer announces changed embeddings"""
+    reconnecting = False
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(conninfo, autocommit=True) as conn:
+                await conn.execute(f"LISTEN {EMBEDDINGS_CHANGED_CHANNEL}")
+                if reconnecting:
+                    # Changes made while we were not listening were missed
+                    bump_embeddings_version()
+                reconnecting = True
+                async for notify in conn.notifies():
+                    await embeddings_changed(notify.payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Embeddings change listener failed, reconnecting: {e}")
+            await asyncio.sleep(DB_POOL_CHECK_INTERVAL)
+
+# In-process similarity backend: all embeddings in one normalized matrix,
+# used instead of pgvector when selected, and whenever the database is down
+SIMILARITY_BACKEND = os.getenv("SIMILARITY_BACKEND", "pgvector")  # "pgvector" or "numpy"
+VECTOR_SNAPSHOT_PATH = Path(os.getenv("VECTOR_SNAPSHOT_PATH", str(Path(__file__).parent / "embeddings_snapshot")))
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32")  # "float32" or "float16"
+# Leading dimensions scored before re-ranking on full vectors (0: score full vectors)
+VECTOR_INDEX_FIRST_PASS_DIMS = int(os.getenv("VECTOR_INDEX_FIRST_PASS_DIMS", "0"))
+# Minimum seconds between reloads after changes; changes in between are
+# picked up by one reload. GTINs missing from the index meanwhile are searched
+# with their cached embeddings but are not found as neighbours yet.
+VECTOR_INDEX_RELOAD_INTERVAL = float(os.getenv("VECTOR_INDEX_RELOAD_INTERVAL", "60"))
+vector_index = None
+vector_index_version = None  # embeddings_version the index was loaded at
+vector_index_loaded_at = 0.0  # time.monotonic() of the last load
+vector_index_changes = set()  # Numeric GTINs changed since the load (None: unknown changes)
+vector_index_refresh_task = None
+vector_index_lock = asyncio.Lock()
+
+def build_vector_index(conninfo: Optional[str]) -> Optional[VectorIndex]:
+    """Load the index, with a first pass on the leading dimensions if configured"""
+    index = load_vector_index(conninfo)
+    if index is not None and VECTOR_INDEX_FIRST_PASS_DIMS:
+        index.use_first_pass(VECTOR_INDEX_FIRST_PASS_DIMS, EMBEDDING_RERANK_FACTOR)
+    return index
+
+def load_vector_index(conninfo: Optional[str]) -> Optional[VectorIndex]:
+    """Load embeddings from the database (refreshing the snapshot), or from the snapshot alone"""
+    if conninfo:
+        try:
+            with psycopg.connect(conninfo) as conn:
+                index = VectorIndex.from_db(conn, VECTOR_INDEX_DTYPE)
+            print(f"Loaded {len(index)} embeddings into the in-process vector index")
+            try:
+                index.save(VECTOR_SNAPSHOT_PATH)
+                # Serve from the memory-mapped file so the pages are shared between workers
+                return VectorIndex.load(VECTOR_SNAPSHOT_PATH)
+            except OSError as e:
+                print(f"Warning: Could not write vector snapshot: {e}")
+                return index
+        except Exception as e:
+            print(f"Could not load embeddings from database: {e}")
+    
+    if (VECTOR_SNAPSHOT_PATH / "embeddings.npy").exists():
+        index = VectorIndex.load(VECTOR_SNAPSHOT_PATH)
+        print(f"Loaded {len(index)} embeddings from snapshot {VECTOR_SNAPSHOT_PATH}")
+        return index
+    return None
+
+async def refresh_vector_index():
+    """Reload a stale index in the background; the old one keeps serving until then"""
+    global vector_index, vector_index_version, vector_index_loaded_at, vector_index_changes, vector_index_refresh_task
+    try:
+        await asyncio.sleep(vector_index_loaded_at + VECTOR_INDEX_RELOAD_INTERVAL - time.monotonic())
+        version, changes = embeddings_version, vector_index_changes
+        vector_index_changes = set()
+        pool = await get_db_pool()
+        index = await asyncio.to_thread(build_vector_index, pool.conninfo if pool else None)
+        if index is None:
+            vector_index_changes = None if changes is None or vector_index_changes is None else changes | vector_index_changes
+            return
+        vector_index, vector_index_version, vector_index_loaded_at = index, version, time.monotonic()
+        # Results cached meanwhile were computed on the old index
+        if changes is None:
+            similar_cache.clear()
+        else:
+            await evict_similar({gtin: index.get(gtin) for gtin in changes})
+    finally:
+        vector_index_refresh_task = None
+
+async def get_vector_index() -> Optional[VectorIndex]:
+    """Get or build the in-process vector index"""
+    global vector_index, vector_index_version, vector_index_loaded_at, vector_index_changes, vector_index_refresh_task
+    if vector_index is None:
+        async with vector_index_lock:
+            if vector_index is None:
+                version = embeddings_version
+                vector_index_changes = set()
+                pool = await get_db_pool()
+                vector_index = await asyncio.to_thread(build_vector_index, pool.conninfo if pool else None)
+                vector_index_version, vector_index_loaded_at = version, time.monotonic()
+    elif vector_index_version != embeddings_version and vector_index_refresh_task is None:
+        vector_index_refresh_task = asyncio.create_task(refresh_vector_index())
+    return vector_index
+
+# pgvector search on truncated vectors: with EMBEDDING_INDEX_DIMENSIONS set
+# (and the matching expression index from create_db.sql), an HNSW index over
+# the leading dimensions picks EMBEDDING_RERANK_FACTOR x limit candidates,
+# which are re-ranked on the full vectors. HNSW returns at most
+# hnsw.ef_search rows, so each search sets it to cover its candidates; the
+# excluded query product is filtered out after the scan, so the full-vector
+# search takes one row more than its limit.
+EMBEDDING_INDEX_DIMENSIONS = int(os.getenv("EMBEDDING_INDEX_DIMENSIONS", "0"))  # 0: the full-vector index
+EMBEDDING_RERANK_FACTOR = int(os.getenv("EMBEDDING_RERANK_FACTOR", "10"))
+HNSW_EF_SEARCH_DEFAULT = 40  # pgvector's default hnsw.ef_search
+HNSW_EF_SEARCH_MAX = 1000  # pgvector's upper bound for hnsw.ef_search
+
+def hnsw_candidates(limit: int) -> int:
+    """Rows a search for limit neighbours takes from the HNSW index"""
+    if not EMBEDDING_INDEX_DIMENSIONS:
+        return min(limit + 1, HNSW_EF_SEARCH_MAX)
+    return min(limit * EMBEDDING_RERANK_FACTOR, HNSW_EF_SEARCH_MAX)
+
+def hnsw_settings(limit: int) -> Optional[dict]:
+    """query_db() settings for a nearest_embeddings_sql() search, if the default ef_search is too small"""
+    candidates = hnsw_candidates(limit)
+    if candidates <= HNSW_EF_SEARCH_DEFAULT:
+        return None
+    return {"hnsw.ef_search": candidates}
+
+def truncated_vector_sql(vector: str) -> str:
+    """The leading EMBEDDING_INDEX_DIMENSIONS of a vector expression, written like the index expression"""
+    dims = EMBEDDING_INDEX_DIMENSIONS
+    return f"(({vector})::real[])[1:{dims}]::vector({dims})"
+
+def nearest_embeddings_sql(query: str, limit: str, exclude: str = "") -> str:
+    """
+    Subquery for the (gtin, cosine distance) of the embeddings nearest to a
+    query vector expression, nearest first; exclude is a WHERE condition.
+    Run it with hnsw_settings(limit).
+    """
+    where = f"WHERE {exclude}" if exclude else ""
+    if not EMBEDDING_INDEX_DIMENSIONS:
+        return f"""
+            SELECT e.gtin, e.embedding <=> {query} as distance
+            FROM embeddings e
+            {where}
+            ORDER BY e.embedding <=> {query}
+            LIMIT {limit}
+        """
+    return f"""
+            SELECT s.gtin, s.embedding <=> {query} as distance
+            FROM (
+                SELECT e.gtin, e.embedding
+                FROM embeddings e
+                {where}
+                ORDER BY {truncated_vector_sql("e.embedding")} <=> {truncated_vector_sql(query)}
+                LIMIT LEAST({limit} * {EMBEDDING_RERANK_FACTOR}, {HNSW_EF_SEARCH_MAX})
+            ) s
+            ORDER BY distance
+            LIMIT {limit}
+        """
 
 # Pydantic models
 class SimilarProduct(BaseModel):
@@ -152,305 +801,828 @@ class ProductResponse(BaseModel):
     name: str
     product_data: dict
 
+class ProductBatchRequest(BaseModel):
+    gtins: List[str] = Field(..., description="GTINs to look up (or SKUs, with search_unmatched)")
+    fields: Optional[str] = Field(None, description="Comma-separated response fields, as in GET /products")
+    view: str = Field("full", pattern="^(full|summary)$")
+    search_unmatched: bool = Field(False, description="Resolve inputs that are no known GTIN to their best name match")
+
+class SimilarBatchRequest(BaseModel):
+    gtins: List[str]
+    limit: int = Field(10, ge=1, le=50)
+    fields: Optional[str] = Field(None, description="Comma-separated response fields, as in GET /products")
+    view: str = Field("full", pattern="^(full|summary)$")
+
+# Response fields that fields= can select, and the products expressions
+# behind them. Summary fields are columns (or products.summary entries),
+# so a projection without product_data never reads the product document;
+# product_data itself is selected as JSONB text and passed through as is.
+PRODUCT_FIELD_SQL = {
+    **{field: f"p.{field}" for field in SUMMARY_FIELDS if field not in DERIVED_FIELDS},
+    **{field: f"p.summary -> '{field}'" for field in DERIVED_FIELDS},
+    "product_data": "p.product_data::text",
+}
+FULL_VIEW = ("name", "product_data")
+
+def product_fields(fields: Optional[str], view: str) -> tuple:
+    """Response fields for fields= (a comma-separated list) or view=; gtin is always included"""
+    if not fields:
+        return SUMMARY_FIELDS if view == "summary" else FULL_VIEW
+    requested = tuple(dict.fromkeys(
+        field.strip() for field in fields.split(",") if field.strip() and field.strip() != "gtin"
+    ))
+    unknown = [field for field in requested if field not in PRODUCT_FIELD_SQL]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)} (available: gtin, {', '.join(PRODUCT_FIELD_SQL)})"
+        )
+    return requested
+
+def product_select(fields: tuple) -> str:
+    """Select list for the fields, following p.gtin"""
+    return "".join(f", {PRODUCT_FIELD_SQL[field]} AS {field}" for field in fields)
+
+def fields_from_row(fields: tuple, values) -> dict:
+    """Response fields from the values selected with product_select()"""
+    product = {}
+    for field, value in zip(fields, values):
+        if field == "product_data" and value is not None:
+            value = RawJSON(value.encode())
+        elif field == "name":
+            value = value or "Unknown Product"
+        product[field] = value
+    return product
+
+def fields_from_json(fields: tuple, gtin: str, prod: dict) -> dict:
+    """Response fields of a JSON catalog product"""
+    summary = product_summary(prod) if any(field != "product_data" for field in fields) else {}
+    return {field: product_json(gtin, prod) if field == "product_data" else summary[field] for field in fields}
+
+async def get_similar_from_index(index: VectorIndex, gtin: str, prod: dict, limit: int, fields: tuple) -> list:
+    """Similar products from the in-process vector index"""
+    gtin_int = int(gtin) if gtin.isdigit() else None
+    embedding = index.get(gtin_int) if gtin_int is not None else None
+    if embedding is None:
+        embedding = get_cached_embedding(gtin)
+    if embedding is None:
+        embedding = (await stored_embeddings([gtin])).get(gtin)
+    if embedding is None:
+        embedding = await compute_embedding(gtin, prod)
+        if embedding is None:
+            return []
+    
+    # Scoring is a single matmul over the whole matrix; numpy releases the GIL
+    neighbours = await asyncio.to_thread(index.search, embedding_array(embedding), limit, gtin_int)
+    return await build_neighbour_products(neighbours, fields)
+
+async def build_neighbour_products(neighbours, fields: tuple) -> list:
+    """Products for (gtin, similarity) pairs from the in-process index"""
+    return (await build_neighbour_product_lists([neighbours], fields))[0]
+
+async def build_neighbour_product_lists(neighbour_lists: list, fields: tuple) -> list:
+    """build_neighbour_products() for the results of several searches"""
+    # Neighbour data in one query when the database is up, else from the JSON catalog
+    product_rows = {}
+    try:
+        results = await query_db(
+            f"SELECT p.gtin{product_select(fields)} FROM products p WHERE p.gtin = ANY(%s)",
+            (list({neighbour_gtin for neighbours in neighbour_lists for neighbour_gtin, _ in neighbours}),)
+        )
+        for result_gtin, *values in results or []:
+            product_rows[result_gtin] = values
+    except Exception as e:
+        print(f"Error fetching similar product data: {e}")
+    
+    return [
+        await build_similar_products([
+            (neighbour_gtin, similarity, neighbour_gtin in product_rows, *product_rows.get(neighbour_gtin, ()))
+            for neighbour_gtin, similarity in neighbours
+        ], fields)
+        for neighbours in neighbour_lists
+    ]
+
+async def build_similar_products(results, fields: tuple) -> list:
+    """Build the response from (gtin, similarity, has products row, *field values) rows"""
+    similar_products = []
+    for result_gtin, similarity, found, *values in results:
+        if found:
+            product = fields_from_row(fields, values)
+        else:
+            # Embedding without a products row (table not populated yet)
+            similar_prod = await get_product_by_gtin_from_json(str(result_gtin))
+            if not similar_prod:
+                continue
+            product = fields_from_json(fields, str(result_gtin), similar_prod)
+        
+        similar_products.append({"gtin": str(result_gtin), **product, "similarity": float(similarity)})
+    
+    return similar_products
+
 @app.get("/")
-def root():
+async def root():
     return {"message": "Product Database API", "status": "ok"}
 
-@app.get("/products", response_model=List[ProductResponse])
-def get_products(
+@app.get("/pool/stats")
+async def get_pool_stats():
+    """Connection pool metrics: size, waiting requests and time spent waiting"""
+    pool = await get_db_pool()
+    if pool is None:
+        raise HTTPException(status_code=503, detail="Database connection not available")
+    stats = pool.get_stats()
+    requests_num = stats.get("requests_num", 0)
+    stats["requests_wait_ms_avg"] = stats.get("requests_wait_ms", 0) / requests_num if requests_num else 0.0
+    return stats
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Similar-product result cache and embedding cache metrics"""
+    lookups = similar_cache_stats["hits"] + similar_cache_stats["misses"]
+    return {
+        "similar": {
+            **similar_cache_stats,
+            "hit_rate": similar_cache_stats["hits"] / lookups if lookups else 0.0,
+            "size": len(similar_cache),
+            "max_size": SIMILAR_CACHE_SIZE,
+            "embeddings_version": embeddings_version,
+        },
+        "embeddings": {
+            "size": len(embedding_cache),
+            "max_size": EMBEDDING_CACHE_SIZE,
+        },
+        "query_embeddings": {
+            **query_embedding_stats,
+            "size": len(query_embedding_cache),
+            "max_size": QUERY_EMBEDDING_CACHE_SIZE,
+            "persistent": query_embedding_table_ok,
+        },
+    }
+
+# Query parameters shared by the product list endpoints
+FIELDS_QUERY = Query(None, description="Comma-separated response fields (gtin is always included); overrides view")
+VIEW_QUERY = Query("full", pattern="^(full|summary)$",
+                   description="full: name and product_data; summary: list attributes without product_data")
+
+# /products filters -> products columns. Each column has a (column, gtin)
+# index, so a filtered page is a range scan that starts at the cursor.
+PRODUCT_FILTER_COLUMNS = {
+    "vendor": "vendor_name",
+    "category": "category",
+    "brand": "brand",
+    "country_of_origin": "country_of_origin",
+}
+
+def product_filters(
+    vendor: Optional[str] = Query(None, description="Exact vendor name"),
+    category: Optional[str] = Query(None),
+    brand: Optional[str] = Query(None),
+    country_of_origin: Optional[str] = Query(None),
+) -> dict:
+    """Filters shared by /products and /products/count; unset ones are left out"""
+    filters = {"vendor": vendor, "category": category, "brand": brand, "country_of_origin": country_of_origin}
+    return {name: value for name, value in filters.items() if value is not None}
+
+def product_where(filters: dict, cursor: Optional[int] = None) -> tuple[str, dict]:
+    """WHERE clause and parameters for the filters, and for the products after the cursor GTIN"""
+    conditions = [f"p.{PRODUCT_FILTER_COLUMNS[name]} = %({name})s" for name in filters]
+    params = dict(filters)
+    if cursor is not None:
+        conditions.append("p.gtin > %(cursor)s")
+        params["cursor"] = cursor
+    return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+def parse_cursor(cursor: Optional[str]) -> Optional[int]:
+    if cursor is None:
+        return None
+    if not cursor.isdigit():
+        raise HTTPException(status_code=400, detail=f"Invalid cursor {cursor}")
+    return int(cursor)
+
+def json_positions(filters: dict, cursor: Optional[int] = None) -> np.ndarray:
+    """JSON catalog positions of the matching products after the cursor, in GTIN order"""
+    positions = None
+    for name, value in filters.items():
+        matching = product_filter_index[name].get(value, np.empty(0, dtype=np.int64))
+        positions = matching if positions is None else np.intersect1d(positions, matching, assume_unique=True)
+    if positions is None:
+        positions = np.arange(len(product_list_index))
+    if cursor is not None:
+        positions = positions[np.searchsorted(product_gtin_keys[positions], cursor, side="right"):]
+    return positions
+
+async def products_table_is_empty() -> bool:
+    results = await query_db("SELECT NOT EXISTS (SELECT 1 FROM products)")
+    return results is None or results[0][0]
+
+async def catalog_response(request: Request, build) -> Response:
+    """
+    Not Modified if the client has the current catalog version; otherwise the
+    response from build(), with the version's ETag and Last-Modified
+    """
+    version = await get_catalog_version()
+    if version is None:
+        return await build()
+    if is_not_modified(request, version):
+        return not_modified(version)
+    return with_cache_headers(await build(), version)
+
+# The schema is for the docs only: the handler returns a prebuilt JSON response
+@app.get("/products", responses={200: {"model": List[ProductResponse]}})
+async def get_products(
+    request: Request,
     limit: int = Query(100, ge=1, le=1000),
-    offset: int = Query(0, ge=0)
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="GTIN of the last product of the previous page (X-Next-Cursor)"),
+    fields: Optional[str] = FIELDS_QUERY,
+    view: str = VIEW_QUERY,
+    filters: dict = Depends(product_filters),
 ):
-    """Get list of products from database"""
-    # Try database first
-    conn = get_db_connection()
-    if conn:
-        try:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT gtin, name, product_data 
-                    FROM products 
-                    ORDER BY gtin 
-                    LIMIT %s OFFSET %s
-                """, (limit, offset))
-                
-                results = cur.fetchall()
-            
-            products = []
-            for gtin, name, product_data_json in results:
-                try:
-                    product_data = json.loads(product_data_json) if isinstance(product_data_json, str) else product_data_json
-                    products.append(ProductResponse(
-                        gtin=str(gtin),
-                        name=name or "Unknown Product",
-                        product_data=product_data
-                    ))
-                except Exception as e:
-                    print(f"Error parsing product {gtin}: {e}")
-                    continue
-            
-            if products:
-                return products
-        except Exception as e:
-            print(f"Database query failed: {e}")
-            # Fall through to JSON fallback
+    """Get list of products from database, in GTIN order"""
+    projection = product_fields(fields, view)
+    after = parse_cursor(cursor)
+    return await catalog_response(request, lambda: list_products(projection, filters, after, limit, offset))
+
+async def list_products(projection: tuple, filters: dict, cursor: Optional[int], limit: int, offset: int) -> Response:
+    """A page of products, with X-Next-Cursor unless it is the last one"""
+    # Try database first; one row past the page tells whether there is a next page
+    try:
+        where, params = product_where(filters, cursor)
+        results = await query_db(f"""
+            SELECT p.gtin{product_select(projection)}
+            FROM products p{where}
+            ORDER BY p.gtin
+            LIMIT %(limit)s OFFSET %(offset)s
+        """, {**params, "limit": limit + 1, "offset": offset})
+        
+        if results or (results is not None and not await products_table_is_empty()):
+            products = [
+                {"gtin": str(gtin), **fields_from_row(projection, values)} for gtin, *values in results[:limit]
+            ]
+            return page_response(products, len(results) > limit)
+    except Exception as e:
+        print(f"Database query failed: {e}")
+        # Fall through to JSON fallback
     
     # Fallback to JSON if database fails or is empty
     print("Using JSON fallback for products")
-    products_data = load_product_data()
+    await ensure_product_data()
+    selected = json_positions(filters, cursor)[offset:offset + limit + 1].tolist()
     products = []
-    
-    for prod in products_data[offset:offset+limit]:
-        try:
-            synkka = prod.get("synkkaData", {})
-            gtin = (
-                prod.get("salesUnitGtin") or 
-                synkka.get("gtin") or 
-                prod.get("gtin")
-            )
-            
-            if not gtin:
-                continue
-            
-            names = synkka.get("names", [])
-            name = names[0].get("value", "Unknown Product") if names else "Unknown Product"
-            
-            products.append(ProductResponse(
-                gtin=str(gtin),
-                name=name,
-                product_data=prod
-            ))
-        except Exception as e:
-            print(f"Error processing product: {e}")
-            continue
-    
-    return products
+    for position in selected[:limit]:
+        gtin, _, prod = product_list_index[position]
+        products.append({"gtin": gtin, **fields_from_json(projection, gtin, prod)})
+    return page_response(products, len(selected) > limit)
+
+def page_response(products: list, more: bool) -> Response:
+    response = json_response(products)
+    if more and products:
+        response.headers["X-Next-Cursor"] = products[-1]["gtin"]
+    return response
 
 @app.get("/products/count")
-def get_products_count():
-    """Get total number of products"""
-    conn = get_db_connection()
-    if conn:
-        try:
-            with conn.cursor() as cur:
-                cur.execute("SELECT COUNT(*) FROM products")
-                count = cur.fetchone()[0]
-            return {"count": count}
-        except Exception:
-            pass
+async def get_products_count(request: Request, filters: dict = Depends(product_filters)):
+    """Get total number of products (same filters as /products)"""
+    return await catalog_response(request, lambda: count_products(filters))
+
+async def count_products(filters: dict) -> Response:
+    try:
+        # The WHERE clause of /products, so the count uses the same indexes
+        where, params = product_where(filters)
+        results = await query_db(f"SELECT COUNT(*) FROM products p{where}", params)
+        if results is not None:
+            return json_response({"count": results[0][0]})
+    except Exception:
+        pass
     
     # Fallback to JSON count
-    products = load_product_data()
-    return {"count": len(products)}
+    await ensure_product_data()
+    return json_response({"count": len(json_positions(filters))})
 
-@app.get("/products/{gtin}", response_model=ProductResponse)
-def get_product(gtin: str):
+# Docs-only schema, as for /products
+@app.get("/products/{gtin}", responses={200: {"model": ProductResponse}})
+async def get_product(request: Request, gtin: str):
     """Get a single product by GTIN"""
-    conn = get_db_connection()
-    if conn:
-        try:
-            with conn.cursor() as cur:
-                cur.execute("SELECT gtin, name, product_data FROM products WHERE gtin = %s", (gtin,))
-                result = cur.fetchone()
-                
-                if result:
-                    gtin_val, name, product_data_json = result
-                    product_data = json.loads(product_data_json) if isinstance(product_data_json, str) else product_data_json
-                    return ProductResponse(
-                        gtin=str(gtin_val),
-                        name=name or "Unknown Product",
-                        product_data=product_data
-                    )
-        except Exception:
-            pass  # Fall through to JSON fallback
+    return await catalog_response(request, lambda: find_product(gtin))
+
+async def find_product(gtin: str) -> Response:
+    try:
+        results = await query_db(
+            f"SELECT p.gtin{product_select(FULL_VIEW)} FROM products p WHERE p.gtin = %s", (gtin,)
+        )
+        
+        if results:
+            gtin_val, *values = results[0]
+            return json_response({"gtin": str(gtin_val), **fields_from_row(FULL_VIEW, values)})
+    except Exception:
+        pass  # Fall through to JSON fallback
     
     # Fallback to JSON
-    prod = get_product_by_gtin_from_json(gtin)
+    prod = await get_product_by_gtin_from_json(gtin)
     if not prod:
         raise HTTPException(status_code=404, detail=f"Product with GTIN {gtin} not found")
     
-    synkka = prod.get("synkkaData", {})
-    names = synkka.get("names", [])
-    name = names[0].get("value", "Unknown Product") if names else "Unknown Product"
-    
-    return ProductResponse(
-        gtin=gtin,
-        name=name,
-        product_data=prod
-    )
+    return json_response({"gtin": gtin, **fields_from_json(FULL_VIEW, gtin, prod)})
 
-@app.get("/products/{gtin}/similar", response_model=List[SimilarProduct])
-def get_similar_products(
+# Docs-only schema, as for /products
+@app.get("/products/{gtin}/similar", responses={200: {"model": List[SimilarProduct]}})
+async def get_similar_products(
     gtin: str,
-    limit: int = Query(10, ge=1, le=50)
+    limit: int = Query(10, ge=1, le=50),
+    fields: Optional[str] = FIELDS_QUERY,
+    view: str = VIEW_QUERY
 ):
     """Get similar products using vector similarity search"""
+    projection = product_fields(fields, view)
+    key = (gtin, projection)
+    cached = get_cached_similar(key, limit)
+    if cached is not None:
+        return json_response(cached)
+    
+    version = embeddings_version
+    similar_products = await find_similar_products(gtin, limit, projection)
+    # An empty result means the embedding could not be created; try again next time
+    if similar_products:
+        cache_similar(key, limit, similar_products, version)
+    return json_response(similar_products)
+
+async def find_similar_products(gtin: str, limit: int, fields: tuple = FULL_VIEW) -> list:
+    """Run the vector search for a GTIN on the configured backend"""
     # Get the product to find similar ones for
-    prod = get_product_by_gtin(gtin)
+    prod = await get_product_by_gtin(gtin)
     if not prod:
         raise HTTPException(status_code=404, detail=f"Product with GTIN {gtin} not found")
     
-    # Get database connection (will reconnect if needed)
-    conn = get_db_connection()
-    if not conn:
+    # Use the in-process index when configured, or as a fallback without the database
+    pool = await get_db_pool()
+    if SIMILARITY_BACKEND == "numpy" or pool is None:
+        index = await get_vector_index()
+        if index is not None:
+            return await get_similar_from_index(index, gtin, prod, limit, fields)
+    
+    # Make sure the database is reachable before doing any vector work
+    if pool is None:
         raise HTTPException(status_code=503, detail="Database connection not available for vector search")
     
-    # First, check if the product has an embedding in the database
-    try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT embedding FROM embeddings WHERE gtin = %s", (gtin,))
-            result = cur.fetchone()
-            
-            if not result:
-                # Product doesn't have an embedding - try to create one, but if API fails, return empty
-                try:
-                    prod_obj = product(prod)
-                    embedding = prod_obj.get_embedding()
-                    embedding_list = embedding.tolist()
-                except Exception as e:
-                    print(f"Warning: Could not create embedding for {gtin}: {e}")
-                    # Return empty list if we can't create embedding and it doesn't exist
-                    return []
-            else:
-                # Use existing embedding from database
-                embedding_list = result[0]
-    except Exception as e:
-        print(f"Error querying embeddings: {e}")
-        # Try to reconnect and retry once
-        conn = get_db_connection()
-        if not conn:
+    # First, check if the product has an embedding (cache, then database).
+    # Pooled connections are only borrowed per query, and the embedding call
+    # below is awaited, so a slow one never holds a connection or a worker.
+    embedding_list = get_cached_embedding(gtin)
+    if embedding_list is None:
+        try:
+            result = await query_db("SELECT embedding FROM embeddings WHERE gtin = %s", (gtin,))
+        except Exception as e:
+            print(f"Error querying embeddings: {e}")
+            # Retry once on a fresh connection (the pool discards broken ones)
+            try:
+                result = await query_db("SELECT embedding FROM embeddings WHERE gtin = %s", (gtin,))
+            except Exception:
+                raise HTTPException(status_code=503, detail="Database connection failed")
+        
+        if result is None:
             raise HTTPException(status_code=503, detail="Database connection failed")
-        with conn.cursor() as cur:
-            cur.execute("SELECT embedding FROM embeddings WHERE gtin = %s", (gtin,))
-            result = cur.fetchone()
-            if not result:
+        
+        if not result:
+            # Product doesn't have an embedding - try to create one, but if API fails, return empty
+            embedding_list = await compute_embedding(gtin, prod)
+            if embedding_list is None:
+                # Return empty list if we can't create embedding and it doesn't exist
                 return []
-            embedding_list = result[0]
+        else:
+            # Use existing embedding from database
+            embedding_list = result[0][0]
+            cache_embedding(gtin, embedding_list)
     
     # Query for similar products using the embedding
+    # Use cosine similarity - pgvector returns 1 - cosine_distance
+    # The <=> operator computes cosine distance (0 = identical, 2 = opposite)
+    # We convert to similarity score (1 - distance), so higher = more similar
+    # The nearest neighbours are found first (so the HNSW index drives the
+    # ORDER BY ... LIMIT) and then joined against products, which returns the
+    # requested fields of every neighbour in the same round trip.
+    similar_query = f"""
+        WITH neighbours AS ({nearest_embeddings_sql(
+            "%(embedding)s::vector", "%(limit)s", exclude="e.gtin::text != %(gtin)s"
+        )})
+        SELECT 
+            n.gtin,
+            1 - n.distance as similarity,
+            p.gtin IS NOT NULL as found{product_select(fields)}
+        FROM neighbours n
+        LEFT JOIN products p ON p.gtin = n.gtin
+        ORDER BY n.distance
+    """
+    similar_params = {"embedding": embedding_list, "gtin": str(gtin), "limit": limit}
     try:
-        with conn.cursor() as cur:
-            # Use cosine similarity - pgvector returns 1 - cosine_distance
-            # The <=> operator computes cosine distance (0 = identical, 2 = opposite)
-            # We convert to similarity score (1 - distance), so higher = more similar
-            cur.execute("""
-                SELECT 
-                    e.gtin,
-                    1 - (e.embedding <=> %s::vector) as similarity
-                FROM embeddings e
-                WHERE e.gtin::text != %s
-                ORDER BY e.embedding <=> %s::vector
-                LIMIT %s
-            """, (embedding_list, str(gtin), embedding_list, limit))
-            
-            results = cur.fetchall()
+        results = await query_db(similar_query, similar_params, hnsw_settings(limit))
     except Exception as e:
         print(f"Error querying similar products: {e}")
-        # Try to reconnect and retry once
-        conn = get_db_connection()
-        if not conn:
+        # Retry once on a fresh connection
+        try:
+            results = await query_db(similar_query, similar_params, hnsw_settings(limit))
+        except Exception:
             raise HTTPException(status_code=503, detail="Database connection failed")
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT 
-                    e.gtin,
-                    1 - (e.embedding <=> %s::vector) as similarity
-                FROM embeddings e
-                WHERE e.gtin::text != %s
-                ORDER BY e.embedding <=> %s::vector
-                LIMIT %s
-            """, (embedding_list, str(gtin), embedding_list, limit))
-            results = cur.fetchall()
     
-    # Build response
-    similar_products = []
-    for result_gtin, similarity in results:
-        similar_prod = get_product_by_gtin(str(result_gtin))
-        if similar_prod:
-            synkka = similar_prod.get("synkkaData", {})
-            names = synkka.get("names", [])
-            name = names[0].get("value", "Unknown Product") if names else "Unknown Product"
-            
-            similar_products.append(SimilarProduct(
-                gtin=str(result_gtin),
-                name=name,
-                similarity=float(similarity),
-                product_data=similar_prod
-            ))
+    if results is None:
+        raise HTTPException(status_code=503, detail="Database connection failed")
     
-    return similar_products
+    return await build_similar_products(results, fields)
+
+# Batch lookups, for clients that resolve a whole list (an order's items) at once
+PRODUCT_BATCH_MAX = int(os.getenv("PRODUCT_BATCH_MAX", "500"))
+SIMILAR_BATCH_MAX = int(os.getenv("SIMILAR_BATCH_MAX", "100"))
+GTIN_MAX_DIGITS = 14  # GTIN-14; longer digit strings are no GTIN (nor a BIGINT)
+
+def batch_inputs(inputs: list, max_size: int) -> list:
+    """Distinct inputs in request order, or 400 if there are too many"""
+    distinct = list(dict.fromkeys(inputs))
+    if len(distinct) > max_size:
+        raise HTTPException(status_code=400, detail=f"At most {max_size} GTINs per batch")
+    return distinct
+
+def gtin_keys(gtins: list) -> dict:
+    """Numeric GTIN (products and embeddings key) -> the inputs that name it"""
+    keys = {}
+    for gtin in gtins:
+        if gtin.isdigit() and len(gtin) <= GTIN_MAX_DIGITS:
+            keys.setdefault(int(gtin), []).append(gtin)
+    return keys
+
+# Docs-only schema, as for /products
+@app.post("/products/batch", responses={200: {"model": dict[str, Optional[ProductResponse]]}})
+async def get_products_batch(batch: ProductBatchRequest):
+    """Get many products by GTIN in one query, keyed by input (null when not found)"""
+    projection = product_fields(batch.fields, batch.view)
+    gtins = batch_inputs(batch.gtins, PRODUCT_BATCH_MAX)
+    products = await find_products(gtins, projection)
+    if batch.search_unmatched:
+        # Inputs that are no GTIN (e.g. order SKUs): best name match, as /search would rank it
+        unmatched = [gtin for gtin, product in products.items() if product is None]
+        for gtin, match in (await best_name_matches(unmatched, projection)).items():
+            products[gtin] = match
+    return keyed_json_response(products)
+
+async def find_products(gtins: list, fields: tuple) -> dict:
+    """Input GTIN -> product (or None), with one products query for the whole batch"""
+    products = dict.fromkeys(gtins)
+    keys = gtin_keys(gtins)
+    try:
+        results = await query_db(
+            f"SELECT p.gtin{product_select(fields)} FROM products p WHERE p.gtin = ANY(%s)", (list(keys),)
+        )
+        if results or (results is not None and not await products_table_is_empty()):
+            for gtin, *values in results:
+                product = {"gtin": str(gtin), **fields_from_row(fields, values)}
+                for input_gtin in keys[gtin]:
+                    products[input_gtin] = product
+            return products
+    except Exception as e:
+        print(f"Database query failed: {e}")
+        # Fall through to JSON fallback
+    
+    # Fallback to JSON if database fails or is empty
+    print("Using JSON fallback for products")
+    await ensure_product_data()
+    for gtin in gtins:
+        prod = product_gtin_index.get(gtin)
+        if prod:
+            products[gtin] = {"gtin": gtin, **fields_from_json(fields, gtin, prod)}
+    return products
+
+# Docs-only schema, as for /products
+@app.post("/products/similar/batch", responses={200: {"model": dict[str, Optional[List[SimilarProduct]]]}})
+async def get_similar_products_batch(batch: SimilarBatchRequest):
+    """Similar products for many GTINs, keyed by input GTIN (null for an unknown GTIN)"""
+    projection = product_fields(batch.fields, batch.view)
+    gtins = batch_inputs(batch.gtins, SIMILAR_BATCH_MAX)
+    results = {}
+    for gtin in gtins:
+        cached = get_cached_similar((gtin, projection), batch.limit)
+        if cached is not None:
+            results[gtin] = cached
+    
+    missing = [gtin for gtin in gtins if gtin not in results]
+    if missing:
+        version = embeddings_version
+        for gtin, similar_products in (await find_similar_products_batch(missing, batch.limit, projection)).items():
+            # As in /similar, empty results are not cached
+            if similar_products:
+                cache_similar((gtin, projection), batch.limit, similar_products, version)
+            results[gtin] = similar_products
+    return keyed_json_response({gtin: results[gtin] for gtin in gtins})
+
+async def find_similar_products_batch(gtins: list, limit: int, fields: tuple) -> dict:
+    """
+    Input GTIN -> similar products (or None for an unknown GTIN). GTINs with
+    a stored embedding are searched together, in one database round trip or
+    one matrix product. Embeddings missing from the in-process index are
+    then read from the table, the ones it lacks too are computed, at most
+    EMBEDDING_BATCH_CONCURRENCY at a time, and all are searched together in
+    a second round.
+    """
+    keys = gtin_keys(gtins)
+    found = {}
+    pool = await get_db_pool()
+    index = await get_vector_index() if SIMILARITY_BACKEND == "numpy" or pool is None else None
+    if index is None and pool is None:
+        raise HTTPException(status_code=503, detail="Database connection not available for vector search")
+    if index is not None:
+        stored = [(key, index.get(key)) for key in keys]
+        neighbours = await index_neighbours(
+            index, [(key, key, embedding) for key, embedding in stored if embedding is not None], limit, fields
+        )
+    elif keys:
+        neighbours = await pgvector_neighbours(
+            "(SELECT gtin, gtin AS exclude, embedding FROM embeddings WHERE gtin = ANY(%(gtins)s)) q",
+            {"gtins": list(keys)}, limit, fields
+        )
+    else:
+        neighbours = {}
+    for key, similar_products in neighbours.items():
+        for gtin in keys[key]:
+            found[gtin] = similar_products
+    
+    rest = [gtin for gtin in gtins if gtin not in found]
+    if not rest:
+        return found
+    products = await get_products_by_gtin(rest)
+    missing = [gtin for gtin in rest if gtin in products]
+    # The in-process index can lag behind the table; only compute what neither has
+    embeddings = {}
+    if index is not None:
+        embeddings = await stored_embeddings([gtin for gtin in missing if get_cached_embedding(gtin) is None])
+    computed = [gtin for gtin in missing if gtin not in embeddings]
+    embeddings.update(zip(computed, await asyncio.gather(*(batch_embedding(gtin, products[gtin]) for gtin in computed))))
+    queries = []
+    for gtin in missing:
+        embedding = embeddings[gtin]
+        if embedding is None:
+            found[gtin] = []  # As in /similar: the embedding could not be created
+        else:
+            exclude = int(gtin) if gtin.isdigit() and len(gtin) <= GTIN_MAX_DIGITS else None
+            queries.append((gtin, exclude, embedding))
+    if queries:
+        if index is not None:
+            found.update(await index_neighbours(index, queries, limit, fields))
+        else:
+            found.update(await pgvector_neighbours("""
+                (SELECT t.gtin, t.exclude, t.embedding::vector AS embedding
+                 FROM unnest(%(gtins)s::text[], %(excludes)s::bigint[], %(embeddings)s::text[])
+                     AS t(gtin, exclude, embedding)) q
+            """, {
+                "gtins": [gtin for gtin, _, _ in queries],
+                "excludes": [exclude for _, exclude, _ in queries],
+                "embeddings": [vector_text(embedding) for _, _, embedding in queries],
+            }, limit, fields))
+    for gtin in rest:
+        found.setdefault(gtin, None)
+    return found
+
+# Embeddings computed at once for a batch; each computation holds at most one
+# pooled connection, so this stays below DB_POOL_MAX_SIZE
+EMBEDDING_BATCH_CONCURRENCY = int(os.getenv("EMBEDDING_BATCH_CONCURRENCY", str(max(1, DB_POOL_MAX_SIZE // 2))))
+embedding_batch_semaphore = asyncio.Semaphore(EMBEDDING_BATCH_CONCURRENCY)
+
+async def batch_embedding(gtin: str, prod: dict) -> Optional[list]:
+    """A cached or newly computed embedding for a batch GTIN without a stored one"""
+    embedding = get_cached_embedding(gtin)
+    if embedding is None:
+        async with embedding_batch_semaphore:
+            embedding = await compute_embedding(gtin, prod)
+    return embedding
+
+def vector_text(embedding) -> str:
+    """pgvector's text form of an embedding (as read from the table, or a list of floats)"""
+    return embedding if isinstance(embedding, str) else format_vector(embedding)
+
+async def get_products_by_gtin(gtins: list) -> dict:
+    """get_product_by_gtin() for many GTINs, with one products query; unknown GTINs are left out"""
+    products = {}
+    keys = gtin_keys(gtins)
+    try:
+        results = await query_db("SELECT gtin, product_data FROM products WHERE gtin = ANY(%s)", (list(keys),))
+        for gtin, product_data_json in results or []:
+            prod = json.loads(product_data_json) if isinstance(product_data_json, str) else product_data_json
+            for input_gtin in keys[gtin]:
+                products[input_gtin] = prod
+    except Exception as e:
+        print(f"Error fetching products: {e}")
+    for gtin in gtins:
+        if gtin not in products:
+            prod = await get_product_by_gtin_from_json(gtin)
+            if prod:
+                products[gtin] = prod
+    return products
+
+async def index_neighbours(index: VectorIndex, queries: list, limit: int, fields: tuple) -> dict:
+    """Query -> similar products for (query, GTIN to exclude, embedding) triples, with one matrix product"""
+    if not queries:
+        return {}
+    neighbour_lists = await asyncio.to_thread(
+        index.search_many, [embedding_array(embedding) for _, _, embedding in queries], limit, [exclude for _, exclude, _ in queries]
+    )
+    return dict(zip([query for query, _, _ in queries], await build_neighbour_product_lists(neighbour_lists, fields)))
+
+async def pgvector_neighbours(queries: str, params: dict, limit: int, fields: tuple) -> dict:
+    """
+    Query GTIN -> similar products for each row of queries (a FROM item
+    aliased q, with gtin, exclude and embedding columns): one HNSW search per
+    row (the LATERAL subquery), all in one statement. A row without
+    neighbours still returns one NULL row.
+    """
+    try:
+        results = await query_db(f"""
+            SELECT 
+                q.gtin,
+                n.gtin,
+                1 - n.distance as similarity,
+                p.gtin IS NOT NULL as found{product_select(fields)}
+            FROM {queries}
+            LEFT JOIN LATERAL ({nearest_embeddings_sql(
+                "q.embedding", "%(limit)s", exclude="e.gtin IS DISTINCT FROM q.exclude"
+            )}) n ON true
+            LEFT JOIN products p ON p.gtin = n.gtin
+            ORDER BY q.gtin, n.distance
+        """, {**params, "limit": limit}, hnsw_settings(limit))
+    except Exception as e:
+        print(f"Error querying similar products: {e}")
+        results = None
+    if results is None:
+        raise HTTPException(status_code=503, detail="Database connection failed")
+    
+    neighbour_rows = {}
+    for query_gtin, *row in results:
+        rows = neighbour_rows.setdefault(query_gtin, [])
+        if row[0] is not None:
+            rows.append(row)
+    return {query_gtin: await build_similar_products(rows, fields) for query_gtin, rows in neighbour_rows.items()}
+
+# Reciprocal rank fusion constant for mode=hybrid (the usual 60)
+HYBRID_RRF_K = 60
 
 @app.get("/search")
-def search_products(
+async def search_products(
     q: str = Query(..., description="Search query"),
-    limit: int = Query(20, ge=1, le=100)
+    limit: int = Query(20, ge=1, le=100),
+    mode: str = Query("lexical", pattern="^(lexical|semantic|hybrid)$",
+                      description="lexical: name matches; semantic: embedding similarity; hybrid: both, rank-fused"),
+    fields: Optional[str] = FIELDS_QUERY,
+    view: str = VIEW_QUERY
 ):
-    """Search products by name using database full-text search"""
-    conn = get_db_connection()
-    if conn:
-        try:
-            with conn.cursor() as cur:
-                # Use PostgreSQL full-text search
-                cur.execute("""
-                    SELECT gtin, name, product_data
-                    FROM products
-                    WHERE to_tsvector('english', name) @@ plainto_tsquery('english', %s)
-                       OR name ILIKE %s
-                    ORDER BY ts_rank(to_tsvector('english', name), plainto_tsquery('english', %s)) DESC
-                    LIMIT %s
-                """, (q, f"%{q}%", q, limit))
-                
-                results = cur.fetchall()
-            
-            products = []
-            for gtin, name, product_data_json in results:
-                try:
-                    product_data = json.loads(product_data_json) if isinstance(product_data_json, str) else product_data_json
-                    products.append({
-                        "gtin": str(gtin),
-                        "name": name or "Unknown Product",
-                        "product_data": product_data
-                    })
-                except Exception as e:
-                    print(f"Error parsing product {gtin}: {e}")
-                    continue
-            
-            return products
-        except Exception:
-            pass  # Fall through to JSON search
-    
-    # Fallback to JSON search
-    products = load_product_data()
-    query_lower = q.lower()
+    """Search products by name, by meaning (query embedding vs. product embeddings), or both"""
+    projection = product_fields(fields, view)
+    if mode == "lexical":
+        return json_response(await lexical_search(q, limit, projection))
+    if mode == "semantic":
+        results = await semantic_search(q, limit, projection)
+        if results is None:
+            raise HTTPException(status_code=503, detail="Semantic search not available")
+        return json_response(results)
     
+    # Hybrid: fuse the two rankings over a deeper candidate list from each
+    candidates = min(limit * 3, 100)
+    lexical, semantic = await asyncio.gather(
+        lexical_search(q, candidates, projection), semantic_search(q, candidates, projection)
+    )
+    if semantic is None:
+        return json_response(lexical[:limit])
+    fused = {}
+    for ranking in (lexical, semantic):
+        for rank, result in enumerate(ranking):
+            entry = fused.setdefault(result["gtin"], {**result, "score": 0.0})
+            entry["score"] += 1.0 / (HYBRID_RRF_K + rank + 1)
+            if "similarity" in result:
+                entry["similarity"] = result["similarity"]
+    fused = sorted(fused.values(), key=lambda result: result["score"], reverse=True)[:limit]
+    return json_response(fused)
+
+LEXICAL_TERMS = ("q", "contains", "prefix", "word_prefix")
+
+def lexical_terms(q: str) -> dict:
+    """The normalized query and the ILIKE patterns a name search ranks by"""
+    query = normalize(q)
+    pattern = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return {"q": query, "contains": f"%{pattern}%", "prefix": f"{pattern}%", "word_prefix": f"% {pattern}%"}
+
+def lexical_match_sql(term) -> str:
+    """WHERE and ORDER BY of a name search over products; term(name) is the SQL for a LEXICAL_TERMS value"""
+    # Trigram search (pg_trgm, idx_products_name_trgm); ranked like TrigramIndex.search
+    return f"""
+            WHERE name ILIKE {term("contains")} OR {term("q")} <%% name
+            ORDER BY lower(name) = {term("q")} DESC,
+                     name ILIKE {term("prefix")} DESC,
+                     name ILIKE {term("word_prefix")} DESC,
+                     name ILIKE {term("contains")} DESC,
+                     word_similarity({term("q")}, name) DESC,
+                     length(name)
+    """
+
+async def json_name_matches(q: str, limit: int, fields: tuple) -> list:
+    """Name search over the JSON catalog, with the in-memory trigram index"""
+    await ensure_product_data()
     results = []
-    for prod in products:
-        synkka = prod.get("synkkaData", {})
-        gtin = (
-            prod.get("salesUnitGtin") or 
-            synkka.get("gtin") or 
-            prod.get("gtin")
-        )
-        
-        if not gtin:
-            continue
+    for position, name in product_name_index.search(q, limit):
+        gtin, _, prod = product_list_index[position]
+        product = fields_from_json(fields, gtin, prod)
+        if "name" in product:
+            product["name"] = name  # The name that matched
+        results.append({"gtin": gtin, **product})
+    return results
+
+async def lexical_search(q: str, limit: int, fields: tuple = FULL_VIEW) -> list:
+    """Substring, prefix and trigram-similarity name matches, most relevant first"""
+    try:
+        results = await query_db(f"""
+            SELECT p.gtin{product_select(fields)}
+            FROM products p
+            {lexical_match_sql(lambda term: f"%({term})s")}
+            LIMIT %(limit)s
+        """, {**lexical_terms(q), "limit": limit})
         
-        # Search in names
-        names = synkka.get("names", [])
-        for name_obj in names:
-            name = name_obj.get("value", "")
-            if query_lower in name.lower():
-                results.append({
-                    "gtin": str(gtin),
-                    "name": name,
-                    "product_data": prod
-                })
-                break
+        if results is not None:
+            return [{"gtin": str(gtin), **fields_from_row(fields, values)} for gtin, *values in results]
+    except Exception:
+        pass  # Fall through to JSON search
+    
+    # Fallback to the in-memory trigram index over the JSON catalog
+    return await json_name_matches(q, limit, fields)
+
+async def best_name_matches(queries: list, fields: tuple) -> dict:
+    """
+    Query -> its top lexical_search() result (or None), for all queries in
+    one statement: each row of the unnested terms runs the name search as a
+    LATERAL subquery
+    """
+    matches = dict.fromkeys(queries)
+    # An empty query would match every name
+    terms = {query: lexical_terms(query) for query in queries}
+    terms = {query: query_terms for query, query_terms in terms.items() if query_terms["q"]}
+    if not terms:
+        return matches
+    try:
+        results = await query_db(f"""
+            SELECT t.input, m.*
+            FROM unnest(%(input)s::text[], {", ".join(f"%({term})s::text[]" for term in LEXICAL_TERMS)})
+                AS t(input, {", ".join(LEXICAL_TERMS)})
+            CROSS JOIN LATERAL (
+                SELECT p.gtin{product_select(fields)}
+                FROM products p
+                {lexical_match_sql(lambda term: f"t.{term}")}
+                LIMIT 1
+            ) m
+        """, {
+            "input": list(terms),
+            **{term: [query_terms[term] for query_terms in terms.values()] for term in LEXICAL_TERMS},
+        })
         
-        if len(results) >= limit:
-            break
+        if results is not None:
+            for query, gtin, *values in results:
+                matches[query] = {"gtin": str(gtin), **fields_from_row(fields, values)}
+            return matches
+    except Exception as e:
+        print(f"Error in batch name search: {e}")
     
-    return results
+    for query in terms:
+        results = await json_name_matches(query, 1, fields)
+        if results:
+            matches[query] = results[0]
+    return matches
+
+async def semantic_search(q: str, limit: int, fields: tuple = FULL_VIEW) -> Optional[list]:
+    """
+    Products whose embeddings are closest to the query's, or None if the
+    query cannot be embedded or no vector search backend is available
+    """
+    query = normalize(q)
+    if not query:
+        return []
+    embedding = await get_query_embedding(query)
+    if embedding is None:
+        return None
+    
+    pool = await get_db_pool()
+    if SIMILARITY_BACKEND == "numpy" or pool is None:
+        index = await get_vector_index()
+        if index is not None:
+            neighbours = await asyncio.to_thread(index.search, embedding, limit)
+            return await build_neighbour_products(neighbours, fields)
+        if pool is None:
+            return None
+    
+    # Nearest neighbours through the HNSW index, joined with products as in /similar
+    try:
+        results = await query_db(f"""
+            WITH neighbours AS ({nearest_embeddings_sql("%(embedding)s::vector", "%(limit)s")})
+            SELECT n.gtin, 1 - n.distance as similarity, p.gtin IS NOT NULL as found{product_select(fields)}
+            FROM neighbours n
+            LEFT JOIN products p ON p.gtin = n.gtin
+            ORDER BY n.distance
+        """, {"embedding": embedding, "limit": limit}, hnsw_settings(limit))
+    except Exception as e:
+        print(f"Error in semantic search: {e}")
+        return None
+    if results is None:
+        return None
+    return await build_similar_products(results, fields)
 
 if __name__ == "__main__":
     import uvicorn
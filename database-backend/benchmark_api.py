@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Load test for the Product API.
+
+Runs a mixed workload (product list, single product, similar products and
+search) against a running server with N concurrent keep-alive clients and
+reports throughput and per-endpoint latency percentiles.
+
+Usage:
+    python benchmark_api.py --url http://localhost:8000 --clients 50,200,500
+"""
+import argparse
+import asyncio
+import random
+import time
+from urllib.parse import urlsplit
+
+async def fetch(reader, writer, host: str, path: str) -> int:
+    """Send one GET on a keep-alive connection and read the full response; returns the status code"""
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nAccept-Encoding: identity\r\n\r\n".encode())
+    await writer.drain()
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Connection closed by server")
+    status = int(status_line.split()[1])
+
+    content_length = 0
+    chunked = False
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        name = name.strip().lower()
+        if name == "content-length":
+            content_length = int(value.strip())
+        elif name == "transfer-encoding" and "chunked" in value.lower():
+            chunked = True
+
+    if chunked:
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif content_length:
+        await reader.readexactly(content_length)
+    return status
+
+def build_paths(gtins: list, queries: list) -> list:
+    """Weighted request mix; /similar is the slow endpoint that used to starve the rest"""
+    paths = []
+    for _ in range(1000):
+        r = random.random()
+        if r < 0.4:
+            paths.append(("products", f"/products?limit=50&offset={random.randint(0, 500)}"))
+        elif r < 0.6:
+            paths.append(("product", f"/products/{random.choice(gtins)}"))
+        elif r < 0.85:
+            paths.append(("similar", f"/products/{random.choice(gtins)}/similar?limit=10"))
+        else:
+            paths.append(("search", f"/search?q={random.choice(queries)}&limit=20"))
+    return paths
+
+async def client(url, paths, deadline, latencies, errors):
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    try:
+        while time.perf_counter() < deadline:
+            kind, path = random.choice(paths)
+            start = time.perf_counter()
+            try:
+                status = await fetch(reader, writer, parts.netloc, path)
+            except Exception:
+                errors[kind] = errors.get(kind, 0) + 1
+                writer.close()
+                reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+                continue
+            if status >= 500:
+                errors[kind] = errors.get(kind, 0) + 1
+            latencies.setdefault(kind, []).append((time.perf_counter() - start) * 1000)
+    finally:
+        writer.close()
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+async def run(url: str, clients: int, duration: float, paths: list):
+    latencies = {}
+    errors = {}
+    deadline = time.perf_counter() + duration
+    start = time.perf_counter()
+    await asyncio.gather(*(client(url, paths, deadline, latencies, errors) for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+
+    total = sum(len(v) for v in latencies.values())
+    print(f"\n{clients} clients, {elapsed:.1f}s: {total} requests, {total / elapsed:,.1f} req/s")
+    for kind in sorted(latencies):
+        values = latencies[kind]
+        print(f"  {kind:<9} n={len(values):<6} p50={percentile(values, 0.5):8.1f}ms "
+              f"p99={percentile(values, 0.99):8.1f}ms errors={errors.get(kind, 0)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Product API")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--clients", default="50,200,500", help="Comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per concurrency level")
+    parser.add_argument("--gtins", default="", help="Comma-separated GTINs to request (default: first page of /products)")
+    args = parser.parse_args()
+
+    random.seed(42)
+    gtins = [g for g in args.gtins.split(",") if g]
+    if not gtins:
+        import json
+        import urllib.request
+        with urllib.request.urlopen(f"{args.url}/products?limit=200") as response:
+            gtins = [p["gtin"] for p in json.load(response)]
+    queries = ["maito", "juusto", "jogurtti", "voi", "kerma", "rahka"]
+    paths = build_paths(gtins, queries)
+
+    for clients in (int(c) for c in args.clients.split(",")):
+        asyncio.run(run(args.url, clients, args.duration, paths))
+
+if __name__ == "__main__":
+    main()
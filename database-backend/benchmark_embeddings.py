@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Benchmark compact embedding search against exact search.
+
+Copies the embeddings (or synthetic ones) into a scratch table and, for each
+configuration, reports the index size, build time, query latency and
+recall@k (for each --k) against exact cosine search over the full float32
+vectors:
+  - pgvector HNSW over the full vectors (the index from create_db.sql)
+  - pgvector HNSW over the leading dimensions, with the shortlist re-ranked
+    on the full vectors (EMBEDDING_INDEX_DIMENSIONS)
+  - the in-process index as float32 and float16, scoring full vectors or
+    with a first pass on the leading dimensions (VECTOR_INDEX_DTYPE,
+    VECTOR_INDEX_FIRST_PASS_DIMS)
+
+pgvector 0.6 has no halfvec type, so half precision is only measured for the
+in-process index. Random vectors have no leading dimensions that matter more
+than others; --synthetic generates clustered vectors whose variance decays
+over the dimensions, as it does for Matryoshka-trained embeddings.
+
+Usage:
+    python benchmark_embeddings.py [--dims 256,512] [--k 10,50] [--queries 200] [--synthetic 20000]
+"""
+import argparse
+import time
+import numpy as np
+import psycopg
+from vector_index import VectorIndex, top_k
+
+SCRATCH_TABLE = "embeddings_benchmark"
+HNSW_EF_SEARCH_DEFAULT = 40
+HNSW_EF_SEARCH_MAX = 1000
+
+def synthetic_embeddings(count: int, dims: int, seed: int = 0):
+    """Clustered vectors whose variance decays over the dimensions"""
+    rng = np.random.default_rng(seed)
+    scale = (1 / np.sqrt(np.arange(1, dims + 1))).astype(np.float32)
+    centers = rng.standard_normal((max(count // 50, 1), dims), dtype=np.float32) * scale
+    vectors = centers[rng.integers(len(centers), size=count)]
+    vectors += 1.5 * rng.standard_normal((count, dims), dtype=np.float32) * scale
+    return np.arange(1, count + 1, dtype=np.int64), vectors
+
+def create_scratch_table(conn, gtins: np.ndarray, vectors: np.ndarray) -> None:
+    """Write the vectors to the scratch table with one binary COPY (the row layout VectorIndex.from_db reads)"""
+    dims = vectors.shape[1]
+    conn.execute(f"DROP TABLE IF EXISTS {SCRATCH_TABLE}")
+    conn.execute(f"CREATE TABLE {SCRATCH_TABLE} (gtin BIGINT PRIMARY KEY, embedding vector({dims}))")
+    rows = np.zeros(len(gtins), dtype=[
+        ("fields", ">i2"),
+        ("gtin_len", ">i4"), ("gtin", ">i8"),
+        ("vec_len", ">i4"), ("dims", ">i2"), ("unused", ">i2"), ("vec", ">f4", (dims,)),
+    ])
+    rows["fields"] = 2
+    rows["gtin_len"] = 8
+    rows["gtin"] = gtins
+    rows["vec_len"] = 4 + 4 * dims
+    rows["dims"] = dims
+    rows["vec"] = vectors
+    with conn.cursor() as cur:
+        with cur.copy(f"COPY {SCRATCH_TABLE} (gtin, embedding) FROM STDIN (FORMAT BINARY)") as copy:
+            copy.write(b"PGCOPY\n\xff\r\n\x00" + bytes(8) + rows.tobytes() + b"\xff\xff")
+    conn.execute(f"ANALYZE {SCRATCH_TABLE}")
+
+def truncated(vector: str, dims: int) -> str:
+    return f"(({vector})::real[])[1:{dims}]::vector({dims})"
+
+def search_sql(dims: int, rerank_factor: int) -> str:
+    """The nearest-neighbour query of api_server.nearest_embeddings_sql, on the scratch table"""
+    if not dims:
+        return f"""
+            SELECT e.gtin FROM {SCRATCH_TABLE} e
+            WHERE e.gtin != %(gtin)s
+            ORDER BY e.embedding <=> %(embedding)s::vector
+            LIMIT %(limit)s
+        """
+    return f"""
+        SELECT s.gtin FROM (
+            SELECT e.gtin, e.embedding FROM {SCRATCH_TABLE} e
+            WHERE e.gtin != %(gtin)s
+            ORDER BY {truncated("e.embedding", dims)} <=> {truncated("%(embedding)s::vector", dims)}
+            LIMIT LEAST(%(limit)s * {rerank_factor}, {HNSW_EF_SEARCH_MAX})
+        ) s
+        ORDER BY s.embedding <=> %(embedding)s::vector
+        LIMIT %(limit)s
+    """
+
+def ef_search(k: int, dims: int, rerank_factor: int) -> int:
+    """hnsw.ef_search for a search of k neighbours, as api_server.hnsw_settings sets it"""
+    candidates = min(k * rerank_factor if dims else k + 1, HNSW_EF_SEARCH_MAX)
+    return max(candidates, HNSW_EF_SEARCH_DEFAULT)
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+def report(label: str, k: int, size: int, build_seconds: float, latencies: list, recall: float) -> None:
+    print(f"  {label:<34} {k:>4} {size / 1e6:9.1f} {build_seconds:9.2f} {percentile(latencies, 0.5) * 1000:8.2f} "
+          f"{percentile(latencies, 0.95) * 1000:8.2f} {recall:8.3f}")
+
+def recall_at_k(results: list, truth: list) -> float:
+    return float(np.mean([len(set(found) & set(expected)) / len(expected) for found, expected in zip(results, truth)]))
+
+def bench_pgvector(conn, dims: int, full_dims: int, rerank_factor: int, gtins, vectors, queries, truths: dict) -> None:
+    expression = f"({truncated('embedding', dims)})" if dims else "embedding"
+    conn.execute(f"DROP INDEX IF EXISTS {SCRATCH_TABLE}_idx")
+    start_time = time.perf_counter()
+    conn.execute(f"CREATE INDEX {SCRATCH_TABLE}_idx ON {SCRATCH_TABLE} USING hnsw ({expression} vector_cosine_ops)")
+    build_seconds = time.perf_counter() - start_time
+    size = conn.execute(f"SELECT pg_relation_size('{SCRATCH_TABLE}_idx')").fetchone()[0]
+
+    sql = search_sql(dims, rerank_factor)
+    label = f"pgvector hnsw {dims} -> {full_dims} (x{rerank_factor})" if dims else f"pgvector hnsw {full_dims}"
+    for k, truth in truths.items():
+        # HNSW returns at most ef_search rows; the shortlist needs all of them
+        conn.execute(f"SET hnsw.ef_search = {ef_search(k, dims, rerank_factor)}")
+        latencies, results = [], []
+        for position in queries:
+            params = {"embedding": vectors[position].tolist(), "gtin": int(gtins[position]), "limit": k}
+            start_time = time.perf_counter()
+            rows = conn.execute(sql, params).fetchall()
+            latencies.append(time.perf_counter() - start_time)
+            results.append([gtin for gtin, in rows])
+        report(label, k, size, build_seconds, latencies, recall_at_k(results, truth))
+
+def bench_numpy(dtype: str, dims: int, rerank_factor: int, gtins, vectors, queries, truths: dict) -> None:
+    start_time = time.perf_counter()
+    index = VectorIndex.from_vectors(gtins, vectors, dtype)
+    index.use_first_pass(dims, rerank_factor)
+    build_seconds = time.perf_counter() - start_time
+    size = index.matrix.nbytes + (index.first_pass.nbytes if index.first_pass is not None else 0)
+
+    full_dims = vectors.shape[1]
+    label = f"numpy {dtype} {dims} -> {full_dims} (x{rerank_factor})" if dims else f"numpy {dtype} {full_dims}"
+    for k, truth in truths.items():
+        latencies, results = [], []
+        for position in queries:
+            start_time = time.perf_counter()
+            neighbours = index.search(vectors[position], k, gtins[position])
+            latencies.append(time.perf_counter() - start_time)
+            results.append([gtin for gtin, _ in neighbours])
+        report(label, k, size, build_seconds, latencies, recall_at_k(results, truth))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark compact embedding indexes against exact search")
+    parser.add_argument("--dsn", default="", help="PostgreSQL connection string (default: DB_NAME/DB_PASSWORD from .env)")
+    parser.add_argument("--dims", default="256,512", help="Comma-separated first-pass dimensions")
+    parser.add_argument("--k", default="10,50", help="Comma-separated neighbour counts to measure recall@k for")
+    parser.add_argument("--rerank-factor", type=int, default=10, help="Shortlist size as a multiple of k")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--synthetic", type=int, default=0, help="Benchmark this many synthetic vectors instead of the embeddings table")
+    parser.add_argument("--synthetic-dims", type=int, default=1536)
+    parser.add_argument("--skip-pgvector", action="store_true")
+    args = parser.parse_args()
+
+    if args.dsn:
+        conn = psycopg.connect(args.dsn, autocommit=True)
+    else:
+        from product_embedding import get_db_connection
+        conn = get_db_connection()
+
+    if args.synthetic:
+        gtins, vectors = synthetic_embeddings(args.synthetic, args.synthetic_dims)
+    else:
+        index = VectorIndex.from_db(conn)
+        gtins, vectors = index.gtins, np.asarray(index.matrix)
+    dims_list = [int(dims) for dims in args.dims.split(",") if dims]
+    k_list = [int(k) for k in args.k.split(",") if k]
+    rng = np.random.default_rng(42)
+    queries = rng.choice(len(gtins), size=min(args.queries, len(gtins)), replace=False)
+
+    # Exact top-k over the full vectors, excluding the query itself (as /similar does)
+    exact = VectorIndex.from_vectors(gtins, vectors)
+    scores = exact.scores(vectors[queries])
+    scores[np.arange(len(queries)), queries] = -np.inf
+    truths = {k: [[int(gtins[i]) for i in top_k(row, k)] for row in scores] for k in k_list}
+
+    print(f"{len(gtins):,} vectors of {vectors.shape[1]} dimensions, {len(queries)} queries")
+    print(f"  {'configuration':<34} {'k':>4} {'size MB':>9} {'build s':>9} {'p50 ms':>8} {'p95 ms':>8} {'recall':>8}")
+    if not args.skip_pgvector:
+        create_scratch_table(conn, gtins, vectors)
+        try:
+            table_size = conn.execute(f"SELECT pg_table_size('{SCRATCH_TABLE}')").fetchone()[0]
+            print(f"  {'(pgvector table, full vectors)':<34} {'':>4} {table_size / 1e6:9.1f}")
+            for dims in [0] + dims_list:
+                bench_pgvector(conn, dims, vectors.shape[1], args.rerank_factor, gtins, vectors, queries, truths)
+        finally:
+            conn.execute(f"DROP TABLE IF EXISTS {SCRATCH_TABLE}")
+    for dtype in ("float32", "float16"):
+        for dims in [0] + dims_list:
+            bench_numpy(dtype, dims, args.rerank_factor, gtins, vectors, queries, truths)
+
+if __name__ == "__main__":
+    main()
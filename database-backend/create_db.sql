@@ -16,3 +16,22 @@ CREATE TABLE embeddings (
 -- (Optional) Add an index for vector similarity
 CREATE INDEX embeddings_hnsw_idx
 ON embeddings USING hnsw (embedding vector_cosine_ops);
+
+-- (Optional) A compact index over the leading 256 dimensions, about a sixth
+-- of the size of the full one and much faster to build. With
+-- EMBEDDING_INDEX_DIMENSIONS=256, the Product API takes a shortlist from it
+-- and re-ranks that on the full vectors (benchmark_embeddings.py compares
+-- recall). The expression has to match the API's query exactly.
+-- CREATE INDEX embeddings_hnsw_256_idx
+-- ON embeddings USING hnsw (((embedding::real[])[1:256]::vector(256)) vector_cosine_ops);
+
+-- Embeddings of /search query texts, a bounded cache (QUERY_EMBEDDING_CACHE_SIZE
+-- rows, least recently used dropped first) kept across API restarts
+CREATE TABLE IF NOT EXISTS query_embeddings (
+    model     TEXT NOT NULL,
+    query     TEXT NOT NULL,
+    embedding vector(1536) NOT NULL,
+    used_at   TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (model, query)
+);
+CREATE INDEX IF NOT EXISTS query_embeddings_used_at_idx ON query_embeddings (used_at);
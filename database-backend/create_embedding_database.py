@@ -1,50 +1,124 @@
+"""
+Build the embeddings table from the product catalog.
+
+Products are embedded in batches (many strings per embed_content request),
+with several requests in flight at once, and each finished batch is
+bulk-written to the database. Every written batch acts as a checkpoint:
+a rerun skips GTINs that already have a row in `embeddings`.
+"""
 from product_embedding import *
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import argparse
 import time
 
-print("Loading product data...")
-product_data_path = Path("valio_aimo_product_data_junction_2025.json")
+product_data_path = Path(__file__).parent / "valio_aimo_product_data_junction_2025.json"
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))  # Strings per embed_content request
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))  # Requests in flight at once
+EMBED_MAX_RETRIES = 3
+
+def load_products() -> list[product]:
+    print("Loading product data...")
+    with product_data_path.open("r", encoding="utf-8") as f:
+        product_data = json.load(f)
+    # Json.load returns a list of dictionaries
+    print(f"Loaded {len(product_data)} products")
+    return [product(item) for item in product_data]
+
+def checkpoint_key(gtin: str) -> int | str:
+    """
+    A GTIN as the embeddings table stores it: a BIGINT, so without the
+    leading zeros of zero-padded catalog GTINs (GTIN-14, padded EAN-8)
+    """
+    return int(gtin) if gtin.isdigit() else gtin
+
+def get_existing_gtins() -> set[int]:
+    """GTINs that already have an embedding (the resume checkpoint), as checkpoint_key() values"""
+    with get_db_connection().cursor() as cur:
+        cur.execute("SELECT gtin FROM embeddings")
+        return {int(row[0]) for row in cur.fetchall()}
+
+def embed_batch(batch: list[tuple[str, str]]) -> list[tuple[str, np.ndarray]]:
+    """Embed one batch of (gtin, embedding string) pairs, retrying on API errors"""
+    for attempt in range(1, EMBED_MAX_RETRIES + 1):
+        try:
+            embeddings = get_embeddings([text for _, text in batch])
+            return [(gtin, embedding) for (gtin, _), embedding in zip(batch, embeddings)]
+        except Exception as e:
+            if attempt == EMBED_MAX_RETRIES:
+                raise
+            print(f"Embedding request failed (attempt {attempt}/{EMBED_MAX_RETRIES}): {e}")
+            time.sleep(2 ** attempt)
 
-print("Parsing JSON...")
-with product_data_path.open("r", encoding="utf-8") as f:
-    product_data = json.load(f)
+def main(batch_size: int = EMBED_BATCH_SIZE, concurrency: int = EMBED_CONCURRENCY, limit: int | None = None):
+    products = load_products()
+    if limit:
+        products = products[:limit]
 
-# Truncate product data to 10 items for testing
-#product_data = product_data[:10]
+    existing = get_existing_gtins()
+    print(f"{len(existing)} products already have embeddings and will be skipped")
 
-# Json.load returns a list of dictionaries
-print("Loaded product data")
+    # Deduplicate by GTIN and skip anything already checkpointed
+    pending: dict[str, str] = {}
+    queued = set()
+    skipped = 0
+    for item in products:
+        gtin = item.get_gtin()
+        if not gtin:
+            skipped += 1
+            continue
+        key = checkpoint_key(gtin)
+        if key in existing or key in queued:
+            continue
+        queued.add(key)
+        pending[gtin] = item.create_embedding_string()
+
+    if skipped:
+        print(f"Skipping {skipped} products with missing GTIN")
+
+    items = list(pending.items())
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    total = len(items)
+    print(f"Embedding {total} products in {len(batches)} batches of up to {batch_size} ({concurrency} in flight)")
 
-def main():
     start_time = time.time()
+    written = 0
+    failed = 0
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(embed_batch, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                rows = future.result()
+            except Exception as e:
+                # Leave these GTINs out of the checkpoint so a rerun retries them
+                print(f"Batch of {len(batch)} failed, will be retried on the next run: {e}")
+                failed += len(batch)
+                continue
 
-    for idx, item in enumerate(product_data):
-        processed = idx + 1
-        total = len(product_data)
-
-        elapsed = time.time() - start_time
-        avg_per_item = elapsed / processed
-        remaining = total - processed
-        eta_seconds = remaining * avg_per_item
-
-        print(f"Processing item {processed} of {total} (estimated time left: {eta_seconds:,.1f}s)")
-        
-        item = product(item)
-        item.write_embedding_to_test_db()
-
-        synkka = item.product_data.get("synkkaData", {})
-        gtin = (
-            item.product_data.get("salesUnitGtin")
-            or synkka.get("gtin")
-            or item.product_data.get("gtin")
-        )
-        if gtin:
-            print(f"Embedding written to database for product {gtin}")
-        else:
-            print("Skipping product with missing GTIN.")
+            write_embeddings_to_db(rows)
+            written += len(rows)
+
+            elapsed = time.time() - start_time
+            rate = written / elapsed if elapsed > 0 else 0.0
+            remaining = total - written - failed
+            eta_seconds = remaining / rate if rate > 0 else 0.0
+            print(f"Written {written} of {total} ({rate:,.1f} products/s, estimated time left: {eta_seconds:,.1f}s)")
+
+    elapsed = time.time() - start_time
+    rate = written / elapsed if elapsed > 0 else 0.0
+    print(f"\nDone! Wrote {written} embeddings in {elapsed:,.1f}s ({rate:,.1f} products/s), {failed} failed")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write product embeddings to the database")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="Strings per embedding request")
+    parser.add_argument("--concurrency", type=int, default=EMBED_CONCURRENCY, help="Embedding requests in flight")
+    parser.add_argument("--limit", type=int, default=None, help="Only process the first N products (for testing)")
+    args = parser.parse_args()
+
     if input("Are you sure you want to write the embeddings to the database? (y/n): ") == "y":
-        main()
+        main(batch_size=args.batch_size, concurrency=args.concurrency, limit=args.limit)
     else:
         print("Exiting...")
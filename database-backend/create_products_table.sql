@@ -8,10 +8,27 @@ CREATE TABLE IF NOT EXISTS products (
     brand TEXT,
     sales_unit TEXT,
     base_unit TEXT,
+    summary JSONB,  -- Summary fields derived from product_data (product_summary.py)
     product_data JSONB
 );
+ALTER TABLE products ADD COLUMN IF NOT EXISTS summary JSONB;
 
 -- Create indexes for faster searches
-CREATE INDEX IF NOT EXISTS idx_products_name ON products USING gin(to_tsvector('english', name));
-CREATE INDEX IF NOT EXISTS idx_products_vendor ON products(vendor_name);
-CREATE INDEX IF NOT EXISTS idx_products_category ON products(category);
+-- Trigram index for /search: substring, prefix and similarity matches on (mostly Finnish) names
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_products_name_trgm ON products USING gin(name gin_trgm_ops);
+DROP INDEX IF EXISTS idx_products_name;
+-- /products filters: a filtered page is one range of an index, in GTIN (cursor) order
+CREATE INDEX IF NOT EXISTS idx_products_vendor_gtin ON products(vendor_name, gtin);
+CREATE INDEX IF NOT EXISTS idx_products_category_gtin ON products(category, gtin);
+CREATE INDEX IF NOT EXISTS idx_products_brand_gtin ON products(brand, gtin);
+CREATE INDEX IF NOT EXISTS idx_products_country_gtin ON products(country_of_origin, gtin);
+DROP INDEX IF EXISTS idx_products_vendor;
+DROP INDEX IF EXISTS idx_products_category;
+
+-- When the catalog was last loaded (one row, set by populate_products_table.py);
+-- the Product API sends it as ETag/Last-Modified and answers 304 Not Modified
+CREATE TABLE IF NOT EXISTS products_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    loaded_at TIMESTAMPTZ NOT NULL
+);
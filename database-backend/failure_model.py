@@ -0,0 +1,196 @@
+"""
+In-process scoring with the trained failure model.
+
+The stats service (stats-backend/server.R) rebuilds a design matrix for
+every /predict request: it extends factor levels, rbinds a template row,
+calls sparse.model.matrix and reorders the columns. This module does the
+same encoding from a precomputed table, then scores the rows with the
+XGBoost booster, without an HTTP round trip.
+
+Both files are written once from R, next to final_model.rds:
+    cd stats-backend && Rscript export_model.R
+  final_model.json     the booster in XGBoost's native JSON format
+  model_encoding.json  the model's feature names and each factor's training levels
+
+The encoding is the same as make_design_matrix:
+  - order_qty and lead_time become log1p(value);
+  - an unseen product_code is scored as "other";
+  - an unseen level of any other factor has no model column, so it is
+    encoded like the reference level (all of that factor's dummies are 0);
+  - entries that are 0 are left out of the sparse matrix, and XGBoost
+    treats them as missing, as it does for the R dgCMatrix.
+Values are compared with factor levels as R's as.character() renders them,
+so 5 and "5" match the level "5", but "05" does not.
+
+Check that the scores match the running stats service:
+    python failure_model.py --check-parity --rows 2000
+"""
+import json
+import math
+import os
+from pathlib import Path
+from typing import Optional
+import numpy as np
+
+MODEL_DIR = Path(os.getenv("FAILURE_MODEL_DIR", str(Path(__file__).parent.parent / "stats-backend")))
+BOOSTER_FILE = "final_model.json"
+ENCODING_FILE = "model_encoding.json"
+
+# Inputs of make_design_matrix, in formula order
+REQUIRED_FEATURES = ("product_code", "order_qty", "sales_unit", "plant", "storage_location",
+                     "order_dow", "delivery_dow", "lead_time", "month", "coinciding_delivery")
+NUMERIC_FEATURES = ("order_qty", "lead_time")
+FACTOR_FEATURES = tuple(name for name in REQUIRED_FEATURES if name not in NUMERIC_FEATURES)
+INTERCEPT = "(Intercept)"
+OTHER_PRODUCT = "other"
+
+def r_character(value) -> str:
+    """A JSON value as R's as.character() renders it"""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, float):
+        if value.is_integer() and abs(value) < 1e15:
+            return str(int(value))
+        return format(value, ".15g")
+    return str(value)
+
+class FailureModel:
+    def __init__(self, booster, feature_names: list[str], levels: dict[str, list[str]]):
+        self.booster = booster
+        self.feature_names = feature_names
+        column = {name: idx for idx, name in enumerate(feature_names)}
+        self.intercept = column.get(INTERCEPT)
+        self.numeric_columns = {name: column.get(name) for name in NUMERIC_FEATURES}
+
+        # Level -> model column, per factor (the reference level and dropped levels have none)
+        self.level_columns = {}
+        for name in FACTOR_FEATURES:
+            self.level_columns[name] = {
+                level: column[f"{name}{level}"] for level in levels[name] if f"{name}{level}" in column
+            }
+        self.product_levels = set(levels["product_code"])
+        if OTHER_PRODUCT not in self.product_levels:
+            raise ValueError(f'"{OTHER_PRODUCT}" level not found in the product_code levels')
+
+    @classmethod
+    def load(cls, directory: Path = MODEL_DIR) -> "FailureModel":
+        import xgboost
+
+        directory = Path(directory)
+        with (directory / ENCODING_FILE).open() as f:
+            encoding = json.load(f)
+        booster = xgboost.Booster()
+        booster.load_model(str(directory / BOOSTER_FILE))
+        return cls(booster, encoding["feature_names"], encoding["levels"])
+
+    def design_matrix(self, rows: list[dict]):
+        """CSR matrix of the rows, with the model's columns in the model's order"""
+        from scipy.sparse import csr_matrix
+
+        missing = [name for name in REQUIRED_FEATURES if any(name not in row for row in rows)]
+        if missing:
+            raise ValueError(f"Missing required columns in input: {', '.join(missing)}")
+
+        indptr = [0]
+        indices = []
+        data = []
+        for row in rows:
+            entries = {}
+            if self.intercept is not None:
+                entries[self.intercept] = 1.0
+            for name, idx in self.numeric_columns.items():
+                value = row.get(name)
+                try:
+                    value = math.log1p(float(value))
+                except (TypeError, ValueError):
+                    raise ValueError(f"{name} must be numeric, got {value!r}")
+                if math.isnan(value):
+                    raise ValueError(f"{name} must be numeric, got {row.get(name)!r}")
+                if idx is not None and value != 0:
+                    entries[idx] = value
+            for name, columns in self.level_columns.items():
+                level = r_character(row.get(name))
+                if name == "product_code" and level not in self.product_levels:
+                    level = OTHER_PRODUCT
+                idx = columns.get(level)
+                if idx is not None:
+                    entries[idx] = 1.0
+            for idx in sorted(entries):
+                indices.append(idx)
+                data.append(entries[idx])
+            indptr.append(len(indices))
+
+        return csr_matrix(
+            (np.array(data, dtype=np.float32), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+            shape=(len(rows), len(self.feature_names)),
+        )
+
+    def predict(self, rows: list[dict]) -> np.ndarray:
+        """Failure probabilities for a batch of feature rows"""
+        import xgboost
+
+        if not rows:
+            return np.empty(0, dtype=np.float32)
+        return self.booster.predict(xgboost.DMatrix(self.design_matrix(rows), missing=np.nan))
+
+def load_failure_model(directory: Path = MODEL_DIR) -> Optional[FailureModel]:
+    """The exported model, or None if it has not been exported or xgboost is not installed"""
+    directory = Path(directory)
+    if not (directory / BOOSTER_FILE).exists() or not (directory / ENCODING_FILE).exists():
+        return None
+    try:
+        return FailureModel.load(directory)
+    except ImportError as e:
+        print(f"Warning: In-process failure model unavailable ({e}); using the stats service")
+    except Exception as e:
+        print(f"Warning: Could not load failure model from {directory}: {e}")
+    return None
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    import order_scoring
+    import orders_api
+
+    parser = argparse.ArgumentParser(description="Score orders with the exported failure model")
+    parser.add_argument("--check-parity", action="store_true", help="Compare with the stats service's /predict")
+    parser.add_argument("--rows", type=int, default=2000, help="Distinct feature rows to score")
+    # The service's JSON serializer keeps 4 decimal places
+    parser.add_argument("--tolerance", type=float, default=1e-4)
+    args = parser.parse_args()
+
+    model = load_failure_model()
+    if model is None:
+        raise SystemExit(f"No exported model in {MODEL_DIR}; run `Rscript export_model.R` in stats-backend")
+
+    rows, _ = order_scoring.distinct_features(orders_api.load_orders())
+    rows = [dict(zip(order_scoring.MODEL_FEATURES, row)) for row in rows[:args.rows]]
+    # Unseen levels and JSON types the R service also receives from the frontend
+    if rows:
+        rows += [
+            {**rows[0], "product_code": "unseen-product"},
+            {**rows[0], "plant": "unseen-plant", "month": "13"},
+            {**rows[0], "order_qty": 0, "lead_time": 0.0},
+            {**rows[0], "coinciding_delivery": int(rows[0]["coinciding_delivery"])},
+        ]
+
+    start_time = time.perf_counter()
+    prob = model.predict(rows)
+    seconds = time.perf_counter() - start_time
+    print(f"In-process: {len(rows)} rows in {seconds * 1000:,.1f}ms")
+
+    if args.check_parity:
+        start_time = time.perf_counter()
+        service_prob = np.concatenate([
+            order_scoring.request_predictions(rows[start:start + order_scoring.SCORING_BATCH_SIZE])
+            for start in range(0, len(rows), order_scoring.SCORING_BATCH_SIZE)
+        ])
+        seconds = time.perf_counter() - start_time
+        print(f"Stats service: {len(rows)} rows in {seconds * 1000:,.1f}ms")
+        diff = np.abs(prob - service_prob)
+        mismatched = np.flatnonzero(diff > args.tolerance)
+        for idx in mismatched[:10].tolist():
+            print(f"  {rows[idx]}: in-process {prob[idx]:.6f}, service {service_prob[idx]:.6f}")
+        print(f"Max difference {diff.max():.2e}; {len(mismatched)} of {len(rows)} rows differ by more than {args.tolerance}")
+        if len(mismatched):
+            raise SystemExit(1)
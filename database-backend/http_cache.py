@@ -0,0 +1,76 @@
+"""
+Conditional GET and compression for data that only changes when it is reloaded.
+
+The Product and Orders APIs each keep a version of the data they serve: a
+tag (load timestamp or content hash) and the time it changed. Responses
+carry it as a weak ETag and Last-Modified, and a request that already has
+the current version (If-None-Match, or If-Modified-Since when it sends no
+ETag) gets an empty 304 Not Modified instead of the body. Cache-Control
+lets browsers and nginx keep responses, but revalidate them before use, so
+a reload shows up on the next request.
+
+Responses are gzip-compressed for clients that accept it; the ETags are
+weak because the same version is sent compressed or not.
+"""
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import NamedTuple
+from fastapi import Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+
+CACHE_CONTROL = os.getenv("API_CACHE_CONTROL", "public, no-cache")
+
+class DataVersion(NamedTuple):
+    tag: str
+    modified: datetime  # Timezone-aware
+
+    @property
+    def etag(self) -> str:
+        return f'W/"{self.tag}"'
+
+def version_at(source: str, modified: datetime) -> DataVersion:
+    """A version identified by when its source was loaded"""
+    return DataVersion(f"{source}-{int(modified.timestamp() * 1_000_000):x}", modified)
+
+def cache_headers(version: DataVersion) -> dict:
+    return {
+        "ETag": version.etag,
+        "Last-Modified": format_datetime(version.modified.astimezone(timezone.utc), usegmt=True),
+        "Cache-Control": CACHE_CONTROL,
+    }
+
+def is_not_modified(request: Request, version: DataVersion) -> bool:
+    """Whether the client already has this version of the response"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison: W/ prefixes are ignored
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or f'"{version.tag}"' in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # HTTP dates have whole seconds
+        return version.modified.replace(microsecond=0) <= since
+    return False
+
+def not_modified(version: DataVersion) -> Response:
+    return Response(status_code=304, headers=cache_headers(version))
+
+def with_cache_headers(response: Response, version: DataVersion) -> Response:
+    response.headers.update(cache_headers(version))
+    return response
+
+# Responses smaller than this are sent uncompressed
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1024"))
+# Level 5 compresses product lists about twice as fast as starlette's default 9, to nearly the same size
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+
+def add_compression(app) -> None:
+    """gzip responses for clients that accept it (nginx leaves them as they are)"""
+    app.add_middleware(GZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE, compresslevel=GZIP_LEVEL)
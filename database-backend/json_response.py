@@ -0,0 +1,117 @@
+"""
+Fast JSON responses for the Product API.
+
+Returning objects from a FastAPI endpoint validates them against the
+endpoint's response_model and encodes them with the standard library. For
+product lists that is most of a request's CPU time. Each synkkaData
+document is decoded from JSONB, copied into a model, validated, and encoded
+again. Instead:
+  - product documents are selected as JSONB text (product_data::text) and
+    written into the response as they are (RawJSON);
+  - documents from the JSON catalog are encoded once and reused;
+  - the other fields are encoded with orjson, and the endpoint returns
+    the bytes in a Response, which FastAPI sends without validation.
+
+Compare the CPU cost per 1,000 products with the response_model path:
+    python json_response.py --rows 1000
+"""
+import orjson
+from fastapi.responses import Response
+
+class RawJSON(bytes):
+    """Encoded JSON that is written into a response as it is"""
+    __slots__ = ()
+
+def encode_item(item: dict) -> bytes:
+    """Encode an object, splicing in its RawJSON values without parsing them"""
+    raw = [(key, value) for key, value in item.items() if isinstance(value, RawJSON)]
+    if not raw:
+        return orjson.dumps(item)
+    encoded = orjson.dumps({key: value for key, value in item.items() if not isinstance(value, RawJSON)})
+    parts = [encoded[:-1]]  # Without the closing brace
+    for key, value in raw:
+        parts.append(b"," if len(parts) > 1 or len(encoded) > 2 else b"")
+        parts += [orjson.dumps(key), b":", value]
+    parts.append(b"}")
+    return b"".join(parts)
+
+def encode_items(items: list) -> bytes:
+    return b"[" + b",".join(encode_item(item) for item in items) + b"]"
+
+def encode_keyed(results: dict) -> bytes:
+    """Encode results keyed by (string) input: each an object, a list of objects or None"""
+    parts = []
+    for key, value in results.items():
+        if isinstance(value, list):
+            encoded = encode_items(value)
+        elif isinstance(value, dict):
+            encoded = encode_item(value)
+        else:
+            encoded = orjson.dumps(value)
+        parts.append(orjson.dumps(key) + b":" + encoded)
+    return b"{" + b",".join(parts) + b"}"
+
+def json_response(content) -> Response:
+    """A response for an object or a list of objects, bypassing response_model validation"""
+    body = encode_items(content) if isinstance(content, list) else encode_item(content)
+    return Response(content=body, media_type="application/json")
+
+def keyed_json_response(results: dict) -> Response:
+    """A response for batch results keyed by input (see encode_keyed)"""
+    return Response(content=encode_keyed(results), media_type="application/json")
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import time
+    from typing import List
+    from pydantic import TypeAdapter
+    import api_server
+    # The classes api_server uses, not this script's copies
+    from json_response import RawJSON, encode_items
+
+    parser = argparse.ArgumentParser(description="CPU cost of serializing product lists")
+    parser.add_argument("--rows", type=int, default=1000, help="Products per response")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    api_server.load_product_data()
+    products = api_server.product_list_index[:args.rows]
+    # product_data as PostgreSQL returns it for product_data::text
+    rows = [(gtin, name, json.dumps(prod, ensure_ascii=False)) for gtin, name, prod in products]
+    adapter = TypeAdapter(List[api_server.ProductResponse])
+
+    def response_model_path():
+        # psycopg decodes JSONB; FastAPI then dumps the models, validates the
+        # result against response_model and JSONResponse encodes it
+        models = [
+            api_server.ProductResponse(gtin=gtin, name=name, product_data=json.loads(text))
+            for gtin, name, text in rows
+        ]
+        content = adapter.dump_python(adapter.validate_python([model.model_dump() for model in models]), mode="json")
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+    def raw_path():
+        return encode_items([
+            {"gtin": gtin, "name": name, "product_data": RawJSON(text.encode())} for gtin, name, text in rows
+        ])
+
+    def cached_path():
+        return encode_items([
+            {"gtin": gtin, "name": name, "product_data": api_server.product_json(gtin, prod)}
+            for gtin, name, prod in products
+        ])
+
+    assert json.loads(raw_path()) == json.loads(response_model_path()) == json.loads(cached_path())
+    print(f"{len(rows)} products, {len(raw_path()) / 1024:,.0f} KB per response")
+    for label, path in (
+        ("response_model + stdlib json", response_model_path),
+        ("JSONB text passthrough", raw_path),
+        ("cached catalog bytes", cached_path),
+    ):
+        path()
+        start_time = time.process_time()
+        for _ in range(args.repeat):
+            path()
+        seconds = (time.process_time() - start_time) / args.repeat
+        print(f"  {label:30} {seconds * 1000 * 1000 / len(rows):7.2f}ms CPU per 1,000 products")
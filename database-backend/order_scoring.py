@@ -0,0 +1,200 @@
+"""
+Batch failure-risk scoring of the loaded orders.
+
+Every order is scored in large batches instead of one order at a time
+from the order details page: in-process with the exported model
+(failure_model.py) when it is available, otherwise by the stats service
+(stats-backend/server.R, POST /predict). Orders with identical model features are scored once:
+each distinct feature row is hashed, and predictions are kept in a cache
+file keyed by that hash, so a restart (or a reload with new orders) only
+sends feature rows the service has not scored before. The cache is tied
+to the model file and discarded when the model changes.
+
+Score the orders without starting the API:
+    python order_scoring.py
+"""
+import hashlib
+import itertools
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+import numpy as np
+from failure_model import load_failure_model
+from order_store import OrderStore
+
+STATS_API_URL = os.getenv("STATS_API_URL", "http://localhost:8001")
+SCORING_BATCH_SIZE = int(os.getenv("SCORING_BATCH_SIZE", "5000"))  # Feature rows per /predict request
+SCORING_BACKEND = os.getenv("SCORING_BACKEND", "auto")  # "auto", "python" (in-process model) or "http" (stats service)
+PREDICTIONS_PATH = Path(os.getenv("ORDERS_PREDICTIONS_PATH", str(Path(__file__).parent / "orders_predictions.npz")))
+MODEL_PATH = Path(__file__).parent.parent / "stats-backend" / "final_model.rds"
+
+# Model inputs, as in make_design_matrix (stats-backend/server.R)
+MODEL_FEATURES = ("product_code", "order_qty", "sales_unit", "plant", "storage_location",
+                  "order_dow", "delivery_dow", "lead_time", "month", "coinciding_delivery")
+
+def model_id() -> str:
+    """Identifies the model the cached predictions came from"""
+    if not MODEL_PATH.exists():
+        return "unknown"
+    return hashlib.sha256(MODEL_PATH.read_bytes()).hexdigest()
+
+def feature_key(row: tuple) -> int:
+    """Stable 64-bit hash of one feature row (values in MODEL_FEATURES order)"""
+    text = "\x1f".join(map(str, row))
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+
+def distinct_features(store: OrderStore):
+    """Distinct feature rows (decoded, as tuples) and, per order, the index of its row"""
+    matrix = np.stack([store.columns[name].astype(np.int64) for name in MODEL_FEATURES], axis=1)
+    unique_rows, inverse = np.unique(matrix, axis=0, return_inverse=True)
+    columns = []
+    for i, name in enumerate(MODEL_FEATURES):
+        codes = unique_rows[:, i]
+        if name in store.values:
+            columns.append(np.array(store.values[name], dtype=object)[codes].tolist())
+        else:
+            columns.append(codes.tolist())
+    return list(zip(*columns)), inverse.reshape(-1)
+
+def load_predictions(path: Path, model: str) -> tuple[np.ndarray, np.ndarray]:
+    """Cached (sorted keys, probabilities), empty if missing or for another model"""
+    empty = np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.float32)
+    if not path.exists():
+        return empty
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if data["model"].tobytes().decode() != model:
+                return empty
+            return data["keys"], data["prob"]
+    except Exception as e:
+        print(f"Warning: Could not read prediction cache {path}: {e}")
+        return empty
+
+def save_predictions(path: Path, model: str, keys: np.ndarray, prob: np.ndarray) -> None:
+    order = np.argsort(keys)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with tmp_path.open("wb") as f:
+        np.savez(f, model=np.frombuffer(model.encode(), dtype=np.uint8), keys=keys[order], prob=prob[order])
+    os.replace(tmp_path, path)
+
+failure_model = None
+failure_model_loaded = False
+
+def get_failure_model():
+    """The in-process model, loaded on first use; None when scoring goes to the stats service"""
+    global failure_model, failure_model_loaded
+    if not failure_model_loaded:
+        if SCORING_BACKEND != "http":
+            failure_model = load_failure_model()
+            if failure_model is None and SCORING_BACKEND == "python":
+                raise RuntimeError("SCORING_BACKEND=python but the failure model could not be loaded")
+        failure_model_loaded = True
+    return failure_model
+
+def stats_service_error(body: bytes) -> str:
+    """The message of an error response from the stats service, without its "Prediction failed: " prefix"""
+    try:
+        message = json.loads(body)["error"]
+    except (ValueError, KeyError, TypeError):
+        message = body.decode(errors="replace").strip()
+    if isinstance(message, list):
+        message = " ".join(map(str, message))
+    return str(message).removeprefix("Prediction failed: ")
+
+def request_predictions(rows: list[dict]) -> list[float]:
+    """
+    Failure probabilities for a batch of feature rows from the stats
+    service. Rows the service rejects raise ValueError, as they do with the
+    in-process model; other failures raise RuntimeError or OSError.
+    """
+    request = urllib.request.Request(
+        f"{STATS_API_URL}/predict",
+        data=json.dumps(rows).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=300) as response:
+            body = response.read()
+    except urllib.error.HTTPError as e:
+        if 400 <= e.code < 500:
+            raise ValueError(stats_service_error(e.read()))
+        raise RuntimeError(f"Stats service returned {e.code}: {stats_service_error(e.read())}")
+    result = json.loads(body)
+    # The plumber API reports errors for the input in the body with a 200 status
+    if "error" in result:
+        raise ValueError(stats_service_error(body))
+    if result.get("n") != len(rows):
+        raise RuntimeError(f"Expected {len(rows)} predictions, got {result.get('n')}")
+    return [prediction["prob_failure"] for prediction in result["predictions"]]
+
+def predict(rows: list[dict]) -> list[float]:
+    """Failure probabilities for a batch of feature rows"""
+    model = get_failure_model()
+    if model is not None:
+        return model.predict(rows).tolist()
+    return request_predictions(rows)
+
+def sweep_delivery(features: dict, delivery_dows: list, lead_times: list, coinciding_deliveries: list) -> dict:
+    """
+    Failure probability of one order line across every delivery_dow x
+    lead_time x coinciding_delivery combination, scored as one batch;
+    options are listed lowest risk first
+    """
+    grid = list(itertools.product(delivery_dows, lead_times, coinciding_deliveries))
+    rows = [
+        {**features, "delivery_dow": dow, "lead_time": lead_time, "coinciding_delivery": coinciding}
+        for dow, lead_time, coinciding in grid
+    ]
+    # The line as ordered goes in the same batch
+    probs = predict([features] + rows)
+    options = [
+        {"delivery_dow": dow, "lead_time": lead_time, "coinciding_delivery": coinciding, "prob_failure": float(prob)}
+        for (dow, lead_time, coinciding), prob in zip(grid, probs[1:])
+    ]
+    options.sort(key=lambda option: option["prob_failure"])
+    return {"current": float(probs[0]), "n": len(options), "options": options}
+
+def score_orders(store: OrderStore, path: Path = PREDICTIONS_PATH) -> dict:
+    """Attach a failure probability to every order, scoring only feature rows not in the cache"""
+    start_time = time.perf_counter()
+    model = model_id()
+    rows, row_of_order = distinct_features(store)
+    keys = np.array([feature_key(row) for row in rows], dtype=np.uint64)
+
+    cached_keys, cached_prob = load_predictions(path, model)
+    prob = np.full(len(rows), np.nan, dtype=np.float32)
+    if len(cached_keys):
+        found = np.minimum(np.searchsorted(cached_keys, keys), len(cached_keys) - 1)
+        hit = cached_keys[found] == keys
+        prob[hit] = cached_prob[found[hit]]
+    missing = np.flatnonzero(np.isnan(prob))
+
+    scored = 0
+    try:
+        for start in range(0, len(missing), SCORING_BATCH_SIZE):
+            batch = missing[start:start + SCORING_BATCH_SIZE]
+            prob[batch] = predict([dict(zip(MODEL_FEATURES, rows[i])) for i in batch.tolist()])
+            scored += len(batch)
+    finally:
+        # Keep whatever was scored, even if the service failed part way
+        if scored:
+            new_keys = np.concatenate([cached_keys, keys[missing[:scored]]])
+            new_prob = np.concatenate([cached_prob, prob[missing[:scored]]])
+            save_predictions(path, model, new_keys, new_prob)
+        store.set_predictions(prob[row_of_order])
+
+    return {
+        "orders": len(store),
+        "distinct_features": len(rows),
+        "cached": len(rows) - len(missing),
+        "scored": scored,
+        "seconds": round(time.perf_counter() - start_time, 3),
+    }
+
+if __name__ == "__main__":
+    import orders_api
+
+    print(score_orders(orders_api.load_orders()))
@@ -0,0 +1,107 @@
+"""
+Binary snapshot of the processed orders.
+
+Parsing (and sampling) cleaned_data.csv takes seconds; the snapshot stores
+the resulting OrderStore columns in one .npz file (integer arrays, and the
+code arrays plus distinct values of dictionary-encoded strings) and loads
+in milliseconds. It records the load mode and the CSV's size, mtime and
+SHA-256: a snapshot is used only for the same mode, when the size matches
+and either the mtime matches or, if the file was touched or copied, the
+content hash does.
+
+Compare the two load paths:
+    python order_snapshot.py
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Optional
+import numpy as np
+from order_store import OrderStore
+
+# Bump when the column layout or the sampling in read_orders_csv() changes
+SNAPSHOT_FORMAT = 2
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def save_snapshot(path: Path, store: OrderStore, csv_path: Path, mode: str) -> None:
+    """Write the store's columns, tagged with the CSV and load mode they came from"""
+    stat = csv_path.stat()
+    meta = {
+        "format": SNAPSHOT_FORMAT,
+        "mode": mode,
+        "csv_size": stat.st_size,
+        "csv_mtime_ns": stat.st_mtime_ns,
+        "csv_sha256": file_sha256(csv_path),
+        "rows": len(store),
+    }
+    arrays = {"meta": np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8)}
+    for name, column in store.columns.items():
+        arrays[name] = column
+        if name in store.values:
+            arrays[f"{name}.values"] = np.array(store.values[name], dtype=str)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with tmp_path.open("wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+def load_snapshot(path: Path, csv_path: Path, mode: str) -> Optional[OrderStore]:
+    """The store from the snapshot, or None if it is missing, stale or unreadable"""
+    if not path.exists():
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(data["meta"].tobytes())
+            if meta.get("format") != SNAPSHOT_FORMAT or meta.get("mode") != mode:
+                return None
+            stat = csv_path.stat()
+            if stat.st_size != meta["csv_size"]:
+                return None
+            if stat.st_mtime_ns != meta["csv_mtime_ns"] and file_sha256(csv_path) != meta["csv_sha256"]:
+                return None
+
+            columns = {}
+            values = {}
+            for name in data.files:
+                if name == "meta":
+                    continue
+                if name.endswith(".values"):
+                    values[name[:-len(".values")]] = data[name].tolist()
+                else:
+                    columns[name] = data[name]
+    except Exception as e:
+        print(f"Warning: Could not read orders snapshot {path}: {e}")
+        return None
+    return OrderStore(columns, values)
+
+if __name__ == "__main__":
+    import time
+    import orders_api
+
+    mode = orders_api.ORDERS_MODE
+    start_time = time.perf_counter()
+    store = OrderStore.from_rows(orders_api.read_orders_csv(orders_api.CSV_PATH, full=mode == "full"))
+    csv_seconds = time.perf_counter() - start_time
+    save_snapshot(orders_api.ORDERS_SNAPSHOT_PATH, store, orders_api.CSV_PATH, mode)
+
+    start_time = time.perf_counter()
+    snapshot_store = load_snapshot(orders_api.ORDERS_SNAPSHOT_PATH, orders_api.CSV_PATH, mode)
+    snapshot_seconds = time.perf_counter() - start_time
+    assert all(np.array_equal(snapshot_store.columns[name], column) for name, column in store.columns.items())
+    assert snapshot_store.values == store.values, "Snapshot does not round-trip"
+
+    column_bytes = sum(column.nbytes for column in store.columns.values())
+    posting_bytes = sum(order.nbytes for order in store.posting_order.values())
+    print(f"CSV ({mode}): {len(store)} orders in {csv_seconds * 1000:,.1f}ms")
+    print(f"Snapshot: {len(snapshot_store)} orders in {snapshot_seconds * 1000:,.1f}ms "
+          f"({orders_api.ORDERS_SNAPSHOT_PATH.stat().st_size / 1e3:,.1f} kB)")
+    print(f"Memory: {column_bytes / 1e6:,.1f} MB of columns, {posting_bytes / 1e6:,.1f} MB of posting lists "
+          f"({(column_bytes + posting_bytes) / max(len(store), 1):,.1f} bytes per order)")
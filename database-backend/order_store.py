@@ -0,0 +1,371 @@
+"""
+In-memory order store for the Orders API.
+
+Orders are held column by column in NumPy arrays, in id order (the order
+with id N is at position N - 1, and ids are assigned in createdAt order).
+Strings are dictionary-encoded: each string column is an array of small
+integer codes into a sorted list of its distinct values. API dicts are
+built only for the orders actually returned, so the store scales from the
+2,000-order sample to the full history.
+
+Each filterable field has a posting list per value (a stable argsort of
+the column, split at value boundaries), and createdAt codes are sorted, so
+a single-filter page is a slice and a count is a subtraction; combined
+filters are evaluated vectorized over the most selective list only. Pages
+can be fetched with a keyset cursor (the last id seen) instead of an offset.
+
+Orders can also carry a predicted failure probability (order_scoring.py),
+kept beside the columns with a precomputed riskiest-first ordering, so
+pages can be sorted and filtered by prob_failure.
+
+Memory per million orders: about 29 MB of columns (1-2 byte codes for
+strings, int32 quantities) plus 20 MB of posting lists, against roughly
+1.4 GB for the same orders as Python dicts.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from typing import Iterable, Optional
+import numpy as np
+
+# Columns in row order: dictionary-encoded strings, or integers of the given dtype
+ORDER_FIELDS = {
+    "status": str,
+    "createdAt": str,
+    "product_code": str,
+    "order_qty": np.int32,
+    "sales_unit": str,
+    "plant": str,
+    "storage_location": str,
+    "order_dow": str,
+    "delivery_dow": str,
+    "lead_time": np.int32,
+    "month": str,
+    "coinciding_delivery": str,
+    "failure": np.int8,
+    "delivered_qty": np.int32,
+    "picking_picked_qty": np.int32,
+}
+STRING_FIELDS = tuple(name for name, kind in ORDER_FIELDS.items() if kind is str)
+
+# Fields with an exact-match filter, each backed by a posting list per value
+POSTING_FIELDS = ("status", "plant", "storage_location", "product_code", "failure")
+COUNT_CACHE_SIZE = 1024  # Combined-filter counts (and stats) remembered
+SCAN_CHUNK = 4096  # Candidate positions checked per step when combining filters
+
+# Breakdowns returned by stats(), and the lead time buckets (lower bounds in days)
+STATS_GROUPS = ("status", "plant", "order_dow", "delivery_dow", "month", "lead_time")
+LEAD_TIME_BUCKETS = (0, 1, 2, 3, 5, 8)
+LEAD_TIME_LABELS = ("0", "1", "2", "3-4", "5-7", "8+")
+
+def next_day(day: str) -> str:
+    """ISO date of the day after an ISO date"""
+    return (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+
+def code_dtype(n_values: int):
+    """Smallest unsigned integer type that can index n_values"""
+    return np.min_scalar_type(max(n_values - 1, 0))
+
+class OrderStore:
+    def __init__(self, columns: dict, values: dict):
+        """
+        columns: field -> array in id order (codes for string fields)
+        values: string field -> sorted distinct values
+        """
+        self.columns = columns
+        self.values = values
+        self.size = len(columns["status"])
+        self.count_cache = {}
+        self.stats_cache = {}
+        # (prob_failure, positions riskiest first, rank of each position in that order);
+        # NaN until the orders are scored
+        self.risk = (np.full(self.size, np.nan, dtype=np.float32),
+                     np.arange(self.size, dtype=np.int32), np.arange(self.size, dtype=np.int32))
+
+        # Posting lists: positions grouped by value, ascending within each group
+        self.posting_keys = {}  # field -> value -> group number
+        self.posting_order = {}  # field -> positions sorted by value (stable)
+        self.posting_bounds = {}  # field -> start of each group in posting_order
+        for field in POSTING_FIELDS:
+            if field in values:
+                keys, codes = values[field], columns[field]
+            else:
+                unique, codes = np.unique(columns[field], return_inverse=True)
+                keys = unique.tolist()
+            order = np.argsort(codes, kind="stable").astype(np.int32)
+            self.posting_keys[field] = {key: group for group, key in enumerate(keys)}
+            self.posting_order[field] = order
+            self.posting_bounds[field] = np.searchsorted(codes[order], np.arange(len(keys) + 1))
+
+    def __len__(self) -> int:
+        return self.size
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[tuple]) -> "OrderStore":
+        """
+        Build the store from rows of ORDER_FIELDS values. Strings are encoded
+        while reading, so no per-row objects outlive the loop; rows are then
+        ordered by createdAt (keeping input order for equal dates).
+        """
+        builders = [array("q") for _ in ORDER_FIELDS]
+        lookups = {name: {} for name in STRING_FIELDS}
+        encoders = [lookups.get(name) for name in ORDER_FIELDS]
+        for row in rows:
+            for builder, encoder, value in zip(builders, encoders, row):
+                if encoder is not None:
+                    value = encoder.setdefault(value, len(encoder))
+                builder.append(value)
+
+        columns = {}
+        values = {}
+        for (name, kind), builder in zip(ORDER_FIELDS.items(), builders):
+            column = np.frombuffer(builder, dtype=np.int64) if len(builder) else np.empty(0, dtype=np.int64)
+            if kind is str:
+                # Renumber the codes so they follow the sorted value order
+                first_seen = list(lookups[name])
+                rank = np.empty(len(first_seen), dtype=np.int64)
+                rank[np.argsort(np.array(first_seen, dtype=object))] = np.arange(len(first_seen))
+                values[name] = sorted(first_seen)
+                columns[name] = rank[column].astype(code_dtype(len(first_seen)))
+            else:
+                columns[name] = column.astype(kind)
+
+        by_date = np.argsort(columns["createdAt"], kind="stable")
+        if np.any(by_date != np.arange(len(by_date))):
+            columns = {name: column[by_date] for name, column in columns.items()}
+        return cls(columns, values)
+
+    def set_predictions(self, prob_failure: np.ndarray) -> None:
+        """Attach failure probabilities (NaN for unscored orders, which sort last)"""
+        prob_failure = np.asarray(prob_failure, dtype=np.float32)
+        order = np.argsort(-prob_failure, kind="stable").astype(np.int32)
+        rank = np.empty(self.size, dtype=np.int32)
+        rank[order] = np.arange(self.size, dtype=np.int32)
+        self.risk = (prob_failure, order, rank)
+        self.count_cache = {}
+        self.stats_cache = {}
+
+    def value(self, field: str, position: int):
+        """One field of one order, decoded"""
+        if field in self.values:
+            return self.values[field][self.columns[field][position]]
+        return int(self.columns[field][position])
+
+    def order_number(self, position: int) -> str:
+        return f"ORD-{self.value('product_code', position)}-{position + 1:06d}"
+
+    def to_order(self, position: int) -> dict:
+        """The API representation of an order"""
+        fields = {name: self.value(name, position) for name in ORDER_FIELDS}
+        prob_failure = self.risk[0][position]
+        order_id = str(position + 1)
+        return {
+            "id": order_id,
+            "orderNumber": self.order_number(position),
+            "customer": f"Customer-{fields['plant']}",
+            "destination": f"Plant {fields['plant']}, Storage {fields['storage_location']}",
+            "items": [{
+                "id": order_id,
+                "name": f"Product {fields['product_code']}",
+                "quantity": fields["order_qty"],
+                "sku": fields["product_code"]
+            }],
+            "totalValue": fields["order_qty"] * 10,  # Mock value
+            **fields,
+            "prob_failure": None if np.isnan(prob_failure) else float(prob_failure),
+        }
+
+    def position(self, order_id: str) -> Optional[int]:
+        """Position of an order by id or orderNumber (both encode the position)"""
+        number = order_id.rpartition("-")[2] if order_id.startswith("ORD-") else order_id
+        if not number.isdigit():
+            return None
+        position = int(number) - 1
+        if not 0 <= position < self.size:
+            return None
+        if number != order_id and self.order_number(position) != order_id:
+            return None
+        return position
+
+    def plan(self, filters: dict, sort: Optional[str] = None):
+        """
+        Candidate positions (an array or a range) and a vectorized check for
+        the filters they do not already satisfy. In id order the smallest
+        posting list or date range drives the scan; sorted by prob_failure,
+        the riskiest-first ordering does and every filter is checked.
+        """
+        candidates = []
+        checks = []
+        for field in POSTING_FIELDS:
+            if field not in filters:
+                continue
+            group = self.posting_keys[field].get(filters[field])
+            if group is None:
+                return range(0), None
+            start, end = self.posting_bounds[field][group:group + 2]
+            postings = self.posting_order[field][start:end]
+            candidates.append((postings, field))
+            checks.append((field, self.columns[field][postings[0]]))
+
+        created_from = filters.get("created_from")
+        created_to = filters.get("created_to")
+        date_codes = None
+        if created_from or created_to:
+            # createdAt codes are sorted, so a date range is a run of positions
+            dates = self.values["createdAt"]
+            date_codes = (bisect_left(dates, created_from) if created_from else 0,
+                          bisect_left(dates, next_day(created_to)) if created_to else len(dates))
+            low, high = np.searchsorted(self.columns["createdAt"], date_codes).tolist()
+            candidates.append((range(low, max(low, high)), "createdAt"))
+        min_prob = filters.get("min_prob_failure")
+        max_prob = filters.get("max_prob_failure")
+        prob_range = (min_prob, max_prob) if min_prob is not None or max_prob is not None else None
+
+        if sort == "prob_failure":
+            positions, driver = self.risk[1], None
+        elif candidates:
+            positions, driver = min(candidates, key=lambda candidate: len(candidate[0]))
+        else:
+            positions, driver = range(self.size), None
+        checks = [(field, code) for field, code in checks if field != driver]
+        if driver == "createdAt":
+            date_codes = None
+        if not checks and date_codes is None and prob_range is None:
+            return positions, None
+        prob_failure = self.risk[0]
+
+        def matches(block: np.ndarray) -> np.ndarray:
+            mask = np.ones(len(block), dtype=bool)
+            for field, code in checks:
+                mask &= self.columns[field][block] == code
+            if date_codes is not None:
+                created = self.columns["createdAt"][block]
+                mask &= (created >= date_codes[0]) & (created < date_codes[1])
+            if prob_range is not None:
+                # Unscored orders (NaN) match no probability range
+                prob = prob_failure[block]
+                if prob_range[0] is not None:
+                    mask &= prob >= prob_range[0]
+                if prob_range[1] is not None:
+                    mask &= prob <= prob_range[1]
+            return mask
+        return positions, matches
+
+    def select(self, filters: dict, offset: int = 0, limit: int = 100,
+               cursor: Optional[str] = None, sort: Optional[str] = None) -> tuple[np.ndarray, bool]:
+        """
+        Positions of one page of matching orders, and whether more follow.
+        With a cursor (the id of the last order already seen) the scan starts
+        right after it, whatever the page depth.
+        """
+        positions, matches = self.plan(filters, sort)
+        start = 0
+        if cursor is not None:
+            cursor_position = self.position(cursor)
+            if cursor_position is None:
+                raise KeyError(cursor)
+            if sort == "prob_failure":
+                start = int(self.risk[2][cursor_position]) + 1
+            else:
+                start = bisect_right(positions, cursor_position)
+
+        # One extra match is fetched to tell whether another page exists
+        wanted = offset + limit + 1
+        if matches is None:
+            selected = np.asarray(positions[start + offset:start + wanted], dtype=np.int64)
+        else:
+            found = []
+            n_found = 0
+            chunk = max(SCAN_CHUNK, 2 * wanted)
+            while start < len(positions) and n_found < wanted:
+                block = np.asarray(positions[start:start + chunk], dtype=np.int64)
+                hits = block[matches(block)]
+                found.append(hits)
+                n_found += len(hits)
+                start += chunk
+                chunk *= 2
+            selected = np.concatenate(found)[offset:wanted] if found else np.empty(0, dtype=np.int64)
+        return selected[:limit], len(selected) > limit
+
+    def page(self, filters: dict, offset: int = 0, limit: int = 100,
+             cursor: Optional[str] = None, sort: Optional[str] = None) -> tuple[list[dict], Optional[str]]:
+        """
+        One page of matching orders, in id order or riskiest first
+        (sort="prob_failure"), and the cursor for the next page (None on the last page)
+        """
+        selected, more = self.select(filters, offset, limit, cursor, sort)
+        orders = [self.to_order(position) for position in selected.tolist()]
+        return orders, (orders[-1]["id"] if more else None)
+
+    def matching(self, filters: dict):
+        """Positions of every matching order, or a full slice when nothing is filtered"""
+        if not filters:
+            return slice(None)
+        positions, matches = self.plan(filters)
+        positions = np.asarray(positions, dtype=np.int64)
+        return positions if matches is None else positions[matches(positions)]
+
+    def stats(self, filters: dict) -> dict:
+        """
+        Order counts, failure rates and ordered/delivered quantities, overall
+        and grouped by each of STATS_GROUPS, for the matching orders. Each
+        breakdown is a bincount over the group's codes. Results are cached
+        for the lifetime of the store, i.e. until the orders are reloaded.
+        """
+        key = tuple(sorted(filters.items()))
+        if key in self.stats_cache:
+            return self.stats_cache[key]
+
+        selected = self.matching(filters)
+        failure = self.columns["failure"][selected].astype(np.float64)
+        order_qty = self.columns["order_qty"][selected].astype(np.float64)
+        delivered_qty = self.columns["delivered_qty"][selected].astype(np.float64)
+
+        def summary(count, failures, ordered, delivered) -> dict:
+            return {
+                "count": int(count),
+                "failures": int(failures),
+                "failure_rate": failures / count if count else 0.0,
+                "order_qty": int(ordered),
+                "delivered_qty": int(delivered),
+                "delivery_rate": delivered / ordered if ordered else 0.0,
+            }
+
+        result = summary(len(failure), failure.sum(), order_qty.sum(), delivered_qty.sum())
+        result["by"] = {}
+        for field in STATS_GROUPS:
+            if field == "lead_time":
+                codes = np.searchsorted(LEAD_TIME_BUCKETS, self.columns[field][selected], side="right") - 1
+                codes = np.maximum(codes, 0)
+                labels = LEAD_TIME_LABELS
+            else:
+                codes = self.columns[field][selected]
+                labels = self.values[field]
+            totals = [np.bincount(codes, weights=weights, minlength=len(labels))
+                      for weights in (None, failure, order_qty, delivered_qty)]
+            result["by"][field] = [
+                {"value": label, **summary(*(total[group] for total in totals))}
+                for group, label in enumerate(labels) if totals[0][group]
+            ]
+
+        if len(self.stats_cache) >= COUNT_CACHE_SIZE:
+            self.stats_cache.clear()
+        self.stats_cache[key] = result
+        return result
+
+    def count(self, filters: dict) -> int:
+        """Number of matching orders; O(1) for a single filter, cached otherwise"""
+        positions, matches = self.plan(filters)
+        if matches is None:
+            return len(positions)
+        key = tuple(sorted(filters.items()))
+        if key not in self.count_cache:
+            if len(self.count_cache) >= COUNT_CACHE_SIZE:
+                self.count_cache.clear()
+            self.count_cache[key] = int(matches(np.asarray(positions, dtype=np.int64)).sum())
+        return self.count_cache[key]
+
+    def get(self, order_id: str) -> Optional[dict]:
+        """Look up an order by id or orderNumber"""
+        position = self.position(order_id)
+        return self.to_order(position) if position is not None else None
@@ -1,15 +1,23 @@
 """
 API endpoint for orders from cleaned_data.csv
 """
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 import csv
+import hashlib
 import os
+import threading
+import time
 import dotenv
+import numpy as np
 from pathlib import Path
-from datetime import datetime
+from datetime import date, datetime, timezone
+from http_cache import DataVersion, add_compression, cache_headers, is_not_modified, not_modified
+from order_store import OrderStore
+from order_snapshot import load_snapshot, save_snapshot
+from order_scoring import MODEL_FEATURES, predict, score_orders, sweep_delivery
 
 dotenv.load_dotenv()
 
@@ -22,129 +30,209 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
+add_compression(app)
 
-# Load orders from CSV
-orders_cache = None
-
-def load_orders():
-    """Load and sample orders from cleaned_data.csv"""
-    global orders_cache
-    if orders_cache is None:
-        csv_path = Path(__file__).parent.parent / "stats-backend" / "cleaned_data.csv"
-        orders_cache = []
-        
-        # Sample configuration
-        SAMPLE_SIZE = 2000  # Total orders to sample
-        FAILURE_SAMPLE_SIZE = 500  # Ensure we get enough failed orders
-        ACTION_REQUIRED_SAMPLE_SIZE = 500  # Orders with partial delivery
-        COMPLETED_SAMPLE_SIZE = 1000  # Completed orders
-        
-        print(f"Sampling orders from {csv_path}...")
-        
-        # First pass: collect all rows and categorize them
-        all_rows = []
-        failure_rows = []
-        action_required_rows = []
-        completed_rows = []
-        
-        with csv_path.open("r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for idx, row in enumerate(reader):
-                try:
-                    # Handle float values that might be in CSV
-                    failure = int(float(row.get("failure", "0")))
-                    delivered_qty = int(float(row.get("delivered_qty", "0")))
-                    order_qty = int(float(row.get("order_qty", "0")))
-                    
-                    # Categorize the order
-                    if failure == 1:
-                        failure_rows.append((idx, row))
-                    elif delivered_qty < order_qty:
-                        action_required_rows.append((idx, row))
-                    else:
-                        completed_rows.append((idx, row))
-                    
-                    all_rows.append((idx, row))
-                except Exception as e:
-                    continue
-        
-        print(f"Found {len(failure_rows)} failures, {len(action_required_rows)} action required, {len(completed_rows)} completed")
-        
-        # Sample from each category
-        import random
-        random.seed(42)  # For reproducible sampling
-        
-        sampled_failures = random.sample(failure_rows, min(FAILURE_SAMPLE_SIZE, len(failure_rows)))
-        sampled_action = random.sample(action_required_rows, min(ACTION_REQUIRED_SAMPLE_SIZE, len(action_required_rows)))
-        sampled_completed = random.sample(completed_rows, min(COMPLETED_SAMPLE_SIZE, len(completed_rows)))
-        
-        # Combine and process sampled orders
-        sampled_rows = sampled_failures + sampled_action + sampled_completed
-        
-        # Sort by order date for better ordering
-        sampled_rows.sort(key=lambda x: x[1].get("order_created_date", ""))
-        
-        order_id_counter = 1
-        for idx, row in sampled_rows:
+# Load orders from CSV, or from the snapshot written after the last CSV load
+CSV_PATH = Path(__file__).parent.parent / "stats-backend" / "cleaned_data.csv"
+ORDERS_SNAPSHOT_PATH = Path(os.getenv("ORDERS_SNAPSHOT_PATH", str(Path(__file__).parent / "orders_snapshot.npz")))
+# "sample" (2,000 orders across the three statuses) or "full" (every row of the CSV)
+ORDERS_MODE = os.getenv("ORDERS_MODE", "sample")
+orders_store = None
+orders_version = None  # DataVersion of the loaded orders and their failure probabilities
+
+def parse_order_row(row: dict) -> tuple:
+    """One CSV row as a tuple of ORDER_FIELDS values"""
+    # Parse dates
+    order_date = datetime.strptime(row["order_created_date"], "%Y-%m-%d")
+    datetime.strptime(row["requested_delivery_date"], "%Y-%m-%d")
+    
+    # Determine status based on failure
+    failure = int(float(row.get("failure", "0")))
+    delivered_qty = int(float(row.get("delivered_qty", "0")))
+    order_qty = int(float(row.get("order_qty", "0")))
+    
+    if failure == 1:
+        status = "support_required"
+    elif delivered_qty < order_qty:
+        status = "action_required"
+    else:
+        status = "completed"
+    
+    # Display fields (orderNumber, items, ...) are derived by the store
+    return (
+        status,
+        order_date.isoformat(),
+        row["product_code"],
+        order_qty,
+        row["sales_unit"],
+        str(row["plant"]),
+        str(row["storage_location"]),
+        row["order_dow"],
+        row["delivery_dow"],
+        int(float(row["lead_time"])),
+        row["month"].split("-")[1] if "-" in row["month"] else row["month"],
+        str(row.get("coinciding_delivery", "0")),
+        failure,
+        delivered_qty,
+        int(float(row.get("picking_picked_qty", "0"))),
+    )
+
+def read_all_orders_csv(csv_path: Path):
+    """Every order in cleaned_data.csv, as rows for OrderStore.from_rows"""
+    print(f"Reading all orders from {csv_path}...")
+    skipped = 0
+    with csv_path.open("r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
             try:
-                # Parse dates
-                order_date = datetime.strptime(row["order_created_date"], "%Y-%m-%d")
-                delivery_date = datetime.strptime(row["requested_delivery_date"], "%Y-%m-%d")
-                
-                # Determine status based on failure
+                parsed = parse_order_row(row)
+            except Exception:
+                skipped += 1
+                continue
+            yield parsed
+    if skipped:
+        print(f"Skipped {skipped} rows that could not be parsed")
+
+def read_orders_csv(csv_path: Path, full: bool = False):
+    """Sample orders from cleaned_data.csv (or read them all), as rows for OrderStore.from_rows"""
+    if full:
+        yield from read_all_orders_csv(csv_path)
+        return
+    
+    # Sample configuration
+    SAMPLE_SIZE = 2000  # Total orders to sample
+    FAILURE_SAMPLE_SIZE = 500  # Ensure we get enough failed orders
+    ACTION_REQUIRED_SAMPLE_SIZE = 500  # Orders with partial delivery
+    COMPLETED_SAMPLE_SIZE = 1000  # Completed orders
+    
+    print(f"Sampling orders from {csv_path}...")
+    
+    # First pass: collect all rows and categorize them
+    failure_rows = []
+    action_required_rows = []
+    completed_rows = []
+    
+    with csv_path.open("r", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        for idx, row in enumerate(reader):
+            try:
+                # Handle float values that might be in CSV
                 failure = int(float(row.get("failure", "0")))
                 delivered_qty = int(float(row.get("delivered_qty", "0")))
                 order_qty = int(float(row.get("order_qty", "0")))
                 
+                # Categorize the order
                 if failure == 1:
-                    status = "support_required"
+                    failure_rows.append((idx, row))
                 elif delivered_qty < order_qty:
-                    status = "action_required"
+                    action_required_rows.append((idx, row))
                 else:
-                    status = "completed"
-                
-                # Get product name from product code if possible
-                product_code = row["product_code"]
-                product_name = f"Product {product_code}"
-                
-                order = {
-                    "id": str(order_id_counter),
-                    "orderNumber": f"ORD-{product_code}-{order_id_counter:06d}",
-                    "customer": f"Customer-{row['plant']}",
-                    "destination": f"Plant {row['plant']}, Storage {row['storage_location']}",
-                    "status": status,
-                    "items": [{
-                        "id": str(order_id_counter),
-                        "name": product_name,
-                        "quantity": order_qty,
-                        "sku": product_code
-                    }],
-                    "totalValue": order_qty * 10,  # Mock value
-                    "createdAt": order_date.isoformat(),
-                    "product_code": product_code,
-                    "order_qty": order_qty,
-                    "sales_unit": row["sales_unit"],
-                    "plant": str(row["plant"]),
-                    "storage_location": str(row["storage_location"]),
-                    "order_dow": row["order_dow"],
-                    "delivery_dow": row["delivery_dow"],
-                    "lead_time": int(float(row["lead_time"])),
-                    "month": row["month"].split("-")[1] if "-" in row["month"] else row["month"],
-                    "coinciding_delivery": str(row.get("coinciding_delivery", "0")),
-                    "failure": failure,
-                    "delivered_qty": delivered_qty,
-                    "picking_picked_qty": int(float(row.get("picking_picked_qty", "0"))),
-                }
-                orders_cache.append(order)
-                order_id_counter += 1
+                    completed_rows.append((idx, row))
             except Exception as e:
-                print(f"Error parsing row {idx + 1}: {e}")
                 continue
-        
-        print(f"Sampled {len(orders_cache)} orders ({len(sampled_failures)} failures, {len(sampled_action)} action required, {len(sampled_completed)} completed)")
     
-    return orders_cache
+    print(f"Found {len(failure_rows)} failures, {len(action_required_rows)} action required, {len(completed_rows)} completed")
+    
+    # Sample from each category
+    import random
+    random.seed(42)  # For reproducible sampling
+    
+    sampled_failures = random.sample(failure_rows, min(FAILURE_SAMPLE_SIZE, len(failure_rows)))
+    sampled_action = random.sample(action_required_rows, min(ACTION_REQUIRED_SAMPLE_SIZE, len(action_required_rows)))
+    sampled_completed = random.sample(completed_rows, min(COMPLETED_SAMPLE_SIZE, len(completed_rows)))
+    
+    # Combine and process sampled orders
+    sampled_rows = sampled_failures + sampled_action + sampled_completed
+    
+    # Sort by order date for better ordering
+    sampled_rows.sort(key=lambda x: x[1].get("order_created_date", ""))
+    
+    for idx, row in sampled_rows:
+        try:
+            yield parse_order_row(row)
+        except Exception as e:
+            print(f"Error parsing row {idx + 1}: {e}")
+            continue
+    
+    print(f"Sampled {len(sampled_rows)} orders ({len(sampled_failures)} failures, {len(sampled_action)} action required, {len(sampled_completed)} completed)")
+
+def load_orders() -> OrderStore:
+    """Load the orders, from the snapshot when it matches the CSV"""
+    global orders_store
+    if orders_store is None:
+        start_time = time.perf_counter()
+        store = load_snapshot(ORDERS_SNAPSHOT_PATH, CSV_PATH, ORDERS_MODE)
+        if store is not None:
+            source = f"snapshot {ORDERS_SNAPSHOT_PATH}"
+        else:
+            store = OrderStore.from_rows(read_orders_csv(CSV_PATH, full=ORDERS_MODE == "full"))
+            source = f"CSV {CSV_PATH}"
+            try:
+                save_snapshot(ORDERS_SNAPSHOT_PATH, store, CSV_PATH, ORDERS_MODE)
+            except OSError as e:
+                print(f"Warning: Could not write orders snapshot: {e}")
+        update_orders_version(store)
+        orders_store = store
+        print(f"Loaded {len(orders_store)} orders ({ORDERS_MODE}) from {source} in {(time.perf_counter() - start_time) * 1000:,.1f}ms")
+    
+    return orders_store
+
+def update_orders_version(store: OrderStore) -> None:
+    """
+    New version for conditional GETs (http_cache.py) after the orders or their
+    failure probabilities changed: a hash of the CSV it was loaded from and of
+    the probabilities, so a restart that loads the same data keeps the ETag
+    """
+    global orders_version
+    digest = hashlib.blake2b(digest_size=8)
+    try:
+        stat = CSV_PATH.stat()
+        digest.update(f"{stat.st_mtime_ns}:{stat.st_size}".encode())
+    except OSError:
+        pass  # CSV removed since the load (the snapshot is only used when it matches the CSV)
+    digest.update(f"{ORDERS_MODE}:{len(store)}".encode())
+    digest.update(store.risk[0].tobytes())
+    orders_version = DataVersion(digest.hexdigest(), datetime.now(timezone.utc))
+
+def check_orders_version(request: Request, response: Response) -> Optional[Response]:
+    """Not Modified if the client has the current version of the orders; otherwise tag the response with it"""
+    load_orders()
+    version = orders_version
+    if is_not_modified(request, version):
+        return not_modified(version)
+    response.headers.update(cache_headers(version))
+    return None
+
+# Failure-risk scoring against the stats service (see order_scoring.py)
+ORDERS_SCORING = os.getenv("ORDERS_SCORING", "1") == "1"
+scoring_lock = threading.Lock()
+
+def score_loaded_orders() -> Optional[dict]:
+    """Score every loaded order; returns None if the stats service could not be reached"""
+    with scoring_lock:
+        try:
+            result = score_orders(load_orders())
+        except Exception as e:
+            print(f"WARNING: Could not score orders (cached predictions are still used): {e}")
+            return None
+        finally:
+            # Whatever was scored is attached to the orders, even after a failure
+            if orders_store is not None:
+                update_orders_version(orders_store)
+    print(f"Scored orders: {result}")
+    return result
+
+@app.on_event("startup")
+def preload_orders():
+    """Load at startup so the first request does not pay for it, then score the orders in the background"""
+    try:
+        load_orders()
+    except Exception as e:
+        print(f"WARNING: Could not load orders at startup: {e}")
+        return
+    if ORDERS_SCORING:
+        threading.Thread(target=score_loaded_orders, daemon=True).start()
 
 class OrderResponse(BaseModel):
     id: str
@@ -168,54 +256,164 @@ class OrderResponse(BaseModel):
     failure: Optional[int] = None
     delivered_qty: Optional[int] = None
     picking_picked_qty: Optional[int] = None
+    prob_failure: Optional[float] = None
 
 @app.get("/")
 def root():
     return {"message": "Orders API", "status": "ok"}
 
+def order_filters(
+    status: Optional[str] = Query(None, description="Filter by status"),
+    plant: Optional[str] = Query(None),
+    storage_location: Optional[str] = Query(None),
+    product_code: Optional[str] = Query(None),
+    failure: Optional[int] = Query(None, ge=0, le=1),
+    created_from: Optional[date] = Query(None, description="First order date (inclusive)"),
+    created_to: Optional[date] = Query(None, description="Last order date (inclusive)"),
+    min_prob_failure: Optional[float] = Query(None, ge=0, le=1),
+    max_prob_failure: Optional[float] = Query(None, ge=0, le=1),
+) -> dict:
+    """Filters shared by /orders, /orders/count and /orders/stats; unset ones are left out"""
+    filters = {
+        "status": status if status != "all" else None,
+        "plant": plant,
+        "storage_location": storage_location,
+        "product_code": product_code,
+        "failure": failure,
+        "created_from": created_from.isoformat() if created_from else None,
+        "created_to": created_to.isoformat() if created_to else None,
+        "min_prob_failure": min_prob_failure,
+        "max_prob_failure": max_prob_failure,
+    }
+    return {field: value for field, value in filters.items() if value is not None}
+
 @app.get("/orders", response_model=List[OrderResponse])
 def get_orders(
+    request: Request,
+    response: Response,
     limit: int = Query(100, ge=1, le=10000),
     offset: int = Query(0, ge=0),
-    status: Optional[str] = Query(None, description="Filter by status")
+    cursor: Optional[str] = Query(None, description="Id of the last order of the previous page (X-Next-Cursor)"),
+    sort: Optional[str] = Query(None, pattern="^(id|prob_failure)$", description="id (default) or prob_failure (riskiest first)"),
+    filters: dict = Depends(order_filters),
 ):
     """Get list of orders"""
-    orders = load_orders()
-    
-    # Filter by status if provided
-    if status and status != "all":
-        orders = [o for o in orders if o["status"] == status]
-    
-    # Apply pagination
-    return orders[offset:offset+limit]
+    cached = check_orders_version(request, response)
+    if cached is not None:
+        return cached
+    # Only the orders on the requested page are built
+    try:
+        orders, next_cursor = load_orders().page(filters, offset, limit, cursor, sort)
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor {cursor}")
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return orders
 
 @app.get("/orders/count")
-def get_orders_count(status: Optional[str] = Query(None)):
+def get_orders_count(request: Request, response: Response, filters: dict = Depends(order_filters)):
     """Get total number of orders"""
-    orders = load_orders()
-    if status and status != "all":
-        orders = [o for o in orders if o["status"] == status]
-    return {"count": len(orders)}
+    cached = check_orders_version(request, response)
+    if cached is not None:
+        return cached
+    return {"count": load_orders().count(filters)}
+
+@app.get("/orders/stats")
+def get_orders_stats(request: Request, response: Response, filters: dict = Depends(order_filters)):
+    """Counts, failure rates and quantities by status, plant, weekday, month and lead time"""
+    cached = check_orders_version(request, response)
+    if cached is not None:
+        return cached
+    return load_orders().stats(filters)
+
+@app.post("/orders/score")
+def rescore_orders():
+    """Score orders the prediction cache does not cover yet (e.g. after the stats service was down)"""
+    result = score_loaded_orders()
+    if result is None:
+        raise HTTPException(status_code=503, detail="Stats service not available")
+    return result
+
+@app.post("/orders/predict")
+def predict_failure(rows: List[Dict[str, Any]]):
+    """
+    Failure probabilities for order lines, with the same request and response
+    as the stats service's POST /predict; scored in-process when the model is exported
+    """
+    try:
+        probs = predict(rows)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Prediction failed: {e}")
+    return {
+        "n": len(probs),
+        "predictions": [
+            {"prob_failure": prob, "predicted_failure": int(prob >= 0.5)}
+            for prob in probs
+        ],
+    }
+
+MAX_SWEEP_OPTIONS = 2000
+
+class DeliverySweepRequest(BaseModel):
+    order: Dict[str, Any]  # Model features, as for /orders/predict
+    delivery_dow: Optional[List[str]] = None
+    lead_time: Optional[List[int]] = None
+    coinciding_delivery: Optional[List[str]] = None
+
+def run_delivery_sweep(features: dict, delivery_dow: Optional[List[str]], lead_time: Optional[List[int]],
+                       coinciding_delivery: Optional[List[str]]) -> dict:
+    """Sweep the given values, defaulting to every value seen in the orders"""
+    store = load_orders()
+    delivery_dow = delivery_dow or store.values["delivery_dow"]
+    lead_time = lead_time or np.unique(store.columns["lead_time"]).tolist()
+    coinciding_delivery = coinciding_delivery or store.values["coinciding_delivery"]
+    n_options = len(delivery_dow) * len(lead_time) * len(coinciding_delivery)
+    if n_options > MAX_SWEEP_OPTIONS:
+        raise HTTPException(status_code=400, detail=f"Sweep has {n_options} options, at most {MAX_SWEEP_OPTIONS} allowed")
+    try:
+        return sweep_delivery(features, delivery_dow, lead_time, coinciding_delivery)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Prediction failed: {e}")
+
+@app.post("/orders/predict/sweep")
+def predict_delivery_sweep(request: DeliverySweepRequest):
+    """Failure risk of an order line for every delivery day, lead time and coinciding delivery"""
+    return run_delivery_sweep(request.order, request.delivery_dow, request.lead_time, request.coinciding_delivery)
+
+@app.get("/orders/{order_id}/delivery-sweep")
+def get_delivery_sweep(
+    order_id: str,
+    delivery_dow: Optional[List[str]] = Query(None),
+    lead_time: Optional[List[int]] = Query(None),
+    coinciding_delivery: Optional[List[str]] = Query(None),
+):
+    """Failure risk of a stored order for every delivery day, lead time and coinciding delivery"""
+    store = load_orders()
+    position = store.position(order_id)
+    if position is None:
+        raise HTTPException(status_code=404, detail=f"Order {order_id} not found")
+    features = {name: store.value(name, position) for name in MODEL_FEATURES}
+    return {"id": str(position + 1), **run_delivery_sweep(features, delivery_dow, lead_time, coinciding_delivery)}
 
 @app.get("/orders/{order_id}", response_model=OrderResponse)
-def get_order(order_id: str):
+def get_order(request: Request, response: Response, order_id: str):
     """Get a single order by ID"""
     # Don't match "count" as an order ID
     if order_id == "count":
         raise HTTPException(status_code=404, detail="Use /orders/count endpoint")
     
-    orders = load_orders()
-    try:
-        idx = int(order_id) - 1
-        if 0 <= idx < len(orders):
-            return orders[idx]
-    except:
-        pass
-    
-    # Try to find by orderNumber
-    for order in orders:
-        if order["orderNumber"] == order_id or order["id"] == order_id:
-            return order
+    cached = check_orders_version(request, response)
+    if cached is not None:
+        return cached
+    
+    # Hash lookup by id or orderNumber
+    order = load_orders().get(order_id)
+    if order is not None:
+        return order
     
     raise HTTPException(status_code=404, detail=f"Order {order_id} not found")
 
@@ -1,12 +1,19 @@
 """
 Populate the products table from the JSON file.
 This creates a searchable database table for faster product queries.
+
+The catalog is parsed incrementally and streamed into a staging table with
+COPY, then merged into products in a single transaction.
 """
 import json
 import os
+import resource
+import time
 import dotenv
 from pathlib import Path
+import ijson
 import psycopg
+from product_summary import DERIVED_FIELDS, SUMMARY_FIELDS, product_summary
 
 # Load .env from parent directory
 env_path = Path(__file__).parent.parent / ".env"
@@ -58,72 +65,106 @@ except (psycopg.OperationalError, ValueError) as e:
         print("4. Or run as postgres user: sudo -u postgres python3 populate_products_table.py")
         raise
 
+PRODUCT_COLUMNS = ("gtin", "name", "vendor_name", "country_of_origin", "category", "brand", "sales_unit", "base_unit", "summary", "product_data")
+
+def iter_products(product_data_path: Path):
+    """Stream products from the catalog file one at a time instead of json.load-ing the whole list"""
+    with product_data_path.open("rb") as f:
+        # use_float keeps numbers as floats (not Decimal) so json.dumps works
+        yield from ijson.items(f, "item", use_float=True)
+
 def populate_products_table():
     product_data_path = Path(__file__).parent / "valio_aimo_product_data_junction_2025.json"
     
-    print("Loading product data...")
-    with product_data_path.open("r", encoding="utf-8") as f:
-        product_data = json.load(f)
-    
-    print(f"Loaded {len(product_data)} products")
+    print(f"Streaming product data from {product_data_path.name} (ijson backend: {ijson.backend})...")
     print("Populating products table...")
     
-    with conn.cursor() as cur:
-        # Clear existing data
-        cur.execute("TRUNCATE TABLE products")
-        
-        inserted = 0
-        skipped = 0
-        
-        for idx, prod in enumerate(product_data):
-            if (idx + 1) % 1000 == 0:
-                print(f"Processed {idx + 1} / {len(product_data)} products...")
+    start_time = time.time()
+    loaded = 0
+    skipped = 0
+    
+    # Everything happens in one transaction: rows are COPYed into a temp
+    # staging table and merged into products with a single statement, so
+    # readers keep seeing the previous contents until the commit and never
+    # an empty (truncated) table.
+    with conn.transaction():
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TEMP TABLE products_staging (LIKE products INCLUDING DEFAULTS) ON COMMIT DROP
+            """)
+            # Load order, so the last duplicate GTIN wins like the old row-by-row upsert
+            cur.execute("ALTER TABLE products_staging ADD COLUMN seq BIGINT")
+            
+            columns = ", ".join(PRODUCT_COLUMNS)
+            with cur.copy(f"COPY products_staging ({columns}, seq) FROM STDIN") as copy:
+                for idx, prod in enumerate(iter_products(product_data_path)):
+                    if (idx + 1) % 1000 == 0:
+                        print(f"Processed {idx + 1} products...")
+                    
+                    synkka = prod.get("synkkaData", {})
+                    gtin = (
+                        prod.get("salesUnitGtin") or 
+                        synkka.get("gtin") or 
+                        prod.get("gtin")
+                    )
+                    
+                    if not gtin or not str(gtin).isdigit():
+                        skipped += 1
+                        continue
+                    
+                    # Summary columns, plus the derived fields as the summary document
+                    summary = product_summary(prod)
+                    copy.write_row((
+                        gtin,
+                        *(summary[field] for field in SUMMARY_FIELDS if field not in DERIVED_FIELDS),
+                        json.dumps({field: summary[field] for field in DERIVED_FIELDS}),
+                        json.dumps(prod),
+                        idx,
+                    ))
+                    loaded += 1
             
-            synkka = prod.get("synkkaData", {})
-            gtin = (
-                prod.get("salesUnitGtin") or 
-                synkka.get("gtin") or 
-                prod.get("gtin")
-            )
+            copy_seconds = time.time() - start_time
+            print(f"Copied {loaded} rows into staging in {copy_seconds:,.1f}s")
             
-            if not gtin:
-                skipped += 1
-                continue
+            updates = ", ".join(f"{col} = EXCLUDED.{col}" for col in PRODUCT_COLUMNS[1:])
+            cur.execute(f"""
+                INSERT INTO products ({columns})
+                SELECT DISTINCT ON (gtin) {columns}
+                FROM products_staging
+                ORDER BY gtin, seq DESC
+                ON CONFLICT (gtin) DO UPDATE
+                SET {updates}
+            """)
+            merged = cur.rowcount
             
-            # Get product name
-            names = synkka.get("names", [])
-            name = names[0].get("value", "Unknown Product") if names else "Unknown Product"
+            # Products that are no longer in the catalog
+            cur.execute("""
+                DELETE FROM products p
+                WHERE NOT EXISTS (SELECT 1 FROM products_staging s WHERE s.gtin = p.gtin)
+            """)
+            removed = cur.rowcount
             
-            try:
-                cur.execute("""
-                    INSERT INTO products (gtin, name, vendor_name, country_of_origin, category, brand, sales_unit, base_unit, product_data)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (gtin) DO UPDATE
-                    SET name = EXCLUDED.name,
-                        vendor_name = EXCLUDED.vendor_name,
-                        country_of_origin = EXCLUDED.country_of_origin,
-                        category = EXCLUDED.category,
-                        brand = EXCLUDED.brand,
-                        sales_unit = EXCLUDED.sales_unit,
-                        base_unit = EXCLUDED.base_unit,
-                        product_data = EXCLUDED.product_data
-                """, (
-                    gtin,
-                    name,
-                    prod.get("vendorName"),
-                    prod.get("countryOfOrigin"),
-                    prod.get("category"),
-                    synkka.get("brand"),
-                    prod.get("salesUnit"),
-                    prod.get("baseUnit"),
-                    json.dumps(prod)
-                ))
-                inserted += 1
-            except Exception as e:
-                print(f"Error inserting product {gtin}: {e}")
-                skipped += 1
+            # New catalog version, visible with the new rows at commit. The
+            # table is created here too, so databases set up before it was
+            # added to create_products_table.sql keep loading.
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS products_version (
+                    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                    loaded_at TIMESTAMPTZ NOT NULL
+                )
+            """)
+            cur.execute("""
+                INSERT INTO products_version (loaded_at) VALUES (now())
+                ON CONFLICT (id) DO UPDATE SET loaded_at = EXCLUDED.loaded_at
+            """)
+    
+    elapsed = time.time() - start_time
+    rate = loaded / elapsed if elapsed > 0 else 0.0
+    # ru_maxrss is reported in kilobytes on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
     
-    print(f"\nDone! Inserted {inserted} products, skipped {skipped}")
+    print(f"\nDone! Merged {merged} products, removed {removed} stale products, skipped {skipped}")
+    print(f"Loaded {loaded} rows in {elapsed:,.1f}s ({rate:,.0f} rows/s), peak RSS {peak_rss_mb:,.1f} MB")
 
 if __name__ == "__main__":
     try:
@@ -49,6 +49,70 @@ def get_db_connection():
                 raise RuntimeError(f"Failed to connect to database: {e}")
     return conn
 
+EMBEDDING_MODEL = "gemini-embedding-001"
+EMBEDDING_DIMENSIONS = 1536
+
+def get_embeddings(texts: list[str]) -> list[np.ndarray]:
+    """Embed many strings with a single embed_content request"""
+    response = client.models.embed_content(
+        model=EMBEDDING_MODEL,
+        contents=texts,
+        config=types.EmbedContentConfig(output_dimensionality=EMBEDDING_DIMENSIONS),
+    )
+    return [np.array(e.values) for e in response.embeddings]
+
+async def get_embeddings_async(texts: list[str]) -> list[np.ndarray]:
+    """Async variant of get_embeddings for use on an event loop"""
+    response = await client.aio.models.embed_content(
+        model=EMBEDDING_MODEL,
+        contents=texts,
+        config=types.EmbedContentConfig(output_dimensionality=EMBEDDING_DIMENSIONS),
+    )
+    return [np.array(e.values) for e in response.embeddings]
+
+def format_vector(embedding) -> str:
+    """pgvector text representation of an embedding, e.g. '[0.1,0.2]'"""
+    return "[" + ",".join(map(str, np.asarray(embedding, dtype=float).tolist())) + "]"
+
+# Writers announce every change to the embedding set on this channel, so
+# running API servers can drop cached similarity results (LISTEN/NOTIFY).
+# The payload lists the changed GTINs; an empty one means any may have changed.
+EMBEDDINGS_CHANGED_CHANNEL = "embeddings_changed"
+NOTIFY_PAYLOAD_MAX = 7999  # NOTIFY payloads must be shorter than 8000 bytes
+
+def embeddings_changed_payload(gtins=None) -> str:
+    """Comma-separated changed GTINs, or '' if unknown or too many to list"""
+    payload = ",".join(str(int(gtin)) for gtin in gtins) if gtins else ""
+    return payload if len(payload) <= NOTIFY_PAYLOAD_MAX else ""
+
+def notify_embeddings_changed(cur, gtins=None) -> None:
+    """Signal listeners that embeddings changed; delivered when the transaction commits"""
+    cur.execute("SELECT pg_notify(%s, %s)", (EMBEDDINGS_CHANGED_CHANNEL, embeddings_changed_payload(gtins)))
+
+def write_embeddings_to_db(rows: list[tuple[str, np.ndarray]]) -> None:
+    """Bulk upsert (gtin, embedding) pairs: COPY into a temp table, then one INSERT ... ON CONFLICT"""
+    if not rows:
+        return
+    db_conn = get_db_connection()
+    with db_conn.transaction():
+        with db_conn.cursor() as cur:
+            cur.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS embeddings_staging "
+                "(gtin BIGINT, embedding vector) ON COMMIT DELETE ROWS"
+            )
+            with cur.copy("COPY embeddings_staging (gtin, embedding) FROM STDIN") as copy:
+                for gtin, embedding in rows:
+                    copy.write_row((gtin, format_vector(embedding)))
+            cur.execute(
+                """
+                INSERT INTO embeddings (gtin, embedding)
+                SELECT DISTINCT ON (gtin) gtin, embedding FROM embeddings_staging
+                ON CONFLICT (gtin) DO UPDATE
+                    SET embedding = EXCLUDED.embedding
+                """
+            )
+            notify_embeddings_changed(cur, [gtin for gtin, _ in rows])
+
 class product:
     def __init__(self, product_data: dict):
         self.product_data = product_data
@@ -97,8 +161,6 @@ class product:
         allergens = allergen_value_lists[0] if allergen_value_lists else []
 
         if allergens:
-            print(type(allergens))
-            print(allergens)
             allergens_string = "; ".join(allergen["id"] for allergen in allergens if "id" in allergen)
         else:
             allergens_string = None  # omit from embedding string if missing
@@ -145,30 +207,29 @@ class product:
     def get_embedding(self) -> list[float]:
         embedding_string = self.create_embedding_string()
 
-        # Call Gemini embeddings API correctly: pass config as an object,
-        # then read embeddings from the response.
-        response = client.models.embed_content(
-            model="gemini-embedding-001",
-            contents=[embedding_string],
-            config=types.EmbedContentConfig(output_dimensionality=1536),
-        )
-
         # We pass a single string in `contents`, so take the first embedding.
-        embeddings = [np.array(e.values) for e in response.embeddings]
-        self.embedding = embeddings[0]
+        self.embedding = get_embeddings([embedding_string])[0]
         return self.embedding
 
-    def write_embedding_to_test_db(self) -> None:
-        if self.embedding is None:
-            self.get_embedding()
+    async def get_embedding_async(self) -> np.ndarray:
+        self.embedding = (await get_embeddings_async([self.create_embedding_string()]))[0]
+        return self.embedding
 
-        # Safely resolve GTIN; prefer salesUnitGtin, fall back to Synkka GTINs
+    def get_gtin(self) -> str | None:
+        # Prefer salesUnitGtin, fall back to Synkka GTINs
         synkka = self.product_data.get("synkkaData", {})
         gtin = (
             self.product_data.get("salesUnitGtin")
             or synkka.get("gtin")
             or self.product_data.get("gtin")
         )
+        return str(gtin) if gtin else None
+
+    def write_embedding_to_test_db(self) -> None:
+        if self.embedding is None:
+            self.get_embedding()
+
+        gtin = self.get_gtin()
         if not gtin:
             print("Skipping product with missing GTIN")
             return
@@ -185,4 +246,5 @@ class product:
                 """,
                 (gtin, self.embedding.tolist()),  # Important: convert numpy array → Python list
             )
-        print(f"Embedding written to database for product {gtin}, with embedding: {self.embedding}")
+            notify_embeddings_changed(cur, [gtin])
+        print(f"Embedding written to database for product {gtin}")
@@ -0,0 +1,48 @@
+"""
+Summary of a catalog product: the attributes list views show, without the
+full Synkka document.
+
+populate_products_table.py stores these in the products table: most as
+their own columns, and the ones derived from nested data in the `summary`
+JSONB column. The Product API reads them from there for `view=summary`
+(or `fields=`) responses, and computes them with product_summary() when it
+serves the JSON catalog.
+"""
+from typing import Optional
+
+# Fields of view=summary, in response order (gtin is always included)
+SUMMARY_FIELDS = ("name", "vendor_name", "country_of_origin", "category", "brand",
+                  "sales_unit", "base_unit", "net_weight")
+# Summary fields kept in products.summary rather than in their own column
+DERIVED_FIELDS = ("net_weight",)
+
+def product_name(prod: dict) -> str:
+    """First Synkka name of a catalog product"""
+    names = prod.get("synkkaData", {}).get("names", [])
+    return names[0].get("value", "Unknown Product") if names else "Unknown Product"
+
+def net_weight(prod: dict) -> Optional[dict]:
+    """Net weight ({"value", "unit"}) of the first unit conversion, as the inventory list shows it"""
+    conversions = prod.get("synkkaData", {}).get("unitConversions") or []
+    weight = conversions[0].get("netWeight") if conversions else None
+    if not weight:
+        return None
+    return {"value": weight.get("value"), "unit": weight.get("unit")}
+
+def derived_summary(prod: dict) -> dict:
+    """The products.summary document"""
+    return {"net_weight": net_weight(prod)}
+
+def product_summary(prod: dict) -> dict:
+    """Every summary field of a catalog product"""
+    synkka = prod.get("synkkaData", {})
+    return {
+        "name": product_name(prod),
+        "vendor_name": prod.get("vendorName"),
+        "country_of_origin": prod.get("countryOfOrigin"),
+        "category": prod.get("category"),
+        "brand": synkka.get("brand"),
+        "sales_unit": prod.get("salesUnit"),
+        "base_unit": prod.get("baseUnit"),
+        **derived_summary(prod),
+    }
@@ -0,0 +1,62 @@
+"""
+Parity of the in-process failure scores with the R stats service.
+
+stats-backend/parity_rows.json holds feature rows as the orders API sends
+them, plus unseen levels, mixed JSON types and months in the training
+data's format. export_model.R scores them through make_design_matrix() in
+server.R and writes the probabilities to parity_probabilities.json, next
+to the exported model. Run after each export:
+    python -m unittest test_failure_model
+
+Without the export the test is skipped, except under CI (the CI environment
+variable set), where the export has to run first and a missing file fails.
+"""
+import json
+import os
+import unittest
+import numpy as np
+from failure_model import FACTOR_FEATURES, INTERCEPT, MODEL_DIR, OTHER_PRODUCT, FailureModel, load_failure_model
+
+PARITY_ROWS_FILE = "parity_rows.json"
+PARITY_PROBABILITIES_FILE = "parity_probabilities.json"
+# As in failure_model.py --check-parity
+TOLERANCE = 1e-4
+
+class FailureModelParityTest(unittest.TestCase):
+    def missing(self, reason: str) -> None:
+        if os.getenv("CI"):
+            self.fail(reason)
+        self.skipTest(reason)
+
+    def test_scores_match_r_service(self):
+        probabilities_path = MODEL_DIR / PARITY_PROBABILITIES_FILE
+        if not probabilities_path.exists():
+            self.missing(f"No {probabilities_path}; run `Rscript export_model.R` in stats-backend")
+        model = load_failure_model()
+        if model is None:
+            self.missing(f"No exported model in {MODEL_DIR}, or xgboost is not installed")
+
+        rows = json.loads((MODEL_DIR / PARITY_ROWS_FILE).read_text())
+        expected = np.array(json.loads(probabilities_path.read_text()), dtype=np.float64)
+        self.assertEqual(len(expected), len(rows), "parity_probabilities.json is stale; re-run export_model.R")
+
+        prob = model.predict(rows)
+        diff = np.abs(prob - expected)
+        worst = int(np.argmax(diff))
+        self.assertLessEqual(
+            float(diff[worst]), TOLERANCE,
+            f"{rows[worst]}: in-process {prob[worst]:.6f}, R {expected[worst]:.6f}"
+        )
+
+class DesignMatrixTest(unittest.TestCase):
+    def test_missing_columns_in_any_row(self):
+        # Only the encoding is used; no booster or export needed
+        levels = {name: [OTHER_PRODUCT] if name == "product_code" else [] for name in FACTOR_FEATURES}
+        model = FailureModel(None, [INTERCEPT], levels)
+        rows = json.loads((MODEL_DIR / PARITY_ROWS_FILE).read_text())[:2]
+        del rows[1]["plant"], rows[1]["lead_time"]
+        with self.assertRaisesRegex(ValueError, "Missing required columns in input: plant, lead_time"):
+            model.design_matrix(rows)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+"""
+Result counts of /products/{gtin}/similar on the configured database (.env).
+
+The query product is excluded from its own neighbours by a WHERE condition,
+which pgvector applies after the HNSW scan, so a search has to take one row
+more than its limit from the index. Run with the embeddings built:
+    python -m unittest test_similar_products
+"""
+import unittest
+from fastapi.testclient import TestClient
+import api_server
+
+# Up to pgvector's default hnsw.ef_search, just above it and /similar's maximum
+LIMITS = (api_server.HNSW_EF_SEARCH_DEFAULT, api_server.HNSW_EF_SEARCH_DEFAULT + 1, 50)
+QUERY_PRODUCTS = 20
+
+class SimilarProductsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # One client (and connection pool) for every test; the pool is not reopened after shutdown
+        cls.client = cls.enterClassContext(TestClient(api_server.app))
+
+    def query_gtins(self) -> list:
+        """GTINs of the first QUERY_PRODUCTS products with an embedding; skips without enough embeddings"""
+        try:
+            rows = self.client.portal.call(api_server.query_db, """
+                SELECT e.gtin::text, count(*) OVER ()
+                FROM embeddings e JOIN products p ON p.gtin = e.gtin
+                ORDER BY e.gtin
+            """)
+        except Exception as e:
+            self.skipTest(f"No embeddings table: {e}")
+        if not rows or rows[0][1] <= max(LIMITS):
+            self.skipTest(f"Needs a database with more than {max(LIMITS)} product embeddings")
+        return [gtin for gtin, _ in rows[:QUERY_PRODUCTS]]
+
+    def test_index_scan_covers_the_excluded_row(self):
+        for limit in LIMITS:
+            self.assertGreater(api_server.hnsw_candidates(limit), limit)
+
+    def test_index_search_returns_limit_rows(self):
+        # Small tables are sorted without the index; make the planner use HNSW as on a full catalog
+        sql = api_server.nearest_embeddings_sql(
+            "(SELECT embedding FROM embeddings WHERE gtin = %(gtin)s)", "%(limit)s", exclude="e.gtin != %(gtin)s"
+        )
+        for gtin in self.query_gtins():
+            for limit in LIMITS:
+                settings = {**(api_server.hnsw_settings(limit) or {}), "enable_seqscan": "off"}
+                rows = self.client.portal.call(api_server.query_db, sql, {"gtin": int(gtin), "limit": limit}, settings)
+                self.assertEqual(len(rows), limit, f"{gtin}, limit {limit}")
+
+    def test_similar_returns_limit_rows(self):
+        for gtin in self.query_gtins():
+            for limit in LIMITS:
+                api_server.similar_cache.clear()
+                response = self.client.get(f"/products/{gtin}/similar", params={"limit": limit, "view": "summary"})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()), limit, f"/products/{gtin}/similar?limit={limit}")
+
+if __name__ == "__main__":
+    unittest.main()
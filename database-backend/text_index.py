@@ -0,0 +1,129 @@
+"""
+In-memory trigram index for product name search.
+
+Used by the Product API's JSON fallback, and ranked the same way as the
+pg_trgm query it stands in for. Every lowercased name is split into its
+character trigrams, and each trigram maps to a sorted array of the names
+that contain it:
+  - a substring query of three or more characters can only match names
+    that contain all of its trigrams, so one bincount over the query's
+    posting lists finds the candidates and only those are checked
+    (shorter queries are found with one scan of all names);
+  - names containing most of the query's trigrams also match (like
+    pg_trgm's word similarity, the `<%` operator), which tolerates typos
+    and inflected Finnish word forms that an English stemmer gets wrong.
+
+Matches are ranked: exact name, name prefix, word prefix, substring, then
+by trigram similarity, with shorter names first within a tier. Name and
+word prefixes are ranges of a sorted list of word suffixes, so the tiers
+are produced in order and a search stops as soon as it has enough results.
+"""
+import re
+from bisect import bisect_left
+import numpy as np
+
+# Share of the query's trigrams a name must contain when it does not contain
+# the query itself (pg_trgm.word_similarity_threshold defaults to 0.6)
+SIMILARITY_THRESHOLD = 0.6
+
+def normalize(text: str) -> str:
+    """Lowercase and collapse whitespace"""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+def trigrams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class TrigramIndex:
+    def __init__(self, docs: list[list[str]]):
+        """Index every name of every document; results refer to documents by position"""
+        texts = []
+        self.names = []
+        entry_doc = []
+        for doc, names in enumerate(docs):
+            doc_names = {}
+            for name in names:
+                if name:
+                    doc_names.setdefault(normalize(name), name)
+            for text, name in doc_names.items():
+                texts.append(text)
+                self.names.append(name)
+                entry_doc.append(doc)
+        self.texts = texts
+        self.entry_doc = np.array(entry_doc, dtype=np.int32)
+        self.lengths = np.array([len(text) for text in texts], dtype=np.int32)
+        # All names in one string, for queries too short to have trigrams
+        self.corpus = "\n".join(texts)
+        self.starts = np.cumsum(self.lengths + 1) - (self.lengths + 1)
+
+        postings = {}
+        for entry, text in enumerate(texts):
+            for gram in trigrams(text):
+                postings.setdefault(gram, []).append(entry)
+        self.postings = {gram: np.array(entries, dtype=np.int32) for gram, entries in postings.items()}
+
+        # Every name from the start of each of its words, sorted
+        suffixes = []
+        for entry, text in enumerate(texts):
+            suffixes.append((text, entry, True))
+            suffixes.extend((text[match.end():], entry, False) for match in re.finditer(" ", text))
+        suffixes.sort()
+        self.suffixes = [suffix for suffix, _, _ in suffixes]
+        self.suffix_entry = np.array([entry for _, entry, _ in suffixes], dtype=np.int32)
+        self.suffix_is_name = np.array([is_name for _, _, is_name in suffixes], dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def shortest_first(self, entries: np.ndarray) -> np.ndarray:
+        return entries[np.argsort(self.lengths[entries], kind="stable")]
+
+    def search(self, query: str, limit: int) -> list[tuple[int, str]]:
+        """Best (document, matching name) pairs, most relevant first"""
+        query = normalize(query)
+        if not query or limit <= 0:
+            return []
+
+        results = []
+        seen = set()
+
+        def take(entries, contains_query=False) -> bool:
+            """Add documents in order until there are enough; True once full"""
+            for entry in entries.tolist():
+                doc = int(self.entry_doc[entry])
+                if doc in seen or (contains_query and query not in self.texts[entry]):
+                    continue
+                seen.add(doc)
+                results.append((doc, self.names[entry]))
+                if len(results) >= limit:
+                    return True
+            return False
+
+        # Exact name, name prefix and word prefix: one range of the sorted suffixes
+        start = bisect_left(self.suffixes, query)
+        end = bisect_left(self.suffixes, query + "\U0010ffff", start)
+        entries = self.suffix_entry[start:end]
+        is_name = self.suffix_is_name[start:end]
+        prefix = self.shortest_first(entries[is_name])  # An exact match is the shortest prefix
+        if take(prefix) or take(self.shortest_first(entries[~is_name])):
+            return results
+
+        if len(query) < 3:
+            positions = np.fromiter(
+                (match.start() for match in re.finditer(re.escape(query), self.corpus)), dtype=np.int64
+            )
+            entries = np.unique(np.searchsorted(self.starts, positions, side="right") - 1)
+            take(self.shortest_first(entries))
+            return results
+
+        n_query = len(trigrams(query))
+        grams = [gram for gram in trigrams(query) if gram in self.postings]
+        if not grams:
+            return results
+        shared = np.bincount(np.concatenate([self.postings[gram] for gram in grams]), minlength=len(self.texts))
+
+        # Substrings (all trigrams present, then checked), then similar names
+        if take(self.shortest_first(np.flatnonzero(shared == n_query)), contains_query=True):
+            return results
+        similar = np.flatnonzero(shared >= SIMILARITY_THRESHOLD * n_query)
+        take(similar[np.lexsort((self.lengths[similar], -shared[similar]))])
+        return results
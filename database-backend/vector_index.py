@@ -0,0 +1,199 @@
+"""
+In-process vector index for product embeddings.
+
+Holds every embedding as one contiguous matrix with L2-normalized rows, so
+a top-k cosine query is a single matrix-vector product plus a partial sort
+(and a batch of queries one matrix-matrix product). The matrix can be kept
+as float16, and searches can pick a shortlist on the leading dimensions
+and re-rank it on the full vectors (use_first_pass).
+The matrix can be saved as a snapshot (.npy files) and memory-mapped back,
+which lets the Product API answer similarity queries without PostgreSQL.
+
+Export a snapshot from the embeddings table:
+    python vector_index.py --snapshot embeddings_snapshot [--dtype float16]
+"""
+import os
+from pathlib import Path
+import numpy as np
+
+# Rows scored per block when the matrix is float16, to bound the float32 temporary
+SCORE_BLOCK_ROWS = 16384
+# Queries scored together by search_many, to bound the queries x rows score matrix
+SEARCH_BLOCK_QUERIES = 32
+# With a first pass, the shortlist re-ranked on full vectors is this many times k
+RERANK_FACTOR = 10
+
+def unit_rows(vectors) -> np.ndarray:
+    """float32 copy of the vectors (a vector or a matrix of rows) with unit L2 norm"""
+    vectors = np.array(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors /= norms
+    return vectors
+
+def matrix_scores(matrix: np.ndarray, queries: np.ndarray) -> np.ndarray:
+    """Dot products of normalized queries with every row of the matrix"""
+    if matrix.dtype == np.float32:
+        return queries @ matrix.T
+    # No BLAS for float16: upcast one block at a time
+    scores = np.empty(queries.shape[:-1] + (len(matrix),), dtype=np.float32)
+    for start in range(0, len(matrix), SCORE_BLOCK_ROWS):
+        block = np.asarray(matrix[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+        scores[..., start:start + len(block)] = queries @ block.T
+    return scores
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k highest scores, highest first, leaving out excluded (-inf) ones"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return top[scores[top] != -np.inf]
+
+class VectorIndex:
+    def __init__(self, gtins: np.ndarray, matrix: np.ndarray):
+        self.gtins = gtins
+        self.matrix = matrix
+        self.positions = {int(gtin): idx for idx, gtin in enumerate(gtins.tolist())}
+        self.first_pass = None  # Normalized leading dimensions, see use_first_pass()
+        self.rerank_factor = RERANK_FACTOR
+
+    def __len__(self) -> int:
+        return len(self.gtins)
+
+    @classmethod
+    def from_vectors(cls, gtins, vectors, dtype: str = "float32") -> "VectorIndex":
+        """Build an index from raw vectors, normalizing each row"""
+        matrix = unit_rows(vectors)
+        return cls(np.asarray(gtins, dtype=np.int64), matrix.astype(dtype, copy=False))
+
+    @classmethod
+    def from_db(cls, conn, dtype: str = "float32") -> "VectorIndex":
+        """
+        Load every embedding from the embeddings table with a binary COPY.
+        Each row has the same size, so the whole stream is decoded with one
+        structured dtype instead of parsing vectors row by row.
+        """
+        with conn.cursor() as cur:
+            cur.execute("SELECT vector_dims(embedding) FROM embeddings WHERE embedding IS NOT NULL LIMIT 1")
+            row = cur.fetchone()
+            if not row:
+                return cls.from_vectors(np.empty(0, dtype=np.int64), np.empty((0, 0)), dtype)
+            dims = row[0]
+
+            buf = bytearray()
+            with cur.copy(
+                "COPY (SELECT gtin, embedding FROM embeddings WHERE embedding IS NOT NULL) "
+                "TO STDOUT (FORMAT BINARY)"
+            ) as copy:
+                for data in copy:
+                    buf += data
+
+        # Header: 11-byte signature, int32 flags, int32 extension length (+ extension)
+        header_ext = int.from_bytes(buf[15:19], "big")
+        body = memoryview(buf)[19 + header_ext:len(buf) - 2]  # Trailer is int16 -1
+
+        row_dtype = np.dtype([
+            ("fields", ">i2"),
+            ("gtin_len", ">i4"), ("gtin", ">i8"),
+            ("vec_len", ">i4"), ("dims", ">i2"), ("unused", ">i2"), ("vec", ">f4", (dims,)),
+        ])
+        rows = np.frombuffer(body, dtype=row_dtype)
+        return cls.from_vectors(rows["gtin"].astype(np.int64), rows["vec"], dtype)
+
+    @classmethod
+    def load(cls, path) -> "VectorIndex":
+        """Memory-map a snapshot written by save()"""
+        path = Path(path)
+        gtins = np.load(path / "gtins.npy")
+        matrix = np.load(path / "embeddings.npy", mmap_mode="r")
+        return cls(gtins, matrix)
+
+    def save(self, path) -> None:
+        """Write the snapshot; files are replaced atomically so readers never see a partial one"""
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for name, array in (("gtins.npy", self.gtins), ("embeddings.npy", self.matrix)):
+            tmp_path = path / f"{name}.{os.getpid()}.tmp"
+            with tmp_path.open("wb") as f:
+                np.save(f, np.ascontiguousarray(array))
+            os.replace(tmp_path, path / name)
+
+    def get(self, gtin) -> np.ndarray | None:
+        """Normalized embedding of a GTIN, or None if it is not in the index"""
+        idx = self.positions.get(int(gtin))
+        if idx is None:
+            return None
+        return np.asarray(self.matrix[idx], dtype=np.float32)
+
+    def use_first_pass(self, dims: int, rerank_factor: int = RERANK_FACTOR) -> None:
+        """
+        Search in two passes: score every row on its first dims dimensions
+        (renormalized), then re-rank the best rerank_factor x k rows on the
+        full vectors. The first pass reads dims/D of the data. Embeddings
+        whose leading dimensions carry most of the signal (Matryoshka-trained,
+        like gemini-embedding-001) lose little recall; see
+        benchmark_embeddings.py. dims of 0 (or the full width) turns it off.
+        """
+        if 0 < dims < self.matrix.shape[1]:
+            self.first_pass = unit_rows(self.matrix[:, :dims])
+            self.rerank_factor = rerank_factor
+        else:
+            self.first_pass = None
+
+    def scores(self, query) -> np.ndarray:
+        """Cosine similarity of the query (or of each row of a query matrix) against every row"""
+        return matrix_scores(self.matrix, unit_rows(query))
+
+    def search(self, query, k: int, exclude_gtin=None) -> list[tuple[int, float]]:
+        """Top-k (gtin, cosine similarity) pairs, most similar first"""
+        return self.search_many([query], k, [exclude_gtin])[0]
+
+    def search_many(self, queries, k: int, exclude_gtins=None) -> list[list[tuple[int, float]]]:
+        """
+        search() for each query, scoring a block of queries with one
+        matrix-matrix product instead of a matrix-vector product per query
+        """
+        if exclude_gtins is None:
+            exclude_gtins = [None] * len(queries)
+        if not len(self.gtins) or k <= 0:
+            return [[] for _ in queries]
+        results = []
+        for start in range(0, len(queries), SEARCH_BLOCK_QUERIES):
+            block = unit_rows(np.atleast_2d(np.asarray(queries[start:start + SEARCH_BLOCK_QUERIES], dtype=np.float32)))
+            if self.first_pass is None:
+                scores = matrix_scores(self.matrix, block)
+            else:
+                scores = unit_rows(block[:, :self.first_pass.shape[1]]) @ self.first_pass.T
+            for query, row, exclude_gtin in zip(block, scores, exclude_gtins[start:start + SEARCH_BLOCK_QUERIES]):
+                if exclude_gtin is not None:
+                    idx = self.positions.get(int(exclude_gtin))
+                    if idx is not None:
+                        row[idx] = -np.inf
+                if self.first_pass is None:
+                    top = top_k(row, k)
+                    results.append([(int(self.gtins[i]), float(row[i])) for i in top])
+                    continue
+                # Re-rank the shortlist on the full vectors
+                shortlist = top_k(row, k * self.rerank_factor)
+                exact = np.asarray(self.matrix[shortlist], dtype=np.float32) @ query
+                top = top_k(exact, k)
+                results.append([(int(self.gtins[i]), float(exact[j])) for i, j in zip(shortlist[top], top)])
+        return results
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    from product_embedding import get_db_connection
+
+    parser = argparse.ArgumentParser(description="Export the embeddings table to an in-process index snapshot")
+    parser.add_argument("--snapshot", default=str(Path(__file__).parent / "embeddings_snapshot"))
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    index = VectorIndex.from_db(get_db_connection(), args.dtype)
+    index.save(args.snapshot)
+    print(f"Wrote {len(index)} embeddings ({index.matrix.nbytes / 1e6:,.1f} MB, {args.dtype}) "
+          f"to {args.snapshot} in {time.time() - start_time:,.1f}s")
@@ -24,14 +24,17 @@ import {
 import { ScrollArea } from './ui/scroll-area';
 import { Separator } from './ui/separator';
 import { dbApi } from '../services/api';
-import { ProductResponse, SimilarProduct } from '../types/product';
+import { ProductResponse, ProductSummary, SimilarProductSummary } from '../types/product';
 
 export function InventoryManagement() {
-  const [products, setProducts] = useState<ProductResponse[]>([]);
+  // The list, selection and similar products use view=summary; only the
+  // description needs the full product, fetched when a product is selected
+  const [products, setProducts] = useState<ProductSummary[]>([]);
   const [loading, setLoading] = useState(true);
   const [searchQuery, setSearchQuery] = useState('');
-  const [selectedProduct, setSelectedProduct] = useState<ProductResponse | null>(null);
-  const [similarProducts, setSimilarProducts] = useState<SimilarProduct[]>([]);
+  const [selectedProduct, setSelectedProduct] = useState<ProductSummary | null>(null);
+  const [selectedDetails, setSelectedDetails] = useState<ProductResponse | null>(null);
+  const [similarProducts, setSimilarProducts] = useState<SimilarProductSummary[]>([]);
   const [loadingSimilar, setLoadingSimilar] = useState(false);
   const [error, setError] = useState<string | null>(null);
 
@@ -42,8 +45,10 @@ export function InventoryManagement() {
   useEffect(() => {
     if (selectedProduct) {
       loadSimilarProducts(selectedProduct.gtin);
+      loadProductDetails(selectedProduct.gtin);
     } else {
       setSimilarProducts([]);
+      setSelectedDetails(null);
     }
   }, [selectedProduct]);
 
@@ -61,7 +66,7 @@ export function InventoryManagement() {
         try {
           setLoading(true);
           setError(null);
-          const data = await dbApi.getProducts(200);
+          const data = await dbApi.getProductSummaries(200);
           setProducts(data);
         } catch (err) {
           setError(err instanceof Error ? err.message : 'Failed to load products');
@@ -79,7 +84,7 @@ export function InventoryManagement() {
       try {
         setLoading(true);
         setError(null);
-        const results = await dbApi.searchProducts(searchQuery, 50);
+        const results = await dbApi.searchProductSummaries(searchQuery, 50);
         setProducts(results);
       } catch (err) {
         setError(err instanceof Error ? err.message : 'Search failed');
@@ -101,7 +106,7 @@ export function InventoryManagement() {
     try {
       setLoading(true);
       setError(null);
-      const data = await dbApi.getProducts(200);
+      const data = await dbApi.getProductSummaries(200);
       setProducts(data);
     } catch (err) {
       setError(err instanceof Error ? err.message : 'Failed to load products');
@@ -114,7 +119,7 @@ export function InventoryManagement() {
   const loadSimilarProducts = async (gtin: string) => {
     try {
       setLoadingSimilar(true);
-      const similar = await dbApi.getSimilarProducts(gtin, 10);
+      const similar = await dbApi.getSimilarProductSummaries(gtin, 10);
       setSimilarProducts(similar);
     } catch (err) {
       console.error('Error loading similar products:', err);
@@ -124,6 +129,15 @@ export function InventoryManagement() {
     }
   };
 
+  const loadProductDetails = async (gtin: string) => {
+    try {
+      const details = await dbApi.getProduct(gtin);
+      setSelectedDetails(details);
+    } catch (err) {
+      console.error('Error loading product details:', err);
+    }
+  };
+
   const handleSearch = async () => {
     if (!searchQuery.trim()) {
       loadProducts();
@@ -131,7 +145,8 @@ export function InventoryManagement() {
     }
     try {
       setLoading(true);
-      const results = await dbApi.searchProducts(searchQuery, 50);
+      // Name matches while typing; an explicit search also matches by meaning
+      const results = await dbApi.searchProductSummaries(searchQuery, 50, 'hybrid');
       setProducts(results);
     } catch (err) {
       setError(err instanceof Error ? err.message : 'Search failed');
@@ -141,25 +156,21 @@ export function InventoryManagement() {
     }
   };
 
-  const getProductName = (product: ProductResponse) => {
+  const getProductName = (product: ProductSummary) => {
     return product.name || 'Unknown Product';
   };
 
-  const getProductVendor = (product: ProductResponse) => {
-    return product.product_data.vendorName || 'Unknown Vendor';
+  const getProductVendor = (product: ProductSummary) => {
+    return product.vendor_name || 'Unknown Vendor';
   };
 
-  const getProductCategory = (product: ProductResponse) => {
-    return product.product_data.category || 'N/A';
+  const getProductCategory = (product: ProductSummary) => {
+    return product.category || 'N/A';
   };
 
-  const getProductWeight = (product: ProductResponse) => {
-    const conversions = product.product_data.synkkaData?.unitConversions;
-    if (conversions && conversions.length > 0) {
-      const netWeight = conversions[0].netWeight;
-      if (netWeight) {
-        return `${netWeight.value} ${netWeight.unit}`;
-      }
+  const getProductWeight = (product: ProductSummary) => {
+    if (product.net_weight) {
+      return `${product.net_weight.value} ${product.net_weight.unit}`;
     }
     return 'N/A';
   };
@@ -309,7 +320,7 @@ export function InventoryManagement() {
                             <span>Origin</span>
                           </div>
                           <p className="pl-6">
-                            {selectedProduct.product_data.countryOfOrigin || 'N/A'}
+                            {selectedProduct.country_of_origin || 'N/A'}
                           </p>
                         </div>
                       </div>
@@ -327,22 +338,24 @@ export function InventoryManagement() {
                             <span className="text-slate-600">Weight:</span>
                             <span>{getProductWeight(selectedProduct)}</span>
                           </div>
-                          {selectedProduct.product_data.synkkaData?.brand && (
+                          {selectedProduct.brand && (
                             <div className="flex justify-between">
                               <span className="text-slate-600">Brand:</span>
-                              <span>{selectedProduct.product_data.synkkaData.brand}</span>
+                              <span>{selectedProduct.brand}</span>
                             </div>
                           )}
                         </div>
                       </div>
 
-                      {selectedProduct.product_data.synkkaData?.marketingTexts?.[0]?.value && (
+                      {/* Details of a previously selected product may still be loading */}
+                      {selectedDetails?.gtin === selectedProduct.gtin &&
+                        selectedDetails.product_data.synkkaData?.marketingTexts?.[0]?.value && (
                         <>
                           <Separator />
                           <div>
                             <h4 className="mb-2 text-slate-600 text-sm font-medium">Description</h4>
                             <p className="text-sm text-slate-700">
-                              {selectedProduct.product_data.synkkaData.marketingTexts[0].value}
+                              {selectedDetails.product_data.synkkaData.marketingTexts[0].value}
                             </p>
                           </div>
                         </>
@@ -381,11 +394,7 @@ export function InventoryManagement() {
                           <div
                             key={similar.gtin}
                             className="p-3 bg-slate-50 rounded-lg border border-slate-200 hover:border-[#0D6672] transition-colors cursor-pointer"
-                            onClick={() => setSelectedProduct({
-                              gtin: similar.gtin,
-                              name: similar.name,
-                              product_data: similar.product_data
-                            })}
+                            onClick={() => setSelectedProduct(similar)}
                           >
                             <div className="flex items-start justify-between mb-2">
                               <div className="flex-1">
@@ -400,11 +409,7 @@ export function InventoryManagement() {
                               </Badge>
                             </div>
                             <div className="text-xs text-slate-600 mt-2">
-                              <span className="font-medium">Vendor:</span> {getProductVendor({
-                                gtin: similar.gtin,
-                                name: similar.name,
-                                product_data: similar.product_data
-                              })}
+                              <span className="font-medium">Vendor:</span> {getProductVendor(similar)}
                             </div>
                           </div>
                         ))}
@@ -7,9 +7,9 @@ import { Separator } from './ui/separator';
 import { Button } from './ui/button';
 import { Package, MapPin, Calendar, DollarSign, TrendingUp, Loader2, Sparkles } from 'lucide-react';
 import { AlertCircle, AlertTriangle, Clock, CheckCircle } from 'lucide-react';
-import { statsApi, PredictionResponse } from '../services/api';
+import { ordersApi, PredictionResponse } from '../services/api';
 import { dbApi } from '../services/api';
-import { SimilarProduct } from '../types/product';
+import { SimilarProductSummary } from '../types/product';
 
 interface OrderDetailsProps {
   order: Order;
@@ -43,43 +43,52 @@ export function OrderDetails({ order }: OrderDetailsProps) {
   const [loadingPrediction, setLoadingPrediction] = useState(false);
   const [predictionError, setPredictionError] = useState<string | null>(null);
   const [selectedItemSku, setSelectedItemSku] = useState<string | null>(null);
-  const [similarProducts, setSimilarProducts] = useState<SimilarProduct[]>([]);
+  // Similar products of every item in the order, by SKU; fetched with two
+  // batch requests the first time an item is selected
+  const [similarBySku, setSimilarBySku] = useState<Record<string, SimilarProductSummary[]> | null>(null);
   const [loadingSimilar, setLoadingSimilar] = useState(false);
+  const itemSelected = selectedItemSku !== null;
 
   useEffect(() => {
-    if (selectedItemSku) {
-      loadSimilarProducts(selectedItemSku);
-    } else {
-      setSimilarProducts([]);
+    setSimilarBySku(null);
+  }, [order]);
+
+  useEffect(() => {
+    if (!itemSelected || similarBySku !== null) {
+      return;
     }
-  }, [selectedItemSku]);
+    let cancelled = false;
+    setLoadingSimilar(true);
+    loadSimilarProducts(order.items.map((item) => item.sku)).then((similar) => {
+      if (!cancelled) {
+        setSimilarBySku(similar);
+        setLoadingSimilar(false);
+      }
+    });
+    return () => {
+      cancelled = true;
+    };
+  }, [order, itemSelected, similarBySku]);
 
-  const loadSimilarProducts = async (sku: string) => {
+  const loadSimilarProducts = async (skus: string[]): Promise<Record<string, SimilarProductSummary[]>> => {
+    const similarBySku: Record<string, SimilarProductSummary[]> = {};
     try {
-      setLoadingSimilar(true);
-      // Try to get product by GTIN (assuming SKU might be GTIN)
-      try {
-        const product = await dbApi.getProduct(sku);
-        const similar = await dbApi.getSimilarProducts(product.gtin, 5);
-        setSimilarProducts(similar);
-      } catch {
-        // If SKU is not a valid GTIN, try searching
-        const results = await dbApi.searchProducts(sku, 1);
-        if (results.length > 0) {
-          const similar = await dbApi.getSimilarProducts(results[0].gtin, 5);
-          setSimilarProducts(similar);
-        } else {
-          setSimilarProducts([]);
-        }
+      // SKUs that are not a GTIN resolve to their best name match
+      const products = await dbApi.getProductSummariesBatch(skus, true);
+      const gtins = Array.from(new Set(Object.values(products).flatMap((product) => (product ? [product.gtin] : []))));
+      const similar = gtins.length > 0 ? await dbApi.getSimilarProductSummariesBatch(gtins, 5) : {};
+      for (const sku of skus) {
+        const product = products[sku];
+        similarBySku[sku] = (product && similar[product.gtin]) || [];
       }
     } catch (err) {
       console.error('Error loading similar products:', err);
-      setSimilarProducts([]);
-    } finally {
-      setLoadingSimilar(false);
     }
+    return similarBySku;
   };
 
+  const similarProducts = (selectedItemSku && similarBySku?.[selectedItemSku]) || [];
+
   const handlePredict = async () => {
     setLoadingPrediction(true);
     setPredictionError(null);
@@ -106,7 +115,7 @@ export function OrderDetails({ order }: OrderDetailsProps) {
         };
       });
 
-      const result = await statsApi.predict(predictionRequest);
+      const result = await ordersApi.predict(predictionRequest);
       setPrediction(result);
     } catch (err) {
       setPredictionError(err instanceof Error ? err.message : 'Failed to get prediction');
@@ -15,9 +15,39 @@ const DB_API_BASE = getApiBase(import.meta.env.VITE_DB_API_URL, '/api/products',
 const STATS_API_BASE = getApiBase(import.meta.env.VITE_STATS_API_URL, '/api/stats', '8001');
 const ORDERS_API_BASE = getApiBase(import.meta.env.VITE_ORDERS_API_URL, '/api/orders', '8002');
 
-import { ProductResponse, SimilarProduct, ProductSearchResult } from '../types/product';
+import {
+  ProductResponse,
+  SimilarProduct,
+  ProductSearchResult,
+  SearchMode,
+  ProductSummary,
+  SimilarProductSummary,
+  ProductSummarySearchResult,
+} from '../types/product';
 
 // Database Backend API
+export interface ProductFilters {
+  vendor?: string;
+  category?: string;
+  brand?: string;
+  country_of_origin?: string;
+}
+
+export interface ProductsPage {
+  products: ProductSummary[];
+  nextCursor: string | null;
+}
+
+function productFilterParams(filters: ProductFilters = {}): URLSearchParams {
+  const params = new URLSearchParams();
+  for (const [key, value] of Object.entries(filters)) {
+    if (value !== undefined && value !== null && value !== '') {
+      params.set(key, String(value));
+    }
+  }
+  return params;
+}
+
 export const dbApi = {
   async getProducts(limit = 100, offset = 0): Promise<ProductResponse[]> {
     // In production, DB_API_BASE is '/api/products', so we need to add '/products'
@@ -54,10 +84,121 @@ export const dbApi = {
     return response.json();
   },
 
-  async searchProducts(query: string, limit = 20): Promise<ProductSearchResult[]> {
+  async searchProducts(query: string, limit = 20, mode: SearchMode = 'lexical'): Promise<ProductSearchResult[]> {
+    const url = DB_API_BASE.endsWith('/')
+      ? `${DB_API_BASE}search?q=${encodeURIComponent(query)}&limit=${limit}&mode=${mode}`
+      : `${DB_API_BASE}/search?q=${encodeURIComponent(query)}&limit=${limit}&mode=${mode}`;
+    const response = await fetch(url);
+    if (!response.ok) {
+      throw new Error(`Failed to search products: ${response.statusText}`);
+    }
+    return response.json();
+  },
+
+  // view=summary variants for list views: no product_data in the response
+  async getProductSummaries(limit = 100, offset = 0): Promise<ProductSummary[]> {
+    const url = DB_API_BASE.endsWith('/')
+      ? `${DB_API_BASE}products?limit=${limit}&offset=${offset}&view=summary`
+      : `${DB_API_BASE}/products?limit=${limit}&offset=${offset}&view=summary`;
+    const response = await fetch(url);
+    if (!response.ok) {
+      throw new Error(`Failed to fetch products: ${response.statusText}`);
+    }
+    return response.json();
+  },
+
+  // Filtered pages in GTIN order; pass nextCursor back for the following page
+  async getProductSummariesPage(
+    limit = 100,
+    filters: ProductFilters = {},
+    cursor?: string
+  ): Promise<ProductsPage> {
+    const params = productFilterParams(filters);
+    params.set('limit', String(limit));
+    params.set('view', 'summary');
+    if (cursor) params.set('cursor', cursor);
+    const url = DB_API_BASE.endsWith('/')
+      ? `${DB_API_BASE}products?${params}`
+      : `${DB_API_BASE}/products?${params}`;
+    const response = await fetch(url);
+    if (!response.ok) {
+      throw new Error(`Failed to fetch products: ${response.statusText}`);
+    }
+    return { products: await response.json(), nextCursor: response.headers.get('X-Next-Cursor') };
+  },
+
+  async getProductsCount(filters: ProductFilters = {}): Promise<number> {
+    const params = productFilterParams(filters);
+    const url = DB_API_BASE.endsWith('/')
+      ? `${DB_API_BASE}products/count?${params}`
+      : `${DB_API_BASE}/products/count?${params}`;
+    const response = await fetch(url);
+    if (!response.ok) {
+      throw new Error(`Failed to fetch product count: ${response.statusText}`);
+    }
+    return (await response.json()).count;
+  },
+
+  async getSimilarProductSummaries(gtin: string, limit = 10): Promise<SimilarProductSummary[]> {
+    const url = DB_API_BASE.endsWith('/')
+      ? `${DB_API_BASE}products/${gtin}/similar?limit=${limit}&view=summary`
+      : `${DB_API_BASE}/products/${gtin}/similar?limit=${limit}&view=summary`;
+    const response = await fetch(url);
+    if (!response.ok) {
+      throw new Error(`Failed to fetch similar products: ${response.statusText}`);
+    }
+    return response.json();
+  },
+
+  // Many GTINs in one request; searchUnmatched resolves inputs that are no GTIN (e.g. SKUs) by name
+  async getProductSummariesBatch(
+    gtins: string[],
+    searchUnmatched = false
+  ): Promise<Record<string, ProductSummary | null>> {
+    const url = DB_API_BASE.endsWith('/')
+      ? `${DB_API_BASE}products/batch`
+      : `${DB_API_BASE}/products/batch`;
+    const response = await fetch(url, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ gtins, view: 'summary', search_unmatched: searchUnmatched }),
+    });
+    if (!response.ok) {
+      throw new Error(`Failed to fetch products: ${response.statusText}`);
+    }
+    return response.json();
+  },
+
+  async getSimilarProductSummariesBatch(
+    gtins: string[],
+    limit = 10
+  ): Promise<Record<string, SimilarProductSummary[] | null>> {
+    const url = DB_API_BASE.endsWith('/')
+      ? `${DB_API_BASE}products/similar/batch`
+      : `${DB_API_BASE}/products/similar/batch`;
+    const response = await fetch(url, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ gtins, limit, view: 'summary' }),
+    });
+    if (!response.ok) {
+      throw new Error(`Failed to fetch similar products: ${response.statusText}`);
+    }
+    return response.json();
+  },
+
+  async searchProductSummaries(
+    query: string,
+    limit = 20,
+    mode: SearchMode = 'lexical'
+  ): Promise<ProductSummarySearchResult[]> {
     const url = DB_API_BASE.endsWith('/')
-      ? `${DB_API_BASE}search?q=${encodeURIComponent(query)}&limit=${limit}`
-      : `${DB_API_BASE}/search?q=${encodeURIComponent(query)}&limit=${limit}`;
+      ? `${DB_API_BASE}search?q=${encodeURIComponent(query)}&limit=${limit}&mode=${mode}&view=summary`
+      : `${DB_API_BASE}/search?q=${encodeURIComponent(query)}&limit=${limit}&mode=${mode}&view=summary`;
     const response = await fetch(url);
     if (!response.ok) {
       throw new Error(`Failed to search products: ${response.statusText}`);
@@ -116,6 +257,61 @@ export const statsApi = {
 // Orders API
 import { Order } from '../types/order';
 
+export interface OrderFilters {
+  status?: string;
+  plant?: string;
+  storage_location?: string;
+  product_code?: string;
+  failure?: number;
+  created_from?: string; // YYYY-MM-DD, inclusive
+  created_to?: string; // YYYY-MM-DD, inclusive
+  min_prob_failure?: number;
+  max_prob_failure?: number;
+}
+
+export interface OrdersPage {
+  orders: Order[];
+  nextCursor: string | null;
+}
+
+function orderFilterParams(filters: OrderFilters = {}): URLSearchParams {
+  const params = new URLSearchParams();
+  for (const [key, value] of Object.entries(filters)) {
+    if (value !== undefined && value !== null && value !== '' && value !== 'all') {
+      params.set(key, String(value));
+    }
+  }
+  return params;
+}
+
+export interface DeliveryOption {
+  delivery_dow: string;
+  lead_time: number;
+  coinciding_delivery: string;
+  prob_failure: number;
+}
+
+export interface DeliverySweep {
+  id: string;
+  current: number; // Risk with the order's own delivery_dow, lead_time and coinciding_delivery
+  n: number;
+  options: DeliveryOption[]; // Lowest risk first
+}
+
+export interface OrderStatsGroup {
+  value: string;
+  count: number;
+  failures: number;
+  failure_rate: number;
+  order_qty: number;
+  delivered_qty: number;
+  delivery_rate: number;
+}
+
+export interface OrderStats extends Omit<OrderStatsGroup, 'value'> {
+  by: Record<'status' | 'plant' | 'order_dow' | 'delivery_dow' | 'month' | 'lead_time', OrderStatsGroup[]>;
+}
+
 export const ordersApi = {
   async getOrders(limit = 100, offset = 0, status?: string): Promise<Order[]> {
     const statusParam = status && status !== 'all' ? `&status=${status}` : '';
@@ -129,6 +325,75 @@ export const ordersApi = {
     return response.json();
   },
 
+  // Filtered page; pass the previous page's nextCursor to continue after it
+  async getOrdersPage(
+    filters: OrderFilters = {},
+    limit = 100,
+    cursor?: string | null,
+    sort: 'id' | 'prob_failure' = 'id'
+  ): Promise<OrdersPage> {
+    const params = orderFilterParams(filters);
+    params.set('limit', String(limit));
+    if (sort !== 'id') {
+      params.set('sort', sort);
+    }
+    if (cursor) {
+      params.set('cursor', cursor);
+    }
+    const url = ORDERS_API_BASE.endsWith('/')
+      ? `${ORDERS_API_BASE}orders?${params}`
+      : `${ORDERS_API_BASE}/orders?${params}`;
+    const response = await fetch(url);
+    if (!response.ok) {
+      throw new Error(`Failed to fetch orders: ${response.statusText}`);
+    }
+    return { orders: await response.json(), nextCursor: response.headers.get('X-Next-Cursor') };
+  },
+
+  // Aggregates computed server-side over every matching order
+  async getOrdersStats(filters: OrderFilters = {}): Promise<OrderStats> {
+    const params = orderFilterParams(filters);
+    const query = params.toString() ? `?${params}` : '';
+    const url = ORDERS_API_BASE.endsWith('/')
+      ? `${ORDERS_API_BASE}orders/stats${query}`
+      : `${ORDERS_API_BASE}/orders/stats${query}`;
+    const response = await fetch(url);
+    if (!response.ok) {
+      throw new Error(`Failed to fetch order stats: ${response.statusText}`);
+    }
+    return response.json();
+  },
+
+  // Same contract as statsApi.predict, scored in-process by the Orders API
+  async predict(data: PredictionRequest[]): Promise<PredictionResponse> {
+    const url = ORDERS_API_BASE.endsWith('/')
+      ? `${ORDERS_API_BASE}orders/predict`
+      : `${ORDERS_API_BASE}/orders/predict`;
+    const response = await fetch(url, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify(data),
+    });
+    if (!response.ok) {
+      const error = await response.json().catch(() => ({ detail: response.statusText }));
+      throw new Error(`Prediction failed: ${error.detail || response.statusText}`);
+    }
+    return response.json();
+  },
+
+  async getDeliverySweep(orderId: string): Promise<DeliverySweep> {
+    const url = ORDERS_API_BASE.endsWith('/')
+      ? `${ORDERS_API_BASE}orders/${orderId}/delivery-sweep`
+      : `${ORDERS_API_BASE}/orders/${orderId}/delivery-sweep`;
+    const response = await fetch(url);
+    if (!response.ok) {
+      throw new Error(`Failed to fetch delivery sweep: ${response.statusText}`);
+    }
+    return response.json();
+  },
+
   async getOrder(orderId: string): Promise<Order> {
     const url = ORDERS_API_BASE.endsWith('/')
       ? `${ORDERS_API_BASE}orders/${orderId}`
@@ -140,8 +405,9 @@ export const ordersApi = {
     return response.json();
   },
 
-  async getOrdersCount(status?: string): Promise<{ count: number }> {
-    const statusParam = status && status !== 'all' ? `?status=${status}` : '';
+  async getOrdersCount(status?: string, filters: OrderFilters = {}): Promise<{ count: number }> {
+    const params = orderFilterParams({ ...filters, status: status ?? filters.status });
+    const statusParam = params.toString() ? `?${params}` : '';
     const url = ORDERS_API_BASE.endsWith('/')
       ? `${ORDERS_API_BASE}orders/count${statusParam}`
       : `${ORDERS_API_BASE}/orders/count${statusParam}`;
@@ -18,6 +18,7 @@ export interface Order {
   createdAt: string;
   notes?: string;
   aiSummary?: string;
+  prob_failure?: number | null;
 }
 
 export interface ChatMessage {
@@ -124,4 +124,30 @@ export interface ProductSearchResult {
   gtin: string;
   name: string;
   product_data: Product;
+  similarity?: number; // Semantic matches
+  score?: number; // Rank-fused relevance (mode=hybrid)
+}
+
+export type SearchMode = 'lexical' | 'semantic' | 'hybrid';
+
+// view=summary responses: the list attributes, without product_data
+export interface ProductSummary {
+  gtin: string;
+  name: string;
+  vendor_name: string | null;
+  country_of_origin: string | null;
+  category: string | null;
+  brand: string | null;
+  sales_unit: string | null;
+  base_unit: string | null;
+  net_weight: { unit: string; value: number } | null;
+}
+
+export interface SimilarProductSummary extends ProductSummary {
+  similarity: number;
+}
+
+export interface ProductSummarySearchResult extends ProductSummary {
+  similarity?: number;
+  score?: number;
 }